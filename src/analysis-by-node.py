@@ -1,39 +1,43 @@
+import argparse
+import contextlib
+import json
+import math
 import os
-import shutil
 import sys
 from collections import defaultdict
 from typing import List, Dict
 
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
 import numpy as np
 
+from catalogue import ROUTERS
+from comparison import ExperimentComparison, MetricTable, COMPARED_METRICS, INTEREST_RATE
 from interest_aggregation import InterestAggregation
-from interest_rate import InterestRatesForNode
-from log_reader import LogReader
-from nfd_log_parser import NfdLogParser, CacheRate
+from log_reader import LogError, formatErrorReport
+from nfd_log_parser import NfdLogParser, CacheRate, DEFAULT_BIN_WIDTH, INCOMING_INTEREST_EVENT
+from node_loader import NodeData, loadNodes, defaultJobs, ROUTER_PARTS, GAME_NODE_PARTS, NFD, PACKET_TIMES, STATUS_DELTAS, \
+    INTEREST_RATES, DEAD_RECKONING, LOG_ERRORS
 from packet_time_histograms import PacketTimeHistograms
+from percentiles import SampleHistogram, plotMergedHistograms, formatPercentileTable
+from rate_series import ExperimentRates
+from render_queue import RenderQueue, RecordedFigure, recordSubplots, DEFAULT_FORMATS
+from parse_cache import ParseCache, getCacheDirFor
+from snapshot import ExperimentSnapshot, findSnapshot, SNAPSHOT_EXTENSION
 from status_deltas import StatusDeltasHistograms
-from dead_reckoning_analyzer import DeadReckoningAnalyzer
-
-matplotlib.rcParams['figure.figsize'] = (15.0, 10.0)
-matplotlib.rcParams['axes.labelsize'] = 20
-matplotlib.rcParams['savefig.dpi'] = 100
-matplotlib.rcParams['font.size'] = 16
-matplotlib.rcParams['legend.fontsize'] = 'large'
-matplotlib.rcParams['figure.titlesize'] = 'large'
-matplotlib.rcParams['legend.framealpha'] = 0.5
+
+RC_PARAMS = {
+    'figure.figsize': (15.0, 10.0),
+    'axes.labelsize': 20,
+    'savefig.dpi': 100,
+    'font.size': 16,
+    'legend.fontsize': 'large',
+    'figure.titlesize': 'large',
+    'legend.framealpha': 0.5,
+}
 # matplotlib.rcParams['axes.labelsize'] = 20
+SUMMARY_FORMATS = ["text", "json"]
 
 
 FIGURE_DIR = "figures"
-ROUTERS = {
-    "tree": ["nodeE", "nodeF", "nodeG"],
-    "dumbbell": ["nodeE", "nodeF"],
-    "scalability": ["nodeQ", "nodeR", "nodeS", "nodeT"]
-}
-
 dirsToSkip = ["aws-1", "aws-1-again", "aws-1-again2"]
 nodesToSkip = []
 
@@ -42,6 +46,27 @@ STATUS = "status"
 BLOCKS = "blocks"
 PROJECTILES = "projectiles"
 
+def getPyplot():
+    # Importing pyplot takes longer than a whole numbers-only run, so it only happens once a figure is drawn in this process
+    import matplotlib
+    import matplotlib.pyplot as plt
+    matplotlib.rcParams.update(RC_PARAMS)
+    return plt
+
+
+def toJsonValue(value):
+    # NaN (e.g. a hit rate without lookups) isn't valid JSON
+    if isinstance(value, dict):
+        return {k: toJsonValue(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [toJsonValue(v) for v in value]
+    if isinstance(value, (float, np.floating)):
+        return None if math.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
 def cleanName(name: str):
     if name == "nodeNN":
         return "N"
@@ -52,6 +77,8 @@ def cleanNames(names: List[str]):
     return [cleanName(n) for n in names]
 
 def plotMulticategoryBar(ax, valuesDict: Dict[str, Dict[str, float]]):
+    if len(valuesDict) == 0:
+        return
     xCategories = next(iter(valuesDict.values())).keys()
     ind = np.arange(len(xCategories))
     delWidth = 0.5 / len(valuesDict.keys())
@@ -68,11 +95,23 @@ def plotMulticategoryBar(ax, valuesDict: Dict[str, Dict[str, float]]):
 
 class AnalysisByNode:
 
-    def __init__(self, dataDir, topology: str, mainDir:str, subDirs: List[str], nodes: List[str] = None):
+    def __init__(self, dataDir, topology: str, mainDir:str, subDirs: List[str], nodes: List[str] = None, jobs: int = 1, useCache: bool = True,
+                 snapshots: Dict[str, ExperimentSnapshot] = None, renderQueue: RenderQueue = None, comparison: ExperimentComparison = None,
+                 boundedMemory: bool = False):
         self.dataDir = dataDir
+        self.jobs = jobs
+        self.boundedMemory = boundedMemory
+        self.parseCache = ParseCache(getCacheDirFor(dataDir) if useCache else None)
+        # subDir -> snapshot the subDir's node data is read from instead of its node directories
+        self.snapshots: Dict[str, ExperimentSnapshot] = {} if snapshots is None else snapshots
+        # With a comparison every subDir is loaded once for all the directories analysed, rather than once per directory
+        self.comparison = comparison
+        self.nodeDataBySubDir: Dict[str, Dict[str, NodeData]] = {} if comparison is None else comparison.nodeDataByScenario
         self.mainDir = mainDir
         self.subDirs = subDirs
-        self.nodes = os.listdir(self.getSubDir(self.mainDir)) if nodes is None else nodes
+        if nodes is None:
+            nodes = list(self.snapshots[mainDir].nodes) if mainDir in self.snapshots else os.listdir(self.getSubDir(self.mainDir))
+        self.nodes = nodes
 
         self.nodes.sort()
         for remove in nodesToSkip: self.nodes.remove(remove)
@@ -81,14 +120,23 @@ class AnalysisByNode:
         self.topology = topology
         self.plotDims = (2, 2)
         self.plotDims = (4, 4)
+        # Figures left over from earlier runs are removed by the render queue once it knows what this run drew
         self.figureDir = os.path.join(dataDir, FIGURE_DIR, self.mainDir)
-        if os.path.exists(self.figureDir):
-            shutil.rmtree(self.figureDir)
-        os.makedirs(self.figureDir, exist_ok=True)
+        self.renderQueue = RenderQueue(rcParams=RC_PARAMS) if renderQueue is None else renderQueue
+
+    def subplots(self, *args, **kwargs):
+        # Like plt.subplots, but records the plot into a spec for the render queue instead of drawing it
+        return recordSubplots(*args, **kwargs)
 
     def saveFig(self, fig, plotName: str):
-        # pass
+        if isinstance(fig, RecordedFigure):
+            if self.renderQueue.draw:
+                os.makedirs(self.figureDir, exist_ok=True)
+            self.renderQueue.submit(fig, os.path.join(self.figureDir, plotName))
+            return
+        os.makedirs(self.figureDir, exist_ok=True)
         fig.savefig(os.path.join(self.figureDir, plotName) + ".png", bbox_inches='tight')
+        plt = getPyplot()
         plt.clf()
         plt.close('all')
 
@@ -100,22 +148,43 @@ class AnalysisByNode:
         fullSubDirPath = self.getSubDir(subDir)
         return os.path.join(fullSubDirPath, nodeName)
 
-    def checkForExceptions(self, nodes=None):
+    def loadNodeData(self, subDir: str = None, parts: List[str] = None) -> Dict[str, NodeData]:
+        subDir = self.mainDir if subDir is None else subDir
+        nodeDirs = {node: self.getNodeDir(node, subDir) for node in self.nodes}
+        partsByNode = {node: (ROUTER_PARTS if node in self.routerNodes else GAME_NODE_PARTS) for node in self.nodes}
+        if parts is not None:
+            partsByNode = {node: [p for p in nodeParts if p in parts] for node, nodeParts in partsByNode.items()}
+        self.nodeDataBySubDir[subDir] = loadNodes(nodeDirs, partsByNode, self.jobs, self.nodeDataBySubDir.get(subDir), self.parseCache,
+                                                  self.snapshots.get(subDir), self.boundedMemory)
+        return self.nodeDataBySubDir[subDir]
+
+    def getNodeParts(self, part: str, nodes: List[str], subDir: str = None) -> list:
+        # Everything of the main directory is parsed in one parallel pass the first time any of it is needed
+        nodeData = self.loadNodeData(subDir, None if subDir is None else [part])
+        parsed = [getattr(nodeData[node], part) for node in nodes]
+        return [p for p in parsed if p is not None]
+
+    def checkForExceptions(self, nodes=None, interactive: bool = True) -> List[LogError]:
         nodes = self.gameNodes if nodes is None else nodes
-        for node in nodes:
-            logReader = LogReader(node, self.getNodeDir(node))
+        logReaders = self.getNodeParts(LOG_ERRORS, nodes)
+        if interactive:
+            for logReader in logReaders:
+                logReader.reportErrors()
+        errors = [error for logReader in logReaders for error in logReader.errors]
+        if not interactive:
+            print(formatErrorReport(errors))
+        return errors
 
     def getAxis(self):
-        return plt.subplots(*self.plotDims)
+        return self.subplots(*self.plotDims)
 
     def plotInterestRates(self, nodes=None, objectType=STATUS):
         nodes = self.gameNodes if nodes is None else nodes
-        f, ax = plt.subplots(1)
+        f, ax = self.subplots(1)
         f.suptitle("Interest Rates for %s" % objectType)
         ax.set_xlabel("Node")
         ax.set_ylabel("Interests received per second")
-        for node in nodes:
-            interestRate = InterestRatesForNode(self.getNodeDir(node), node)
+        for interestRate in self.getNodeParts(INTEREST_RATES, nodes):
             interestRate.plotInterestRateForType(ax, objectType)
         self.saveFig(f, "interest-rates-over-time")
 
@@ -123,16 +192,15 @@ class AnalysisByNode:
         nodes = self.gameNodes if nodes is None else nodes
         nodes.sort()
 
-        packetTimeHistograms = [PacketTimeHistograms(self.getNodeDir(node), node) for node in nodes]
+        packetTimeHistograms: List[PacketTimeHistograms] = self.getNodeParts(PACKET_TIMES, nodes)
 
         # self.plotDetailedPacketTimes(packetTimeHistograms, objectType, metricType)
         self.plotAggregatedPacketTimes(packetTimeHistograms)
 
     def plotAggregatedPacketTimes(self, packetTimeHistograms: List[PacketTimeHistograms]):
-        f, ax = plt.subplots()
-        playerHists = [pth.getAllData() for pth in packetTimeHistograms]
-        weights = [100 * np.ones_like(v) / len(v) for v in playerHists]
-        ax.hist(playerHists, label=cleanNames([pth.nodeName for pth in packetTimeHistograms]), bins=np.linspace(0, 200, 11), weights=weights)
+        f, ax = self.subplots()
+        playerHists = [pth.getSampleHistogram() for pth in packetTimeHistograms]
+        plotMergedHistograms(ax, playerHists, cleanNames([pth.nodeName for pth in packetTimeHistograms]), np.linspace(0, 200, 11))
         ax.set_xlabel("RTT (ms)")
         ax.set_ylabel("%")
         f.suptitle("RTT of status packets in the scalability test")
@@ -141,12 +209,13 @@ class AnalysisByNode:
         self.saveFig(f, "aggregated-packet-times")
         #
         # allData = [val for sublist in playerHists for val in sublist]
-        # f, ax = plt.subplots()
+        # f, ax = self.subplots()
         # ax.boxplot(allData)
 
 
     def plotDetailedPacketTimes(self, packetTimeHistograms: List[PacketTimeHistograms], objectType=STATUS, metricType="rtt"):
-        f = plt.figure()
+        import matplotlib.gridspec as gridspec
+        f = getPyplot().figure()
         f.suptitle("Round trip times for %s" % objectType)
         gridSpecs = gridspec.GridSpec(nrows=self.plotDims[0], ncols=self.plotDims[1], figure=f)
         ax = [f.add_subplot(gs) for gs in gridSpecs]
@@ -158,17 +227,16 @@ class AnalysisByNode:
 
     def plotStatusDeltas(self, nodes=None):
         nodes = self.gameNodes if nodes is None else nodes
-        statusDeltaHistograms: List[StatusDeltasHistograms] = [StatusDeltasHistograms(n, self.getNodeDir(n)) for n in nodes]
+        statusDeltaHistograms: List[StatusDeltasHistograms] = self.getNodeParts(STATUS_DELTAS, nodes)
 
         # self.plotStatusDeltaDetailedHistograms(nodes, statusDeltaHistograms)
         self.plotAggregatedStatusDeltas(nodes, statusDeltaHistograms)
 
     def plotAggregatedStatusDeltas(self, nodes: List[str], sdHistograms: List[StatusDeltasHistograms]):
-        sdHists = [sdHist.getAllData() for sdHist in sdHistograms]
-        weights = [100 * np.ones_like(v) / len(v) for v in sdHists]
+        sdHists = [sdHist.getSampleHistogram() for sdHist in sdHistograms]
 
-        f, ax = plt.subplots()
-        ax.hist(sdHists, label=cleanNames([sdh.nodeName for sdh in sdHistograms]), weights=weights, bins=np.linspace(0,2,11))
+        f, ax = self.subplots()
+        plotMergedHistograms(ax, sdHists, cleanNames([sdh.nodeName for sdh in sdHistograms]), np.linspace(0,2,11))
         ax.set_xlabel("Position Delta (GWU)")
         ax.set_ylabel("%")
         f.suptitle("Position Deltas of status packets in the scalability test")
@@ -176,12 +244,29 @@ class AnalysisByNode:
 
         self.saveFig(f, "aggregated-position-deltas")
 
+    def getPercentileHistograms(self, part: str, nodes: List[str] = None, subDir: str = None) -> Dict[str, SampleHistogram]:
+        nodes = self.gameNodes if nodes is None else nodes
+        return {parsed.nodeName: parsed.getSampleHistogram() for parsed in self.getNodeParts(part, nodes, subDir)}
+
+    def printPercentiles(self, nodes: List[str] = None):
+        # Per node and merged percentiles of this experiment, then the merged ones of every experiment side by side.
+        # Experiments are compared by merging each node's value counts, never by concatenating their samples.
+        for part, title, unit in [(PACKET_TIMES, "RTT of status packets", "ms"), (STATUS_DELTAS, "Position deltas of status packets", "GWU")]:
+            byNode = self.getPercentileHistograms(part, nodes)
+            rows = {cleanName(node): histogram for node, histogram in byNode.items()}
+            rows["all"] = SampleHistogram.merge(byNode.values())
+            print(formatPercentileTable("%s in %s" % (title, self.mainDir), rows, unit))
+
+            byDir = {self.mainDir: rows["all"]}
+            for subDir in self.subDirs:
+                byDir[subDir] = SampleHistogram.merge(self.getPercentileHistograms(part, nodes, subDir).values())
+            print(formatPercentileTable("%s by experiment" % title, byDir, unit) + "\n")
+
     def plotStatusDeltaDetailedHistograms(self, nodes, statusDeltaHistograms: List[StatusDeltasHistograms]):
         f, ax = self.getAxis()
         ax = ax.flatten()
         for i, sdh in enumerate(statusDeltaHistograms):
             sdh.plotStatusDeltas(ax[i])
-        plt.show()
         self.saveFig(f, "status-deltas")
 
     def compareProducerRates(self, objectType=STATUS):
@@ -192,15 +277,16 @@ class AnalysisByNode:
         allDirs: List[str] = [self.mainDir] + self.subDirs
         for subDir in allDirs:
             ratesByNode: RatesByNode = {}
-            for node in self.gameNodes:
-                nodeDir = self.getNodeDir(node, subDir)
-                interestRateForNode = InterestRatesForNode(nodeDir, node)
-                rate = interestRateForNode.getInterestRateForType(objectType).finalMeanRate
-                ratesByNode[node] = rate
+            if self.comparison is not None:
+                ratesByNode = self.comparison.getTable(objectType).getValuesByNode(INTEREST_RATE, subDir, self.gameNodes)
+            else:
+                for interestRateForNode in self.getNodeParts(INTEREST_RATES, self.gameNodes, None if subDir == self.mainDir else subDir):
+                    ratesByNode[interestRateForNode.nodeName] = interestRateForNode.getInterestRateForType(objectType).finalMeanRate
+            for node, rate in ratesByNode.items():
                 print("Interest Rates: %s %s: %d" % (subDir, node, rate))
             ratesByDir[subDir] = ratesByNode
 
-        f, ax = plt.subplots()
+        f, ax = self.subplots()
         ratesByDir = {k: {cleanName(p): val for p, val in v.items()} for k, v in ratesByDir.items()}
         plotMulticategoryBar(ax, ratesByDir)
         ax.set_ylabel("Interests Received per Second")
@@ -210,21 +296,33 @@ class AnalysisByNode:
         self.saveFig(f, "interest-rate-impacts")
 
     def plotInterestRatesOverTime(self, objectType=STATUS):
-        f, ax = plt.subplots()
+        # Aligned to the experiment's first report and taken from count deltas, so bursts and late starters show
+        interestRates = self.getNodeParts(INTEREST_RATES, self.gameNodes)
+        rates = ExperimentRates.fromRates(self.mainDir, [(r.nodeName, r.getInterestRateForType(objectType)) for r in interestRates])
+        f, ax = self.subplots()
         f.suptitle("Interest rates over time for %s" % objectType)
-        for node in self.gameNodes:
-            InterestRatesForNode(self.getNodeDir(node), node).plotInterestRateOverTime(ax)
+        rates.plot(ax)
         ax.legend()
         ax.set_xlabel("Elapsed Time (s)")
         ax.set_ylabel("Interests received per second")
         self.saveFig(f, "interest-rates-over-time")
 
+    def getInterestAggregations(self, objectType=STATUS) -> Dict[str, tuple]:
+        # node -> (interests seen by it as a publisher, interests its subscribers expressed)
+        aggregations = {}
+        nodeData = self.loadNodeData()
+        for node in self.gameNodes:
+            subInterestsCounterByNode = {sub: nodeData[sub].interestsCounters.get(objectType, {}).get(node, 0)
+                                         for sub in self.gameNodes if sub != node and nodeData[sub].interestsCounters is not None}
+            interestAgg = InterestAggregation(node, self.getNodeDir(node), self.nodes, self.getSubDir(), self.routerNodes, objectType,
+                                              nodeData[node].interestRates, subInterestsCounterByNode)
+            aggregations[node] = interestAgg.getDifference()
+        return aggregations
+
     def plotInterestAggregations(self, objectType=STATUS):
-        f, ax = plt.subplots()
+        f, ax = self.subplots()
         interests: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
-        for node in self.gameNodes:
-            interestAgg = InterestAggregation(node, self.getNodeDir(node), self.nodes, self.getSubDir(), self.routerNodes, objectType)
-            pubInterests, subInterests = interestAgg.getDifference()
+        for node, (pubInterests, subInterests) in self.getInterestAggregations(objectType).items():
             interests["Interests Seen"][cleanName(node)] = pubInterests
             interests["Interests Expressed"][cleanName(node)] = subInterests
             print("Node %s: IAF = %.2d" % (node, 100 * pubInterests / subInterests))
@@ -235,16 +333,17 @@ class AnalysisByNode:
         self.saveFig(f, "interest-aggregations")
 
     def analyseCaches(self, objectType=STATUS):
-        nfdParsers = [NfdLogParser(node, self.getNodeDir(node)) for node in self.nodes]
+        nfdParsers: List[NfdLogParser] = self.getNodeParts(NFD, self.nodes)
         nfdParsers.sort(key=lambda nfdP: nfdP.nodeName)
         self.getRouterCacheRates(nfdParsers, objectType=objectType)
         self.getTotalCacheRateByNode(nfdParsers)
+        self.plotRouterCacheRatesOverTime(nfdParsers, objectType=objectType)
 
     def getTotalCacheRateByNode(self, nfdParsers):
         # if self.topology in ROUTERS.keys():
         #     routers = ROUTERS[self.topology]
         #     nfdParsers = [n for n in nfdParsers if n.nodeName in routers]
-        f, ax = plt.subplots()
+        f, ax = self.subplots()
         f.suptitle("Total cache hit rate by node")
         ax.set_ylabel("Hit Rate %")
         for nfdParser in nfdParsers:
@@ -253,20 +352,96 @@ class AnalysisByNode:
 
     def getRouterCacheRates(self, nfdParsers: List[NfdLogParser], objectType=STATUS):
         nfdParsers = nfdParsers if len(self.routerNodes) == 0 else  [nfdP for nfdP in nfdParsers if nfdP.nodeName in self.routerNodes]
-        f, ax = plt.subplots()
         routerCacheRateForNodes: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
         for i, routerNodeParser in enumerate(nfdParsers):
             statusCacheRatesByPlayer: Dict[str, CacheRate] = routerNodeParser.getCacheRatesForObjectType(objectType=objectType)
             for player, cacheRate in statusCacheRatesByPlayer.items():
                 routerCacheRateForNodes[player][routerNodeParser.nodeName] = cacheRate.getCacheRate()
+        # No nfd.logs, or no ContentStore lines in them, leave nothing to plot
+        if len(routerCacheRateForNodes) == 0:
+            return
+        f, ax = self.subplots()
         plotMulticategoryBar(ax, routerCacheRateForNodes)
         ax.set_ylabel("Cache Rate %")
         f.suptitle("Router Cache Rates by Node")
         self.saveFig(f, "router-cache-rates")
 
+    def plotRouterCacheRatesOverTime(self, nfdParsers: List[NfdLogParser], objectType=STATUS, binWidth: float = DEFAULT_BIN_WIDTH):
+        nfdParsers = nfdParsers if len(self.routerNodes) == 0 else [nfdP for nfdP in nfdParsers if nfdP.nodeName in self.routerNodes]
+        timeRanges = [nfdP.events.getTimeRange() for nfdP in nfdParsers if len(nfdP.events) > 0]
+        if len(timeRanges) == 0:
+            return
+        # Every router is binned from the same start so their warm up and any collapse line up
+        start = np.floor(min(first for first, _ in timeRanges))
+        end = max(last for _, last in timeRanges)
+        f, ax = self.subplots()
+        for nfdParser in nfdParsers:
+            nfdParser.plotCacheRateOverTime(ax, start, binWidth, end, objectType)
+        ax.set_xlabel("Elapsed Time (s)")
+        ax.set_ylabel("Hit Rate %")
+        ax.legend()
+        f.suptitle("Cache hit rate of %s over time (%gs bins)" % (objectType, binWidth))
+        self.saveFig(f, "cache-rates-over-time")
+
+    def getForwardingParsers(self) -> List[NfdLogParser]:
+        # Routers (every node when there are none) whose NFD logged its Forwarder at DEBUG
+        nfdParsers = self.getNodeParts(NFD, self.nodes if len(self.routerNodes) == 0 else self.routerNodes)
+        return sorted([nfdP for nfdP in nfdParsers if len(nfdP.forwarding) > 0], key=lambda nfdP: nfdP.nodeName)
+
+    def analyseForwarding(self, objectType=STATUS, binWidth: float = DEFAULT_BIN_WIDTH):
+        nfdParsers = self.getForwardingParsers()
+        if len(nfdParsers) == 0:
+            return
+        self.plotForwardingAggregation(nfdParsers, objectType)
+        self.plotPitOccupancyOverTime(nfdParsers, binWidth)
+        for nfdParser in nfdParsers:
+            self.plotInterestRatesByFace(nfdParser, objectType, binWidth)
+
+    def plotForwardingAggregation(self, nfdParsers: List[NfdLogParser], objectType=STATUS):
+        f, ax = self.subplots()
+        interests: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for nfdParser in nfdParsers:
+            counts = nfdParser.forwarding.getCounts(objectType=objectType)
+            interests["Interests Received"][cleanName(nfdParser.nodeName)] = counts.incoming - counts.loops
+            interests["Interests Aggregated"][cleanName(nfdParser.nodeName)] = counts.aggregated
+            interests["Interests Forwarded"][cleanName(nfdParser.nodeName)] = counts.forwarded
+            print("Router %s: %d %s interests received, %d aggregated (%.1f%%), %d forwarded, aggregation factor %.2f, peak PIT size %d"
+                  % (nfdParser.nodeName, counts.incoming - counts.loops, objectType, counts.aggregated, counts.getAggregatedPercentage(),
+                     counts.forwarded, counts.getAggregationFactor(), nfdParser.forwarding.getPeakPitOccupancy()))
+        plotMulticategoryBar(ax, interests)
+        ax.set_ylabel("Number of Interests")
+        ax.set_xlabel("Router")
+        f.suptitle("Interests received, aggregated in the PIT and forwarded by each router")
+        self.saveFig(f, "forwarding-aggregation")
+
+    def plotPitOccupancyOverTime(self, nfdParsers: List[NfdLogParser], binWidth: float = DEFAULT_BIN_WIDTH):
+        timeRanges = [nfdP.forwarding.getTimeRange() for nfdP in nfdParsers]
+        start = np.floor(min(first for first, _ in timeRanges))
+        end = max(last for _, last in timeRanges)
+        f, ax = self.subplots()
+        for nfdParser in nfdParsers:
+            occupancy = nfdParser.forwarding.getPitOccupancy(binWidth, start, end)
+            ax.plot(occupancy.getTimes() - start, occupancy.values, label=nfdParser.nodeName)
+        ax.set_xlabel("Elapsed Time (s)")
+        ax.set_ylabel("Pending PIT entries")
+        ax.legend()
+        f.suptitle("PIT occupancy over time (end of %gs bins)" % binWidth)
+        self.saveFig(f, "pit-occupancy-over-time")
+
+    def plotInterestRatesByFace(self, nfdParser: NfdLogParser, objectType=STATUS, binWidth: float = DEFAULT_BIN_WIDTH):
+        start, _ = nfdParser.forwarding.getBinRange()
+        f, ax = self.subplots()
+        for face, rates in nfdParser.forwarding.getRatesByFace(INCOMING_INTEREST_EVENT, binWidth, objectType=objectType).items():
+            ax.plot(rates.getTimes() - start, rates.values, label="face %d" % face)
+        ax.set_xlabel("Elapsed Time (s)")
+        ax.set_ylabel("Interests received per second")
+        ax.legend()
+        f.suptitle("%s interests received by %s per face" % (objectType, nfdParser.nodeName))
+        self.saveFig(f, "interest-rates-by-face-%s" % nfdParser.nodeName)
+
     def plotDeadReckoningStack(self, nodes: List[str] = None):
         nodes = self.gameNodes if nodes is None else nodes
-        drAnalyzers = [DeadReckoningAnalyzer(n, self.getNodeDir(n)) for n in nodes]
+        drAnalyzers = self.getNodeParts(DEAD_RECKONING, nodes)
         byType: Dict[str, Dict[str, float]] = defaultdict(lambda : defaultdict(float))
 
 
@@ -286,7 +461,7 @@ class AnalysisByNode:
         if len(velocity) == 0:
             return
 
-        f, ax = plt.subplots()
+        f, ax = self.subplots()
         bottom = np.zeros(N)
 
         ax.bar(keys, velocity, bottom=bottom)
@@ -309,34 +484,193 @@ class AnalysisByNode:
         self.saveFig(f, "dr-pub-throt")
 
 
-def runAnalysisByNode(dataDir: str, topology: str, mainDir: str, subDirs: List[str]):
-    analysisByNode = AnalysisByNode(dataDir, topology, mainDir, subDirs)
-    analysisByNode.checkForExceptions()
+    def getSummary(self, objectType=STATUS) -> dict:
+        # The numbers behind the figures of this directory, computed without plotting anything
+        summary = {"mainDir": self.mainDir, "topology": self.topology, "objectType": objectType,
+                   "gameNodes": self.gameNodes, "routerNodes": self.routerNodes}
+        errors = [e for logReader in self.getNodeParts(LOG_ERRORS, self.gameNodes) for e in logReader.errors]
+        summary["exceptions"] = [{"node": e.node, "line": e.lineNumber, "pattern": e.pattern} for e in errors]
+
+        summary["interestRates"] = {}
+        for interestRates in self.getNodeParts(INTEREST_RATES, self.gameNodes):
+            rate = interestRates.getInterestRateForType(objectType)
+            summary["interestRates"][interestRates.nodeName] = {"finalMeanRate": rate.finalMeanRate, "totalInterestsSeen": rate.totalInterestsSeen}
+        summary["interestAggregation"] = {node: {"interestsSeen": seen, "interestsExpressed": expressed}
+                                          for node, (seen, expressed) in self.getInterestAggregations(objectType).items()}
+
+        summary["cacheRates"] = {}
+        for nfdParser in self.getNodeParts(NFD, self.nodes):
+            byObjectType = nfdParser.getCacheRatesForObjectType(objectType).values()
+            lookups, hits = sum(r.lookups for r in byObjectType), sum(r.hits for r in byObjectType)
+            summary["cacheRates"][nfdParser.nodeName] = {
+                "lookups": nfdParser.totalLookups, "hits": nfdParser.totalHits,
+                "hitRate": 100 * nfdParser.totalHits / nfdParser.totalLookups if nfdParser.totalLookups > 0 else math.nan,
+                objectType: {"lookups": lookups, "hits": hits, "hitRate": 100 * hits / lookups if lookups > 0 else math.nan}}
+
+        for part, key in [(PACKET_TIMES, "rtt"), (STATUS_DELTAS, "positionDeltas")]:
+            byNode = self.getPercentileHistograms(part)
+            summary[key] = {node: histogram.getSummary() for node, histogram in byNode.items()}
+            summary[key]["all"] = SampleHistogram.merge(byNode.values()).getSummary()
+
+        summary["deadReckoning"] = {analyzer.node: analyzer.getPercentages() for analyzer in self.getNodeParts(DEAD_RECKONING, self.gameNodes)}
+
+        forwardingParsers = self.getForwardingParsers()
+        if len(forwardingParsers) > 0:
+            summary["forwarding"] = {nfdP.nodeName: dict(nfdP.forwarding.getCounts(objectType=objectType).toDict(),
+                                                         peakPitOccupancy=nfdP.forwarding.getPeakPitOccupancy(),
+                                                         interestsByFace=nfdP.forwarding.getCountsByFace(objectType=objectType))
+                                     for nfdP in forwardingParsers}
+        return toJsonValue(summary)
+
+
+def openSnapshots(dataDir: str, subDirs: List[str]) -> Dict[str, ExperimentSnapshot]:
+    snapshots = {}
+    for subDir in subDirs:
+        snapshotFile = findSnapshot(dataDir, subDir)
+        if snapshotFile is not None:
+            snapshots[subDir] = ExperimentSnapshot(snapshotFile)
+    return snapshots
+
+
+def listSubDirs(dataDir: str, withSnapshots: bool = False) -> List[str]:
+    subDirs = []
+    for entry in sorted(os.listdir(dataDir)):
+        # Only scenario directories, and with --snapshots the scenarios exported next to them; any other file is skipped
+        if withSnapshots and entry.endswith(SNAPSHOT_EXTENSION):
+            entry = entry[:-len(SNAPSHOT_EXTENSION)]
+        elif not os.path.isdir(os.path.join(dataDir, entry)):
+            continue
+        if entry not in subDirs and entry not in dirsToSkip:
+            subDirs.append(entry)
+    return subDirs
+
+
+def plotComparison(dataDir: str, comparison: ExperimentComparison, renderQueue: RenderQueue, objectType=STATUS,
+                   metrics: List[str] = COMPARED_METRICS):
+    # Every scenario against every other, from the one table all scenarios were reduced to
+    table: MetricTable = comparison.getTable(objectType)
+    print(comparison.formatReport(objectType, metrics))
+    figureDir = os.path.join(dataDir, FIGURE_DIR, "comparison")
+    if renderQueue.draw:
+        os.makedirs(figureDir, exist_ok=True)
+    labels = table.scenarios
+    for metric in metrics:
+        byScenario = {scenario: table.getValuesByNode(metric, scenario) for scenario in table.scenarios}
+        nodes = sorted({node for values in byScenario.values() for node in values})
+        if len(nodes) == 0:
+            continue
+        f, (barAx, changeAx) = recordSubplots(1, 2, gridspec_kw={"width_ratios": [2, 1]})
+        plotMulticategoryBar(barAx, {scenario: {cleanName(node): values.get(node, 0) for node in nodes} for scenario, values in byScenario.items()})
+        barAx.set_xlabel("Node")
+        barAx.set_ylabel(metric)
+
+        changes = table.getPairwiseChanges(metric)
+        changeAx.imshow(np.nan_to_num(changes), cmap="RdBu_r", vmin=-100, vmax=100)
+        for (i, j), change in np.ndenumerate(changes):
+            changeAx.text(j, i, "-" if np.isnan(change) else "%+.0f%%" % change, ha="center", va="center", fontsize=10)
+        changeAx.set_xticks(np.arange(len(labels)))
+        changeAx.set_xticklabels(labels, rotation=45, ha="right")
+        changeAx.set_yticks(np.arange(len(labels)))
+        changeAx.set_yticklabels(labels)
+        changeAx.set_title("% change from row to column")
+        f.suptitle("%s of %s by scenario" % (metric, objectType))
+        renderQueue.submit(f, os.path.join(figureDir, metric))
+
+
+def runAnalysisByNode(dataDir: str, topology: str, mainDir: str, subDirs: List[str], jobs: int = 1, useCache: bool = True,
+                      interactive: bool = True, snapshots: Dict[str, ExperimentSnapshot] = None, renderQueue: RenderQueue = None,
+                      comparison: ExperimentComparison = None, boundedMemory: bool = False):
+    analysisByNode = AnalysisByNode(dataDir, topology, mainDir, subDirs, jobs=jobs, useCache=useCache, snapshots=snapshots,
+                                    renderQueue=renderQueue, comparison=comparison, boundedMemory=boundedMemory)
+    analysisByNode.checkForExceptions(interactive=interactive)
     objectType = STATUS
     analysisByNode.plotInterestRates(objectType=objectType)
     analysisByNode.plotStatusDeltas()
     analysisByNode.plotPacketTimes(objectType=objectType)
+    analysisByNode.printPercentiles()
     analysisByNode.compareProducerRates(objectType=objectType)
     analysisByNode.plotInterestRatesOverTime(objectType=objectType)
     analysisByNode.plotInterestAggregations(objectType=objectType)
     analysisByNode.analyseCaches(objectType=objectType)
+    analysisByNode.analyseForwarding(objectType=objectType)
     analysisByNode.plotDeadReckoningStack()
+    if renderQueue is None:
+        analysisByNode.renderQueue.flush()
     # plt.show()
 
 
 if __name__ == "__main__":
-    dataDir = sys.argv[1]
-    topology = sys.argv[2]
-    if len(sys.argv) > 3:
-        subDirs = sys.argv[3:]
-    else:
-        subDirs = os.listdir(dataDir)
-        subDirs = [sd for sd in subDirs if sd not in dirsToSkip]
-    if FIGURE_DIR in subDirs:
-        subDirs.remove(FIGURE_DIR)
-    for mainDir in subDirs:
-        otherDirs = [otherDir for otherDir in subDirs if otherDir != mainDir]
-        print("\n\nMain dir: %s, otherDirs: %s\n" % (mainDir, otherDirs))
-        runAnalysisByNode(dataDir, topology, mainDir, otherDirs)
-
-
+    parser = argparse.ArgumentParser()
+    parser.add_argument("dataDir")
+    parser.add_argument("topology")
+    parser.add_argument("subDirs", nargs="*")
+    parser.add_argument("--jobs", "-j", type=int, default=defaultJobs(), help="Number of processes used to parse node directories")
+    parser.add_argument("--no-cache", dest="useCache", action="store_false", help="Don't read or write the on-disk parse cache")
+    parser.add_argument("--non-interactive", dest="interactive", action="store_false",
+                        help="Print one report of the exceptions found in java logs instead of pausing at each")
+    parser.add_argument("--follow", action="store_true",
+                        help="Tail the logs and metric CSVs of a running experiment and print a summary every --refresh seconds")
+    parser.add_argument("--refresh", type=float, help="Seconds between --follow summaries (default: live_monitor.DEFAULT_REFRESH)")
+    parser.add_argument("--formats", nargs="+", default=DEFAULT_FORMATS, choices=["png", "svg", "pdf"],
+                        help="Files written for every figure")
+    parser.add_argument("--rerender", dest="skipUnchanged", action="store_false",
+                        help="Redraw every figure, even those whose data and styling haven't changed since they were last written")
+    parser.add_argument("--no-plots", dest="plots", action="store_false",
+                        help="Print the analysis' numbers without drawing any figures (matplotlib is never imported)")
+    parser.add_argument("--summary", choices=SUMMARY_FORMATS, default="text",
+                        help="json: skip the usual printouts and figures and print one JSON summary of every directory")
+    parser.add_argument("--snapshots", action="store_true",
+                        help="Read each subDir from <dataDir>/<subDir>%s when it exists (see snapshot.py export)" % SNAPSHOT_EXTENSION)
+    parser.add_argument("--bounded-memory", dest="boundedMemory", action="store_true",
+                        help="Keep only per second counts of each nfd.log's events rather than every event, so memory stays flat as the logs grow")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print the wall time, MB read, files opened and rows of every stage and node to stderr at the end")
+    parser.add_argument("--trace", metavar="FILE", help="Write the stages as a Chrome trace (chrome://tracing, ui.perfetto.dev)")
+    parser.add_argument("--pstats", metavar="FILE", help="Run under cProfile and dump its stats to FILE")
+    args = parser.parse_args()
+
+    profiling = contextlib.nullcontext()
+    if args.profile or args.trace is not None or args.pstats is not None:
+        # Only imported, and anything wrapped, when asked for
+        from instrumentation import instrumented
+        profiling = instrumented(AnalysisByNode, args.profile, args.trace, args.pstats)
+    with profiling:
+        dataDir = args.dataDir
+        topology = args.topology
+        if len(args.subDirs) > 0:
+            subDirs = args.subDirs
+        else:
+            subDirs = listSubDirs(dataDir, args.snapshots)
+        if FIGURE_DIR in subDirs:
+            subDirs.remove(FIGURE_DIR)
+        if args.follow:
+            # Only --follow needs asyncio and inotify
+            from live_monitor import followExperiments, DEFAULT_REFRESH
+            followExperiments([os.path.join(dataDir, subDir) for subDir in subDirs], DEFAULT_REFRESH if args.refresh is None else args.refresh)
+            exit(0)
+        snapshots = openSnapshots(dataDir, subDirs) if args.snapshots else None
+        # Each subDir is loaded exactly once and shared by the analysis of every directory
+        comparison = ExperimentComparison(dataDir, subDirs, ROUTERS.get(topology), args.jobs,
+                                          ParseCache(getCacheDirFor(dataDir) if args.useCache else None), snapshots, args.boundedMemory)
+        if args.summary == "json":
+            summaries = {}
+            # Anything the parsers print goes to stderr so stdout is only the JSON
+            with contextlib.redirect_stdout(sys.stderr):
+                for mainDir in subDirs:
+                    analysisByNode = AnalysisByNode(dataDir, topology, mainDir, [d for d in subDirs if d != mainDir], jobs=args.jobs,
+                                                    useCache=args.useCache, snapshots=snapshots, comparison=comparison,
+                                                    boundedMemory=args.boundedMemory)
+                    summaries[mainDir] = analysisByNode.getSummary()
+            print(json.dumps(summaries, indent=2))
+            exit(0)
+        # One queue for every directory so figures of one are drawn while the next is analysed
+        renderQueue = RenderQueue(args.jobs if args.plots else 1, args.formats, RC_PARAMS, args.skipUnchanged, draw=args.plots)
+        for mainDir in subDirs:
+            otherDirs = [otherDir for otherDir in subDirs if otherDir != mainDir]
+            print("\n\nMain dir: %s, otherDirs: %s\n" % (mainDir, otherDirs))
+            runAnalysisByNode(dataDir, topology, mainDir, otherDirs, args.jobs, args.useCache, args.interactive, snapshots, renderQueue,
+                              comparison, args.boundedMemory)
+        if len(subDirs) > 1:
+            print("\n")
+            plotComparison(dataDir, comparison, renderQueue)
+        renderQueue.close()
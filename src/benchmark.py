@@ -0,0 +1,261 @@
+import argparse
+import contextlib
+import importlib
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Callable, Dict, Tuple
+
+from histogram_store import HISTOGRAM_VALUES_FILE
+from interest_rate import InterestRatesForNode, fileNameFormat as INTEREST_RATE_FILE_FORMAT, objectTypes
+from log_reader import LogReader, LOG_FILE
+from metric_csv import readMetricCsv, readLastMetricRow, COUNTER
+from nfd_log_parser import NfdLogParser, NFD_LOG_FILE
+from packet_time_histograms import PacketTimeHistograms
+from render_queue import RenderQueue
+from synthetic_data import generateExperiment, getTreeBytes
+
+COUNTER_FILE = "counter-{}.csv"
+PROC_STATUS = "/proc/self/status"
+PROC_CLEAR_REFS = "/proc/self/clear_refs"
+SYNTHETIC_TOPOLOGY = "synthetic"
+SYNTHETIC_EXPERIMENT = "synthetic"
+# Peak RSS the bounded memory pipeline may gain between the smallest and largest nfd.logs of the memory check:
+# a few read blocks, pages of the binned counts and allocator noise
+DEFAULT_MEMORY_TOLERANCE_MB = 16.0
+# Peak RSS it may gain for every node added, as it keeps each node's binned series
+DEFAULT_NODE_TOLERANCE_MB = 0.5
+# Node counts and nfd.log sizes of the memory check's quick run, small enough to run as a test in a few seconds
+QUICK_MEMORY_NODES = [2, 8]
+QUICK_MEMORY_NFD_MB = [0.5, 2.0]
+
+# name -> (parse one node, the files of a node it reads)
+PARSERS: Dict[str, Tuple[Callable, Callable]] = {
+    "NfdLogParser": (lambda node, nodeDir: NfdLogParser(node, nodeDir), lambda node: [NFD_LOG_FILE]),
+    "NfdLogParserBounded": (lambda node, nodeDir: NfdLogParser(node, nodeDir, boundedMemory=True), lambda node: [NFD_LOG_FILE]),
+    "PacketTimeHistograms": (lambda node, nodeDir: PacketTimeHistograms(nodeDir, node), lambda node: [HISTOGRAM_VALUES_FILE]),
+    "InterestRatesForNode": (lambda node, nodeDir: InterestRatesForNode(nodeDir, node),
+                             lambda node: [INTEREST_RATE_FILE_FORMAT.format(nodeName=node, objectType=o) for o in objectTypes]),
+    "LogReader": (lambda node, nodeDir: LogReader(node, nodeDir, interactive=False), lambda node: [LOG_FILE]),
+}
+
+
+def timeIt(fn: Callable, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def writeCounterFiles(directory: str, numFiles: int, numRows: int) -> List[str]:
+    rows = "".join("%d,%d\n" % (1554848324 + 10 * i, 17 * i) for i in range(numRows))
+    fileNames = []
+    for i in range(numFiles):
+        fileName = os.path.join(directory, COUNTER_FILE.format(i))
+        with open(fileName, "w") as f:
+            f.write(COUNTER.header + "\n" + rows)
+        fileNames.append(fileName)
+    return fileNames
+
+
+def benchmarkTailReads(fileCounts: List[int], numRows: int):
+    print("%8s %8s %12s %12s %8s" % ("files", "rows", "full (s)", "tail (s)", "speedup"))
+    for numFiles in fileCounts:
+        directory = tempfile.mkdtemp(prefix="ndn-bench-")
+        try:
+            fileNames = writeCounterFiles(directory, numFiles, numRows)
+            full = timeIt(lambda: [readMetricCsv(f, COUNTER)[-1] for f in fileNames])
+            tail = timeIt(lambda: [readLastMetricRow(f, COUNTER) for f in fileNames])
+            print("%8d %8d %12.3f %12.3f %7.1fx" % (numFiles, numRows, full, tail, full / tail))
+        finally:
+            shutil.rmtree(directory)
+
+
+def resetPeakRss():
+    # A spawned worker's ru_maxrss starts at whatever its parent had reached, carried over the fork and exec.
+    # Writing 5 to clear_refs restarts the peak (VmHWM) from the current RSS; Linux only.
+    try:
+        with open(PROC_CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def getPeakRss() -> (float, float):
+    # MB, of this process and of the largest of its finished children (ru_maxrss is in KB on Linux)
+    try:
+        with open(PROC_STATUS) as f:
+            peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+    except (OSError, StopIteration):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+
+
+def parseNodesTask(parserName: str, experimentDir: str) -> (float, float, float):
+    parse, _ = PARSERS[parserName]
+    nodes = sorted(os.listdir(experimentDir))
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        elapsed = timeIt(lambda: [parse(node, os.path.join(experimentDir, node)) for node in nodes])
+    return (elapsed, *getPeakRss())
+
+
+def runPipelineTask(dataDir: str, experiment: str, jobs: int, plots: bool, boundedMemory: bool = False) -> (float, float, float):
+    analysisByNode = importlib.import_module("analysis-by-node")
+    renderQueue = RenderQueue(jobs if plots else 1, rcParams=analysisByNode.RC_PARAMS, skipUnchanged=False, draw=plots)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        start = time.perf_counter()
+        analysisByNode.runAnalysisByNode(dataDir, SYNTHETIC_TOPOLOGY, experiment, [], jobs, useCache=False, interactive=False,
+                                         renderQueue=renderQueue, boundedMemory=boundedMemory)
+        renderQueue.close()
+        elapsed = time.perf_counter() - start
+    return (elapsed, *getPeakRss())
+
+
+def idleTask() -> (float, float, float):
+    return (0.0, *getPeakRss())
+
+
+def measuredTask(fn: Callable, *args) -> (float, float, float):
+    resetPeakRss()
+    return fn(*args)
+
+
+def runMeasured(fn: Callable, *args) -> (float, float, float):
+    # Every measurement gets a fresh interpreter so peak RSS is its own and not whatever an earlier run left behind
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(measuredTask, fn, *args).result()
+
+
+def getSourceBytes(experimentDir: str, sourceFiles: Callable) -> int:
+    total = 0
+    for node in os.listdir(experimentDir):
+        for fileName in sourceFiles(node):
+            fullFile = os.path.join(experimentDir, node, fileName)
+            total += os.path.getsize(fullFile) if os.path.exists(fullFile) else 0
+    return total
+
+
+@contextlib.contextmanager
+def syntheticExperiment(numNodes: int, nfdLogMb: float, seed: int = 0, keepDir: str = None, forwarding: bool = False):
+    # Yields (dataDir, experimentDir), generated into a temporary directory unless one to keep is given
+    dataDir = tempfile.mkdtemp(prefix="ndn-bench-") if keepDir is None else \
+        os.path.join(keepDir, "%d-nodes-%gmb%s" % (numNodes, nfdLogMb, "-forwarding" if forwarding else ""))
+    experimentDir = os.path.join(dataDir, SYNTHETIC_EXPERIMENT)
+    try:
+        if not os.path.isdir(experimentDir):
+            start = time.perf_counter()
+            generateExperiment(experimentDir, numNodes, int(nfdLogMb * 1e6), seed=seed, forwarding=forwarding)
+            print("Generated %d nodes x %g MB nfd.log: %.1f MB in %.1fs" % (numNodes, nfdLogMb, getTreeBytes(experimentDir) / 1e6,
+                                                                           time.perf_counter() - start))
+        yield dataDir, experimentDir
+    finally:
+        if keepDir is None:
+            shutil.rmtree(dataDir)
+
+
+RESULT_FORMAT = "%-22s %6s %8s %9s %10s %10s %9s %12s"
+RESULT_HEADER = RESULT_FORMAT % ("benchmark", "nodes", "nfd MB", "time (s)", "MB/s", "nodes/s", "peak MB", "children MB")
+
+
+def printResult(name: str, numNodes: int, nfdLogMb: float, sourceBytes: int, measurement: Tuple[float, float, float]):
+    elapsed, peakRss, childrenRss = measurement
+    print(RESULT_FORMAT % (name, numNodes, "%g" % nfdLogMb, "%.3f" % elapsed, "%.1f" % (sourceBytes / 1e6 / elapsed) if elapsed > 0 else "-",
+                           "%.1f" % (numNodes / elapsed) if elapsed > 0 else "-", "%.1f" % peakRss, "%.1f" % childrenRss), flush=True)
+
+
+def benchmarkScaling(nodeCounts: List[int], nfdLogSizes: List[float], parsers: List[str], pipeline: bool, jobs: int = 1,
+                     plots: bool = True, keepDir: str = None, forwarding: bool = False, boundedMemory: bool = False):
+    _, baseline, _ = runMeasured(idleTask)
+    print("Peak RSS of an idle worker (imports only): %.1f MB" % baseline)
+    for numNodes in nodeCounts:
+        for nfdLogMb in nfdLogSizes:
+            with syntheticExperiment(numNodes, nfdLogMb, keepDir=keepDir, forwarding=forwarding) as (dataDir, experimentDir):
+                print(RESULT_HEADER)
+                for parserName in parsers:
+                    printResult(parserName, numNodes, nfdLogMb, getSourceBytes(experimentDir, PARSERS[parserName][1]),
+                                runMeasured(parseNodesTask, parserName, experimentDir))
+                if pipeline:
+                    printResult("runAnalysisByNode", numNodes, nfdLogMb, getTreeBytes(experimentDir),
+                                runMeasured(runPipelineTask, dataDir, SYNTHETIC_EXPERIMENT, jobs, plots, boundedMemory))
+
+
+def benchmarkMemory(nodeCounts: List[int], nfdLogSizes: List[float], toleranceMb: float, nodeToleranceMb: float = DEFAULT_NODE_TOLERANCE_MB,
+                    keepDir: str = None, forwarding: bool = False) -> bool:
+    # Peak RSS of the whole analysis with boundedMemory has to stay within toleranceMb of the smallest nfd.logs' as they grow,
+    # for every node count, and may only grow by nodeToleranceMb per node as the node count does.
+    # Parsing runs in the measured process itself (one job) so its peak is the one compared.
+    print(RESULT_HEADER)
+    nodeCounts, nfdLogSizes = sorted(nodeCounts), sorted(nfdLogSizes)
+    # (nodes, nfd MB) -> bounded memory peak RSS
+    peaks: Dict[Tuple[int, float], float] = {}
+    for numNodes in nodeCounts:
+        for nfdLogMb in nfdLogSizes:
+            with syntheticExperiment(numNodes, nfdLogMb, keepDir=keepDir, forwarding=forwarding) as (dataDir, experimentDir):
+                for name, boundedMemory in [("runAnalysisByNode", False), ("bounded memory", True)]:
+                    measurement = runMeasured(runPipelineTask, dataDir, SYNTHETIC_EXPERIMENT, 1, False, boundedMemory)
+                    printResult(name, numNodes, nfdLogMb, getTreeBytes(experimentDir), measurement)
+                peaks[numNodes, nfdLogMb] = measurement[1]
+
+    passed = True
+    for numNodes in nodeCounts:
+        growth = max(peaks[numNodes, nfdLogMb] for nfdLogMb in nfdLogSizes) - peaks[numNodes, nfdLogSizes[0]]
+        ok = growth <= toleranceMb
+        passed &= ok
+        print("%d nodes: bounded memory peak RSS grew %.1f MB from %g MB to %g MB nfd.logs (tolerance %.1f MB): %s"
+              % (numNodes, growth, nfdLogSizes[0], nfdLogSizes[-1], toleranceMb, "ok" if ok else "FAILED"))
+    if len(nodeCounts) > 1:
+        for nfdLogMb in nfdLogSizes:
+            perNode = max((peaks[numNodes, nfdLogMb] - peaks[nodeCounts[0], nfdLogMb]) / (numNodes - nodeCounts[0])
+                          for numNodes in nodeCounts[1:])
+            ok = perNode <= nodeToleranceMb
+            passed &= ok
+            print("%g MB nfd.logs: bounded memory peak RSS grew %.2f MB per node from %d to %d nodes (tolerance %.2f MB): %s"
+                  % (nfdLogMb, perNode, nodeCounts[0], nodeCounts[-1], nodeToleranceMb, "ok" if ok else "FAILED"))
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subParsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    tailReads = subParsers.add_parser("tail-reads", help="Reading the last row of counter CSVs: whole file vs tail only")
+    tailReads.add_argument("--files", type=int, nargs="+", default=[100, 1000, 10000])
+    tailReads.add_argument("--rows", type=int, default=1000)
+
+    scaling = subParsers.add_parser("scaling", help="Time each parser and the whole analysis on generated experiments of growing size")
+    scaling.add_argument("--nodes", type=int, nargs="+", default=[10, 50], help="Node counts, e.g. 10 100 500")
+    scaling.add_argument("--nfd-mb", type=float, nargs="+", default=[1.0, 4.0], help="nfd.log size of every node, e.g. 4 100 1000")
+    scaling.add_argument("--parsers", nargs="*", choices=list(PARSERS), default=list(PARSERS))
+    scaling.add_argument("--no-pipeline", dest="pipeline", action="store_false", help="Skip timing runAnalysisByNode")
+    scaling.add_argument("--no-plots", dest="plots", action="store_false", help="Run the pipeline without drawing its figures")
+    scaling.add_argument("--jobs", "-j", type=int, default=1, help="Processes the pipeline parses and renders with")
+    scaling.add_argument("--forwarding", action="store_true", help="Generate nfd.logs with the Forwarder logging at DEBUG too")
+    scaling.add_argument("--keep", metavar="DIR", help="Generate experiments into DIR and reuse them on later runs instead of a temporary directory")
+    scaling.add_argument("--bounded-memory", dest="boundedMemory", action="store_true", help="Run the pipeline with --bounded-memory")
+
+    memory = subParsers.add_parser("memory", help="Fail unless the pipeline's peak RSS with --bounded-memory stays flat as nfd.logs grow "
+                                                  "and grows little with the node count")
+    memory.add_argument("--nodes", type=int, nargs="+", default=[4, 10, 25, 50], help="Node counts, e.g. 4 50")
+    memory.add_argument("--nfd-mb", type=float, nargs="+", default=[4.0, 16.0, 64.0], help="nfd.log size of every node, e.g. 4 100 1000")
+    memory.add_argument("--quick", action="store_true",
+                        help="Check %s nodes with %s MB nfd.logs instead, in a few seconds" % (QUICK_MEMORY_NODES, QUICK_MEMORY_NFD_MB))
+    memory.add_argument("--tolerance-mb", type=float, default=DEFAULT_MEMORY_TOLERANCE_MB,
+                        help="Largest growth in peak RSS allowed between the smallest and any larger nfd.logs of a node count")
+    memory.add_argument("--node-tolerance-mb", type=float, default=DEFAULT_NODE_TOLERANCE_MB,
+                        help="Largest growth in peak RSS allowed per node added")
+    memory.add_argument("--forwarding", action="store_true", help="Generate nfd.logs with the Forwarder logging at DEBUG too")
+    memory.add_argument("--keep", metavar="DIR", help="Generate experiments into DIR and reuse them on later runs instead of a temporary directory")
+
+    args = parser.parse_args()
+    if args.benchmark == "tail-reads":
+        benchmarkTailReads(args.files, args.rows)
+    elif args.benchmark == "scaling":
+        benchmarkScaling(args.nodes, args.nfd_mb, args.parsers, args.pipeline, args.jobs, args.plots, args.keep, args.forwarding,
+                         args.boundedMemory)
+    elif args.benchmark == "memory":
+        nodeCounts, nfdLogSizes = (QUICK_MEMORY_NODES, QUICK_MEMORY_NFD_MB) if args.quick else (args.nodes, args.nfd_mb)
+        if not benchmarkMemory(nodeCounts, nfdLogSizes, args.tolerance_mb, args.node_tolerance_mb, args.keep, args.forwarding):
+            exit(1)
@@ -1,7 +1,8 @@
-import csv
 import os
 from typing import List, Dict
 
+from metric_csv import readLastMetricRow, GAUGE
+
 CACHE_FILE_NAME = "sub-{objectType}-cacherate-{playerName}.csv"
 
 class CacheRates:
@@ -10,10 +11,8 @@ class CacheRates:
         self.cacheRates: Dict[str, int] = {}
         for node in otherNodes:
             filename =  CACHE_FILE_NAME.format(objectType=objectType, playerName=node)
-            with open(os.path.join(myDataDir, filename)) as f:
-                csvData = list(csv.reader(f))
-                lastRow = csvData[-1]
-                self.cacheRates[node] = round(float(lastRow[1]) * 100, 2)
+            lastRow = readLastMetricRow(os.path.join(myDataDir, filename), GAUGE)
+            self.cacheRates[node] = round(float(lastRow["value"]) * 100, 2)
 
     def plotCacheRates(self, ax):
         ax.set_title(self.myName)
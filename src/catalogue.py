@@ -0,0 +1,296 @@
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Tuple, Optional
+
+from histogram_store import HISTOGRAM_VALUES_FILE
+from log_reader import LOG_FILE
+from metric_csv import parseSeriesName
+from nfd_log_parser import NFD_LOG_FILE
+from parse_cache import getCacheDirFor
+from snapshot import ExperimentSnapshot, SNAPSHOT_EXTENSION
+
+# An index of every experiment under a data root, built from one walk of the tree: its nodes, which of their files exist
+# (with sizes and mtimes), each node's role and the experiment's topology. Written next to the parse cache so later queries
+# are answered from the index alone. The mtime of every directory listed is kept too: a node, experiment or scenario added
+# or removed since changes its parent's, so one stat per directory tells whether the index still matches the tree.
+CATALOGUE_VERSION = 2
+CATALOGUE_FILE = "catalogue-{}.json"
+
+# Routers of the topologies the experiments were run on
+ROUTERS = {
+    "tree": ["nodeE", "nodeF", "nodeG"],
+    "dumbbell": ["nodeE", "nodeF"],
+    "scalability": ["nodeQ", "nodeR", "nodeS", "nodeT"]
+}
+
+GAME_NODE = "game"
+ROUTER = "router"
+# A directory holding any of these is a node, and a node with only NFD's output is a router
+NODE_FILES = [NFD_LOG_FILE, HISTOGRAM_VALUES_FILE, LOG_FILE]
+GAME_FILES = [HISTOGRAM_VALUES_FILE, LOG_FILE]
+SKIPPED_DIRS = ["figures"]
+METRIC_EXTENSION = ".csv"
+
+# fileName -> (size, mtime in ns)
+FileStats = Dict[str, Tuple[int, int]]
+# directory -> mtime in ns
+DirStats = Dict[str, int]
+
+
+class NodeEntry:
+
+    def __init__(self, name: str, files: FileStats, role: str = None):
+        self.name = name
+        self.files = files
+        self.role = inferRole(files) if role is None else role
+
+    def getFamilies(self) -> List[str]:
+        # The files' names, and the series family of every metric CSV (rtt, interestscounter...)
+        families = set(self.files)
+        families.update(parseSeriesName(f[:-len(METRIC_EXTENSION)])[0] for f in self.files if f.endswith(METRIC_EXTENSION))
+        return sorted(families)
+
+    def hasFile(self, fileOrFamily: str) -> bool:
+        return fileOrFamily in self.files or fileOrFamily in self.getFamilies()
+
+    def getBytes(self) -> int:
+        return sum(size for size, _ in self.files.values())
+
+    def toDict(self) -> dict:
+        return {"role": self.role, "files": {f: list(stats) for f, stats in sorted(self.files.items())}}
+
+    @staticmethod
+    def fromDict(name: str, d: dict):
+        return NodeEntry(name, {f: tuple(stats) for f, stats in d["files"].items()}, d["role"])
+
+
+class ExperimentEntry:
+    # One scenario: a directory of node directories, a snapshot of one, or both
+
+    def __init__(self, scenario: str, path: str, nodes: Dict[str, NodeEntry], topology: str = None, snapshot: str = None):
+        self.scenario = scenario
+        self.path = path
+        self.nodes = nodes
+        self.topology = topology
+        self.snapshot = snapshot
+
+    def getNodes(self, role: str = None, withFile: str = None) -> List[str]:
+        return [name for name, node in sorted(self.nodes.items())
+                if (role is None or node.role == role) and (withFile is None or node.hasFile(withFile))]
+
+    def getRouters(self) -> List[str]:
+        return self.getNodes(ROUTER)
+
+    def getFilePath(self, node: str, fileName: str) -> Optional[str]:
+        # None when the node doesn't have the file, without looking on disk
+        if node not in self.nodes or fileName not in self.nodes[node].files:
+            return None
+        return os.path.join(self.path, node, fileName)
+
+    def getBytes(self) -> int:
+        return sum(node.getBytes() for node in self.nodes.values())
+
+    def toDict(self) -> dict:
+        return {"path": self.path, "topology": self.topology, "snapshot": self.snapshot,
+                "nodes": {name: node.toDict() for name, node in sorted(self.nodes.items())}}
+
+    @staticmethod
+    def fromDict(scenario: str, d: dict):
+        nodes = {name: NodeEntry.fromDict(name, node) for name, node in d["nodes"].items()}
+        return ExperimentEntry(scenario, d["path"], nodes, d["topology"], d["snapshot"])
+
+
+def inferRole(files: FileStats) -> str:
+    if NFD_LOG_FILE in files and not any(f in GAME_FILES or f.endswith(METRIC_EXTENSION) for f in files):
+        return ROUTER
+    return GAME_NODE
+
+
+def inferTopology(scenario: str, nodes: Dict[str, NodeEntry]) -> Optional[str]:
+    # The topology whose routers are exactly this experiment's, else one named by a part of the scenario's path
+    routers = {name for name, node in nodes.items() if node.role == ROUTER}
+    for topology, topologyRouters in ROUTERS.items():
+        if len(routers) > 0 and routers == set(topologyRouters):
+            return topology
+    for part in reversed(scenario.replace(os.sep, "-").replace("_", "-").split("-")):
+        if part in ROUTERS:
+            return part
+    return None
+
+
+def setRouterRoles(entry: ExperimentEntry):
+    # The known routers of the experiment's topology are routers whatever else they logged, as in AnalysisByNode
+    for name in ROUTERS.get(entry.topology, []):
+        if name in entry.nodes:
+            entry.nodes[name].role = ROUTER
+
+
+def scanDirectory(path: str, dirStats: DirStats) -> (FileStats, Dict[str, str]):
+    # (stats of the files, path of the subdirectories) from one scandir. The directory's own mtime is recorded in dirStats
+    # before it is listed, so anything added while listing it shows up as a change next time.
+    dirStats[path] = os.stat(path).st_mtime_ns
+    files, dirs = {}, {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dirs[entry.name] = entry.path
+            elif entry.is_file():
+                st = entry.stat()
+                files[entry.name] = (st.st_size, st.st_mtime_ns)
+    return files, dirs
+
+
+class Catalogue:
+
+    def __init__(self, root: str, experiments: Dict[str, ExperimentEntry] = None, scannedAt: float = None, dirStats: DirStats = None):
+        self.root = os.path.abspath(root)
+        self.experiments: Dict[str, ExperimentEntry] = {} if experiments is None else experiments
+        self.scannedAt = scannedAt
+        self.dirStats: DirStats = {} if dirStats is None else dirStats
+
+    @staticmethod
+    def scan(root: str):
+        # Every directory is listed exactly once, its subdirectories' listings deciding what it is: one with node directories
+        # in it is an experiment and isn't walked into any further. A <name>.ndnsnap beside an experiment is recorded on it.
+        catalogue = Catalogue(root, scannedAt=time.time())
+        pending = [(catalogue.root, *scanDirectory(catalogue.root, catalogue.dirStats))]
+        # Snapshots are added once every experiment directory is known, as they sit beside them
+        snapshotFiles = []
+        while pending:
+            directory, files, dirs = pending.pop()
+            children = {name: (path, *scanDirectory(path, catalogue.dirStats)) for name, path in sorted(dirs.items())
+                        if name not in SKIPPED_DIRS and not name.startswith(".")}
+            nodes = {name: NodeEntry(name, childFiles) for name, (_, childFiles, _) in children.items() if any(f in childFiles for f in NODE_FILES)}
+            if len(nodes) > 0:
+                catalogue.addExperiment(directory, nodes)
+            else:
+                pending.extend(reversed(list(children.values())))
+            snapshotFiles += [os.path.join(directory, f) for f in sorted(files) if f.endswith(SNAPSHOT_EXTENSION)]
+        for snapshotFile in snapshotFiles:
+            catalogue.addSnapshot(snapshotFile)
+        catalogue.experiments = dict(sorted(catalogue.experiments.items()))
+        return catalogue
+
+    def isStale(self) -> bool:
+        # Whether any directory listed by the scan has changed or gone since
+        for path, mtime in self.dirStats.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def getScenario(self, path: str) -> str:
+        return os.path.relpath(path, self.root) if os.path.abspath(path) != self.root else os.path.basename(self.root)
+
+    def addExperiment(self, path: str, nodes: Dict[str, NodeEntry]):
+        scenario = self.getScenario(path)
+        self.experiments[scenario] = ExperimentEntry(scenario, os.path.abspath(path), nodes, inferTopology(scenario, nodes))
+        setRouterRoles(self.experiments[scenario])
+
+    def addSnapshot(self, snapshotFile: str):
+        scenario = self.getScenario(snapshotFile[:-len(SNAPSHOT_EXTENSION)])
+        if scenario not in self.experiments:
+            # Only the snapshot is left: its nodes are read from its header, without their files
+            snapshot = ExperimentSnapshot(snapshotFile)
+            nodes = {node: NodeEntry(node, {}, GAME_NODE) for node in snapshot.nodes}
+            self.experiments[scenario] = ExperimentEntry(scenario, os.path.abspath(snapshotFile[:-len(SNAPSHOT_EXTENSION)]), nodes,
+                                                         inferTopology(scenario, nodes))
+            setRouterRoles(self.experiments[scenario])
+        self.experiments[scenario].snapshot = os.path.abspath(snapshotFile)
+
+    def find(self, topology: str = None, scenario: str = None, withFiles: List[str] = None, role: str = None) -> List[ExperimentEntry]:
+        # Experiments on topology whose scenario matches the fnmatch pattern and that have each of withFiles (a file name or a
+        # metric family such as rtt) on at least one node, of the given role if there is one
+        found = []
+        for entry in self.experiments.values():
+            if topology is not None and entry.topology != topology:
+                continue
+            if scenario is not None and not fnmatch.fnmatch(entry.scenario, scenario):
+                continue
+            if withFiles is not None and not all(len(entry.getNodes(role, f)) > 0 for f in withFiles):
+                continue
+            found.append(entry)
+        return found
+
+    def get(self, scenario: str) -> Optional[ExperimentEntry]:
+        return self.experiments.get(scenario)
+
+    def toDict(self) -> dict:
+        return {"version": CATALOGUE_VERSION, "root": self.root, "scannedAt": self.scannedAt, "dirStats": self.dirStats,
+                "experiments": {scenario: entry.toDict() for scenario, entry in self.experiments.items()}}
+
+    @staticmethod
+    def fromDict(d: dict):
+        experiments = {scenario: ExperimentEntry.fromDict(scenario, entry) for scenario, entry in d["experiments"].items()}
+        return Catalogue(d["root"], experiments, d["scannedAt"], d["dirStats"])
+
+    def save(self, fileName: str = None):
+        fileName = getCatalogueFile(self.root) if fileName is None else fileName
+        os.makedirs(os.path.dirname(fileName), exist_ok=True)
+        tmpFile = "%s.%d.tmp" % (fileName, os.getpid())
+        with open(tmpFile, "w") as f:
+            json.dump(self.toDict(), f)
+        os.replace(tmpFile, fileName)
+
+
+def getCatalogueFile(root: str) -> str:
+    root = os.path.abspath(root)
+    return os.path.join(getCacheDirFor(root), CATALOGUE_FILE.format(hashlib.sha1(root.encode()).hexdigest()[:16]))
+
+
+def loadCatalogue(root: str, rescan: bool = False) -> Catalogue:
+    # The saved index of root, scanned (and saved) the first time, when asked to or when the tree has changed since
+    fileName = getCatalogueFile(root)
+    if not rescan:
+        try:
+            with open(fileName) as f:
+                saved = json.load(f)
+            if saved.get("version") == CATALOGUE_VERSION:
+                catalogue = Catalogue.fromDict(saved)
+                if not catalogue.isStale():
+                    return catalogue
+                print("Directories under %s changed since they were catalogued, rescanning" % catalogue.root)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+    catalogue = Catalogue.scan(root)
+    catalogue.save(fileName)
+    return catalogue
+
+
+def formatExperiments(entries: List[ExperimentEntry], withFile: str = None, role: str = None) -> str:
+    lines = ["%-40s %-12s %6s %8s %10s %s" % ("scenario", "topology", "game", "routers", "MB", "snapshot")]
+    for entry in entries:
+        lines.append("%-40s %-12s %6d %8d %10.1f %s" % (entry.scenario, entry.topology or "-", len(entry.getNodes(GAME_NODE)),
+                                                       len(entry.getRouters()), entry.getBytes() / 1e6, "yes" if entry.snapshot else "no"))
+        if withFile is not None:
+            lines.append("    %s: %s" % (withFile, " ".join(entry.getNodes(role, withFile))))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index every experiment under a data root once, then query the index")
+    parser.add_argument("root")
+    parser.add_argument("--rescan", action="store_true", help="Walk the tree again instead of reading the saved index")
+    parser.add_argument("--topology", choices=list(ROUTERS))
+    parser.add_argument("--scenario", help="fnmatch pattern on the scenario's path under root, e.g. '*cache-20ms*'")
+    parser.add_argument("--with", dest="withFiles", nargs="+", metavar="FILE",
+                        help="Only experiments with these files or metric families on some node, e.g. nfd.log rtt")
+    parser.add_argument("--role", choices=[GAME_NODE, ROUTER], help="Only count the nodes of this role for --with")
+    parser.add_argument("--json", action="store_true", help="Print the matching experiments' index entries as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalogue = loadCatalogue(args.root, args.rescan)
+    found = catalogue.find(args.topology, args.scenario, args.withFiles, args.role)
+    if args.json:
+        print(json.dumps({entry.scenario: entry.toDict() for entry in found}, indent=2))
+    else:
+        print(formatExperiments(found, None if args.withFiles is None else args.withFiles[0], args.role))
+        print("%d of %d experiments in %.3fs (index scanned %s)" % (len(found), len(catalogue.experiments), time.perf_counter() - start,
+                                                                     time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(catalogue.scannedAt))))
@@ -0,0 +1,190 @@
+import os
+from typing import List, Dict
+
+import numpy as np
+
+from node_loader import NodeData, loadNodes, ROUTER_PARTS, GAME_NODE_PARTS
+from parse_cache import ParseCache
+from percentiles import PERCENTILES, PERCENTILE_NAMES
+from snapshot import ExperimentSnapshot
+
+DEFAULT_OBJECT_TYPE = "status"
+
+INTEREST_RATE = "interestRate"
+INTERESTS_SEEN = "interestsSeen"
+INTERESTS_EXPRESSED = "interestsExpressed"
+AGGREGATION_FACTOR = "aggregationFactor"
+CACHE_LOOKUPS = "cacheLookups"
+CACHE_HITS = "cacheHits"
+CACHE_HIT_RATE = "cacheHitRate"
+# From the Forwarder's own events, only there when NFD logged them
+FORWARDING_AGGREGATION = "forwardingAggregation"
+PIT_PEAK = "pitPeak"
+RTT_FORMAT = "rtt-{}"
+POSITION_DELTA_FORMAT = "positionDelta-{}"
+DEAD_RECKONING_FORMAT = "dr-{}"
+DEAD_RECKONING_TYPES = ["velocity", "skip", "threshold", "null"]
+
+METRICS = [INTEREST_RATE, INTERESTS_SEEN, INTERESTS_EXPRESSED, AGGREGATION_FACTOR, CACHE_LOOKUPS, CACHE_HITS, CACHE_HIT_RATE,
+           FORWARDING_AGGREGATION, PIT_PEAK] + \
+          [RTT_FORMAT.format(name) for name in PERCENTILE_NAMES] + \
+          [POSITION_DELTA_FORMAT.format(name) for name in PERCENTILE_NAMES] + \
+          [DEAD_RECKONING_FORMAT.format(drType) for drType in DEAD_RECKONING_TYPES]
+
+# The metrics printed and plotted scenario against scenario
+COMPARED_METRICS = [INTEREST_RATE, AGGREGATION_FACTOR, CACHE_HIT_RATE, RTT_FORMAT.format("p95"), POSITION_DELTA_FORMAT.format("p95")]
+
+# scenario -> node -> loaded parts
+ScenarioData = Dict[str, Dict[str, NodeData]]
+
+
+class MetricTable:
+    # scenario x node x metric, NaN wherever a node didn't produce a metric (e.g. a router's interest rate)
+
+    def __init__(self, scenarios: List[str], nodes: List[str], metrics: List[str] = METRICS):
+        self.scenarios = scenarios
+        self.nodes = nodes
+        self.metrics = metrics
+        self.values = np.full((len(scenarios), len(nodes), len(metrics)), np.nan)
+
+    def set(self, scenario: str, node: str, metric: str, value: float):
+        self.values[self.scenarios.index(scenario), self.nodes.index(node), self.metrics.index(metric)] = value
+
+    def get(self, metric: str) -> np.ndarray:
+        # scenario x node
+        return self.values[:, :, self.metrics.index(metric)]
+
+    def getValuesByNode(self, metric: str, scenario: str, nodes: List[str] = None) -> Dict[str, float]:
+        row = self.get(metric)[self.scenarios.index(scenario)]
+        return {node: float(value) for node, value in zip(self.nodes, row)
+                if not np.isnan(value) and (nodes is None or node in nodes)}
+
+    def getScenarioMeans(self, metric: str) -> np.ndarray:
+        values = self.get(metric)
+        counts = np.sum(~np.isnan(values), axis=1)
+        with np.errstate(invalid="ignore"):
+            return np.where(counts > 0, np.nansum(values, axis=1) / np.maximum(counts, 1), np.nan)
+
+    def getPairwiseChanges(self, metric: str) -> np.ndarray:
+        # [i, j]: % change of the node mean going from scenario i to scenario j
+        # NaN where the row's mean is 0 or missing
+        means = self.getScenarioMeans(metric)
+        base = np.where(means == 0, np.nan, means)
+        return 100 * (means[np.newaxis, :] - base[:, np.newaxis]) / np.abs(base[:, np.newaxis])
+
+    def toRecords(self) -> List[dict]:
+        # Long format: one record per (scenario, node, metric) that has a value
+        return [{"scenario": self.scenarios[s], "node": self.nodes[n], "metric": self.metrics[m], "value": float(self.values[s, n, m])}
+                for s, n, m in zip(*np.nonzero(~np.isnan(self.values)))]
+
+    def formatMetric(self, metric: str) -> str:
+        values = self.get(metric)
+        nodes = [i for i in range(len(self.nodes)) if not np.all(np.isnan(values[:, i]))]
+        width = max([16] + [len(s) + 1 for s in self.scenarios])
+        # Every column as wide as its node's name, so none are cut
+        widths = [max(9, len(self.nodes[i])) for i in nodes]
+        lines = [metric, " " * width + " ".join(self.nodes[i].rjust(w) for i, w in zip(nodes, widths)) + " %9s" % "mean"]
+        for s, (scenario, mean) in enumerate(zip(self.scenarios, self.getScenarioMeans(metric))):
+            lines.append(scenario.ljust(width) + " ".join("%*.2f" % (w, values[s, i]) for i, w in zip(nodes, widths)) + " %9.2f" % mean)
+        return "\n".join(lines)
+
+    def formatPairwise(self, metric: str) -> str:
+        width = max([16] + [len(s) + 1 for s in self.scenarios])
+        widths = [max(9, len(s)) for s in self.scenarios]
+        lines = ["%s: %% change from row to column" % metric, " " * width + " ".join(s.rjust(w) for s, w in zip(self.scenarios, widths))]
+        for scenario, changes in zip(self.scenarios, self.getPairwiseChanges(metric)):
+            lines.append(scenario.ljust(width) + " ".join(("-" if np.isnan(change) else "%.1f" % change).rjust(w)
+                                                          for change, w in zip(changes, widths)))
+        return "\n".join(lines)
+
+
+def getNodeMetrics(nodeData: Dict[str, NodeData], node: str, gameNodes: List[str], objectType: str = DEFAULT_OBJECT_TYPE) -> Dict[str, float]:
+    metrics = {}
+    data = nodeData[node]
+    if data.interestRates is not None:
+        rate = data.interestRates.getInterestRateForType(objectType)
+        expressed = sum(nodeData[sub].interestsCounters.get(objectType, {}).get(node, 0)
+                        for sub in gameNodes if sub != node and nodeData[sub].interestsCounters is not None)
+        metrics[INTEREST_RATE] = rate.finalMeanRate
+        metrics[INTERESTS_SEEN] = rate.totalInterestsSeen
+        metrics[INTERESTS_EXPRESSED] = expressed
+        metrics[AGGREGATION_FACTOR] = 100 * rate.totalInterestsSeen / expressed if expressed > 0 else np.nan
+
+    if data.nfdLogParser is not None:
+        byPlayer = data.nfdLogParser.getCacheRatesForObjectType(objectType).values()
+        lookups, hits = sum(r.lookups for r in byPlayer), sum(r.hits for r in byPlayer)
+        metrics[CACHE_LOOKUPS] = lookups
+        metrics[CACHE_HITS] = hits
+        metrics[CACHE_HIT_RATE] = 100 * hits / lookups if lookups > 0 else np.nan
+        forwarding = data.nfdLogParser.forwarding
+        if len(forwarding) > 0:
+            metrics[FORWARDING_AGGREGATION] = forwarding.getCounts(objectType=objectType).getAggregationFactor()
+            metrics[PIT_PEAK] = forwarding.getPeakPitOccupancy()
+
+    for parsed, nameFormat in [(data.packetTimeHistograms, RTT_FORMAT), (data.statusDeltasHistograms, POSITION_DELTA_FORMAT)]:
+        if parsed is not None:
+            histogram = parsed.getSampleHistogram()
+            for name, value in zip(PERCENTILE_NAMES, histogram.getPercentiles(PERCENTILES)):
+                metrics[nameFormat.format(name)] = value
+
+    if data.deadReckoning is not None:
+        for drType, percentage in data.deadReckoning.getPercentages().items():
+            if drType in DEAD_RECKONING_TYPES:
+                metrics[DEAD_RECKONING_FORMAT.format(drType)] = percentage
+    return metrics
+
+
+class ExperimentComparison:
+    # Every scenario (subDir) is loaded once, up front, and reduced to one MetricTable per object type.
+    # Per scenario analyses share nodeDataByScenario instead of loading the other scenarios again themselves.
+
+    def __init__(self, dataDir: str, scenarios: List[str], routers: List[str] = None, jobs: int = 1, cache: ParseCache = None,
+                 snapshots: Dict[str, ExperimentSnapshot] = None, boundedMemory: bool = False):
+        self.dataDir = dataDir
+        self.scenarios = scenarios
+        self.routers = [] if routers is None else routers
+        self.jobs = jobs
+        self.cache = cache
+        self.snapshots: Dict[str, ExperimentSnapshot] = {} if snapshots is None else snapshots
+        self.boundedMemory = boundedMemory
+        self.nodeDataByScenario: ScenarioData = {}
+        self.tables: Dict[str, MetricTable] = {}
+
+    def getNodes(self, scenario: str) -> List[str]:
+        if scenario in self.snapshots:
+            return sorted(self.snapshots[scenario].nodes)
+        scenarioDir = os.path.join(self.dataDir, scenario)
+        return sorted(n for n in os.listdir(scenarioDir) if os.path.isdir(os.path.join(scenarioDir, n)))
+
+    def loadScenario(self, scenario: str) -> Dict[str, NodeData]:
+        nodes = self.getNodes(scenario)
+        nodeDirs = {node: os.path.join(self.dataDir, scenario, node) for node in nodes}
+        partsByNode = {node: ROUTER_PARTS if node in self.routers else GAME_NODE_PARTS for node in nodes}
+        self.nodeDataByScenario[scenario] = loadNodes(nodeDirs, partsByNode, self.jobs, self.nodeDataByScenario.get(scenario), self.cache,
+                                                      self.snapshots.get(scenario), self.boundedMemory)
+        return self.nodeDataByScenario[scenario]
+
+    def loadScenarios(self) -> ScenarioData:
+        for scenario in self.scenarios:
+            self.loadScenario(scenario)
+        return self.nodeDataByScenario
+
+    def getTable(self, objectType: str = DEFAULT_OBJECT_TYPE) -> MetricTable:
+        if objectType in self.tables:
+            return self.tables[objectType]
+        self.loadScenarios()
+        nodes = sorted({node for nodeData in self.nodeDataByScenario.values() for node in nodeData})
+        table = MetricTable(self.scenarios, nodes)
+        for scenario in self.scenarios:
+            nodeData = self.nodeDataByScenario[scenario]
+            gameNodes = [node for node in nodeData if node not in self.routers]
+            for node in nodeData:
+                for metric, value in getNodeMetrics(nodeData, node, gameNodes, objectType).items():
+                    table.set(scenario, node, metric, value)
+        self.tables[objectType] = table
+        return table
+
+    def formatReport(self, objectType: str = DEFAULT_OBJECT_TYPE, metrics: List[str] = COMPARED_METRICS) -> str:
+        table = self.getTable(objectType)
+        sections = ["%s\n%s" % (table.formatMetric(metric), table.formatPairwise(metric)) for metric in metrics]
+        return ("Comparison of %s across %s\n\n" % (objectType, ", ".join(self.scenarios))) + "\n\n".join(sections)
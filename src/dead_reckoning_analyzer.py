@@ -1,5 +1,6 @@
 import reading_utils
 import numpy as np
+from metric_csv import readLastMetricRow, COUNTER
 from typing import List, Dict
 
 FILE_FORMAT = "dr-counter-{}.csv"
@@ -9,12 +10,12 @@ counterNames: List[str] = ["null", "velocity", "threshold", "skip"]
 
 class DeadReckoningAnalyzer:
 
-    def __init__(self, node:str, nodeDir:str):
+    def __init__(self, node:str, nodeDir:str, counters: Dict[str, int] = None):
         self.nodeDir = nodeDir
         self.node = node
         self.counters = {}
         try:
-            self.counters: Dict[str, int] = {name: self.readCounter(name) for name in counterNames}
+            self.counters: Dict[str, int] = {name: self.readCounter(name) for name in counterNames} if counters is None else counters
         except FileNotFoundError:
             return
         # self.nullCount = self.getCounter("null")
@@ -26,11 +27,11 @@ class DeadReckoningAnalyzer:
 
     def readCounter(self, counterName: str) -> int:
         try:
-            lines = reading_utils.readCsv(reading_utils.buildFileName(self.nodeDir, FILE_FORMAT.format(counterName)))
+            lastRow = readLastMetricRow(reading_utils.buildFileName(self.nodeDir, FILE_FORMAT.format(counterName)), COUNTER)
         except FileNotFoundError:
             raise FileNotFoundError()
 
-        return int(lines[-1][1])
+        return int(lastRow["count"])
 
     def getPercentage(self, name:str) -> float:
         return self.counters[name]
@@ -0,0 +1,276 @@
+import argparse
+import os
+import re
+import time
+import warnings
+from collections import defaultdict
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from catalogue import loadCatalogue, METRIC_EXTENSION
+from dead_reckoning_analyzer import FILE_FORMAT, counterNames
+from query import select, Series
+from rate_series import resampleCounts, DEFAULT_STEP
+from render_queue import RenderQueue, recordSubplots
+from status_deltas import DISTANCE_SCALE_FACTOR
+
+# How much dead reckoning throttles each publisher over time, and what that costs and saves. Every publisher's dr-counter
+# decisions, pub-update-percentage, the position error its subscribers see (their eng-status-delta of it) and the interests
+# it receives are put on one grid of fixed steps from the experiment's first report, as publishers x steps arrays, so each
+# experiment is one vectorized pass however many nodes it has.
+DR_COUNTER_METRIC = "dr-counter"
+UPDATE_PERCENTAGE_METRIC = "pub-update-percentage"
+STATUS_DELTA_METRIC = "delta"
+INTEREST_RATE_METRIC = "pub-interest-rate"
+# Dead reckoning only throttles the players' status updates
+OBJECT_TYPE = "status"
+SKIP = "skip"
+COUNTER_INDEXES = {FILE_FORMAT.format(name)[:-len(METRIC_EXTENSION)]: i for i, name in enumerate(counterNames)}
+# (x, y) series of ThrottlingSeries correlated in every experiment
+CORRELATIONS = [("skipRatio", "positionError"), ("skipRatio", "interestRate"), ("updatePercentage", "positionError"),
+                ("updatePercentage", "interestRate")]
+# What a baseline's savings are measured against, so one without them can't be a baseline
+REFERENCE_VALUES = ["publishedRate", "interestRate", "positionError"]
+SCENARIO_SEPARATORS = re.compile(r"[-_]")
+FIGURE_DIR = "figures"
+DR_FIGURE_DIR = "dead-reckoning"
+
+
+def stepDeltas(series: Series, grid: np.ndarray) -> np.ndarray:
+    return np.diff(resampleCounts(series.t, series.values["count"], grid))
+
+
+def sampleAt(series: Series, column: str, times: np.ndarray) -> np.ndarray:
+    # A gauge-like column at the given times, linear between reports and NaN outside them
+    if len(series.t) == 0:
+        return np.full(len(times), np.nan)
+    return np.interp(times, series.t.astype(np.float64), series.values[column].astype(np.float64), left=np.nan, right=np.nan)
+
+
+def correlate(x: np.ndarray, y: np.ndarray) -> float:
+    # Pearson's r over the points where both are known, NaN with too few of them or no variation
+    known = np.isfinite(x) & np.isfinite(y)
+    x, y = x[known], y[known]
+    if len(x) < 3 or np.std(x) == 0 or np.std(y) == 0:
+        return np.nan
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+def getMeanTotal(values: np.ndarray) -> float:
+    # Mean over the steps any publisher reported in of the publishers' sum
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        reporting = np.isfinite(values).any(axis=0)
+        return np.nanmean(np.nansum(values, axis=0)[reporting]) if reporting.any() else np.nan
+
+
+class ThrottlingSeries:
+
+    def __init__(self, scenario: str, publishers: List[str], grid: np.ndarray, decisions: np.ndarray, updatePercentage: np.ndarray,
+                 errorSums: np.ndarray, errorCounts: np.ndarray, interestRate: np.ndarray):
+        self.scenario = scenario
+        self.publishers = publishers
+        self.grid = grid
+        self.step = grid[1] - grid[0] if len(grid) > 1 else DEFAULT_STEP
+        # publishers x counterNames x steps
+        self.decisions = decisions
+        # publishers x steps, each at the end of its step
+        self.updatePercentage = updatePercentage
+        # Subscribers' position error samples of each publisher in each step and their sum, in GWUs
+        self.errorSums = errorSums
+        self.errorCounts = errorCounts
+        self.interestRate = interestRate
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.total = decisions.sum(axis=1)
+            self.skipped = decisions[:, counterNames.index(SKIP)]
+            self.skipRatio = np.where(self.total > 0, self.skipped / self.total, np.nan)
+            self.positionError = np.where(errorCounts > 0, errorSums / errorCounts, np.nan)
+
+    @staticmethod
+    def fromSeries(scenario: str, seriesByMetric: Dict[str, List[Series]], step: float = DEFAULT_STEP):
+        everything = [s for series in seriesByMetric.values() for s in series if len(s.t) > 0]
+        start = min(s.t[0] for s in everything) if everything else 0
+        end = max(s.t[-1] for s in everything) if everything else start
+        grid = start + step * np.arange(int(np.ceil((end - start) / step)) + 1)
+        steps = len(grid) - 1
+        # Scenarios without dead reckoning have no dr-counters, but their publishers still report their update percentage
+        publishers = sorted({s.node for metric in [DR_COUNTER_METRIC, UPDATE_PERCENTAGE_METRIC] for s in seriesByMetric[metric]})
+        index = {p: i for i, p in enumerate(publishers)}
+
+        decisions = np.zeros((len(publishers), len(counterNames), steps))
+        for s in seriesByMetric[DR_COUNTER_METRIC]:
+            decisions[index[s.node], COUNTER_INDEXES[s.name]] = stepDeltas(s, grid)
+        updatePercentage = np.full((len(publishers), steps), np.nan)
+        interestRate = np.full((len(publishers), steps), np.nan)
+        for s in seriesByMetric[UPDATE_PERCENTAGE_METRIC]:
+            if s.node in index:
+                updatePercentage[index[s.node]] = sampleAt(s, "value", grid[1:])
+        for s in seriesByMetric[INTEREST_RATE_METRIC]:
+            if s.node in index:
+                interestRate[index[s.node]] = stepDeltas(s, grid) / step
+
+        # Every subscriber's timer of a publisher's position error, weighted by the samples it took in each step. The timer's
+        # mean is over its reservoir, which stands in for the step's own mean.
+        deltas = [s for s in seriesByMetric[STATUS_DELTA_METRIC] if s.player in index]
+        errorSums, errorCounts = np.zeros((len(publishers), steps)), np.zeros((len(publishers), steps))
+        if deltas:
+            rows = np.array([index[s.player] for s in deltas])
+            samples = np.nan_to_num(np.vstack([stepDeltas(s, grid) for s in deltas]))
+            means = np.nan_to_num(np.vstack([sampleAt(s, "mean", grid[1:]) for s in deltas])) / DISTANCE_SCALE_FACTOR
+            np.add.at(errorSums, rows, means * samples)
+            np.add.at(errorCounts, rows, samples)
+        return ThrottlingSeries(scenario, publishers, grid, np.nan_to_num(decisions), updatePercentage, errorSums, errorCounts, interestRate)
+
+    def getElapsed(self) -> np.ndarray:
+        return self.grid[1:] - self.grid[0]
+
+    def getCorrelations(self) -> Dict[str, float]:
+        # Over every publisher's steps at once
+        return {"%s~%s" % (x, y): correlate(getattr(self, x).ravel(), getattr(self, y).ravel()) for x, y in CORRELATIONS}
+
+    def getPublishedRate(self) -> np.ndarray:
+        # Updates published per second: the share of the interests each publisher answered with an update, of its interest
+        # rate. Unlike the dr-counters this is reported with or without dead reckoning, so every scenario is measured alike.
+        return self.updatePercentage * self.interestRate
+
+    def getSummary(self) -> dict:
+        total, skipped, errorCount = self.total.sum(), self.skipped.sum(), self.errorCounts.sum()
+        return dict({"scenario": self.scenario, "publishers": len(self.publishers), "decisions": int(total),
+                     # Without any decisions dead reckoning wasn't running, so nothing was skipped
+                     "skipped": 100 * skipped / total if total > 0 else 0.0,
+                     "publishedRate": getMeanTotal(self.getPublishedRate()),
+                     "interestRate": getMeanTotal(self.interestRate),
+                     "positionError": self.errorSums.sum() / errorCount if errorCount > 0 else np.nan},
+                    **self.getCorrelations())
+
+    def plot(self, figureDir: str, renderQueue: RenderQueue):
+        elapsed = self.getElapsed()
+        f, (skipAx, errorAx, rateAx) = recordSubplots(3, 1, sharex=True, figsize=(12, 12))
+        for i, publisher in enumerate(self.publishers):
+            skipAx.plot(elapsed, 100 * self.skipRatio[i], label=publisher)
+            errorAx.plot(elapsed, self.positionError[i], label=publisher)
+            rateAx.plot(elapsed, self.interestRate[i], label=publisher)
+        skipAx.set_ylabel("Updates skipped (%)")
+        errorAx.set_ylabel("Position error (GWUs)")
+        rateAx.set_ylabel("Interests per second")
+        rateAx.set_xlabel("Elapsed Time (s)")
+        skipAx.legend(ncol=8, fontsize="small", loc="lower left", bbox_to_anchor=(0, 1.02))
+        f.suptitle("Dead reckoning throttling in %s" % self.scenario)
+        renderQueue.submit(f, os.path.join(figureDir, "throttling-over-time"))
+
+
+def loadThrottling(root: str, scenario: str = None, step: float = DEFAULT_STEP, rescan: bool = False) -> Dict[str, ThrottlingSeries]:
+    # Every matching experiment under root with publishers, throttled or not, its series read through the catalogue
+    catalogue = loadCatalogue(root, rescan)
+    byScenario: Dict[str, Dict[str, List[Series]]] = defaultdict(lambda: defaultdict(list))
+    for metric, objectType in [(DR_COUNTER_METRIC, None), (UPDATE_PERCENTAGE_METRIC, OBJECT_TYPE), (STATUS_DELTA_METRIC, OBJECT_TYPE),
+                               (INTEREST_RATE_METRIC, OBJECT_TYPE)]:
+        for series in select(catalogue, metric, scenario, objectType=objectType):
+            byScenario[series.scenario][metric].append(series)
+    return {s: ThrottlingSeries.fromSeries(s, seriesByMetric, step) for s, seriesByMetric in sorted(byScenario.items())
+            if len(seriesByMetric[DR_COUNTER_METRIC]) + len(seriesByMetric[UPDATE_PERCENTAGE_METRIC]) > 0}
+
+
+def getGroup(scenario: str) -> str:
+    # Scenarios in one directory were run on the same topology, differing only in their settings
+    return os.path.dirname(scenario)
+
+
+def sharedSettings(scenario: str, other: str) -> int:
+    return len(set(SCENARIO_SEPARATORS.split(os.path.basename(scenario))) & set(SCENARIO_SEPARATORS.split(os.path.basename(other))))
+
+
+def chooseBaseline(scenario: str, candidates: List[dict]) -> Optional[str]:
+    # The candidate skipping least and, of those, sharing the most settings in the scenario's name, e.g. cache-20ms for
+    # drpt-0.5-cache-20ms. One without all its reference values would make every saving NaN.
+    candidates = [c for c in candidates if all(np.isfinite(c[v]) for v in REFERENCE_VALUES)]
+    if len(candidates) == 0:
+        return None
+    return min(candidates, key=lambda c: (c["skipped"], -sharedSettings(scenario, c["scenario"]), c["scenario"]))["scenario"]
+
+
+def compareToBaseline(summaries: List[dict], baseline: str = None) -> Dict[str, Optional[str]]:
+    # Adds the bandwidth each scenario saves and the accuracy it loses against its baseline: the given one, else by default
+    # the closest scenario of its directory skipping least. Bandwidth is the interests its publishers receive, and the status
+    # updates they publish; accuracy the position error. Returns each scenario's baseline.
+    bySummary = {s["scenario"]: s for s in summaries}
+    if baseline is not None and baseline not in bySummary:
+        raise ValueError("No publishers in baseline scenario %s" % baseline)
+    byGroup: Dict[str, List[dict]] = defaultdict(list)
+    for s in summaries:
+        byGroup[getGroup(s["scenario"])].append(s)
+    baselines = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for s in summaries:
+            baselines[s["scenario"]] = baseline if baseline is not None else chooseBaseline(s["scenario"], byGroup[getGroup(s["scenario"])])
+            reference = bySummary.get(baselines[s["scenario"]], {v: np.nan for v in REFERENCE_VALUES})
+            s["baseline"] = baselines[s["scenario"]]
+            s["interestsSaved"] = 100 * (1 - s["interestRate"] / reference["interestRate"])
+            s["updatesSaved"] = 100 * (1 - s["publishedRate"] / reference["publishedRate"])
+            s["accuracyLost"] = 100 * (s["positionError"] / reference["positionError"] - 1)
+    return baselines
+
+
+def formatSummaries(summaries: List[dict]) -> str:
+    width = max([len("scenario")] + [len(s["scenario"]) for s in summaries])
+    lines = ["%-*s %5s %9s %8s %9s %9s %9s %10s %10s %10s  %s" % (width, "scenario", "pubs", "decisions", "skip %", "upd/s", "int/s", "err GWU",
+                                                                    "upd saved", "int saved", "acc lost", "against")]
+    for s in summaries:
+        lines.append("%-*s %5d %9d %8.1f %9.2f %9.2f %9.2f %9.1f%% %9.1f%% %9.1f%%  %s" % (
+            width, s["scenario"], s["publishers"], s["decisions"], s["skipped"], s["publishedRate"], s["interestRate"], s["positionError"],
+            s["updatesSaved"], s["interestsSaved"], s["accuracyLost"], "-" if s["baseline"] is None else s["baseline"]))
+    lines += ["", "Correlations (Pearson's r) over every publisher's intervals:",
+              "%-*s " % (width, "scenario") + " ".join("%24s" % ("%s~%s" % pair) for pair in CORRELATIONS)]
+    for s in summaries:
+        lines.append("%-*s " % (width, s["scenario"]) + " ".join("%24.2f" % s["%s~%s" % pair] for pair in CORRELATIONS))
+    return "\n".join(lines)
+
+
+def plotComparison(summaries: List[dict], figureDir: str, renderQueue: RenderQueue):
+    f, ax = recordSubplots()
+    for s in summaries:
+        ax.scatter(s["interestsSaved"], s["accuracyLost"])
+        ax.annotate(s["scenario"], (s["interestsSaved"], s["accuracyLost"]), fontsize="small")
+    baselines = sorted({s["baseline"] for s in summaries if s["baseline"] is not None})
+    ax.set_xlabel("Interests saved against %s (%%)" % (baselines[0] if len(baselines) == 1 else "each scenario's baseline"))
+    ax.set_ylabel("Position error added (%)")
+    f.suptitle("Bandwidth saved against accuracy lost by dead reckoning")
+    renderQueue.submit(f, os.path.join(figureDir, "bandwidth-vs-accuracy"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dead reckoning throttling over time, and its savings and costs per scenario")
+    parser.add_argument("root")
+    parser.add_argument("--scenario", help="fnmatch pattern on the scenario's path under root")
+    parser.add_argument("--baseline", help="Scenario the savings are measured against (default: the one of each scenario's directory "
+                                           "skipping fewest updates, closest in its settings)")
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP, help="Seconds per interval (default: %(default)s)")
+    parser.add_argument("--plot", action="store_true", help="Draw into <root>/figures/<scenario>/%s and <root>/figures/%s"
+                                                            % (DR_FIGURE_DIR, DR_FIGURE_DIR))
+    parser.add_argument("--rescan", action="store_true", help="Rebuild the catalogue of root first")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    experiments = loadThrottling(args.root, args.scenario, args.step, args.rescan)
+    summaries = [throttling.getSummary() for throttling in experiments.values()]
+    try:
+        compareToBaseline(summaries, args.baseline)
+    except ValueError as e:
+        parser.error(str(e))
+    if len(summaries) == 0:
+        print("No experiments with publishers under %s" % args.root)
+    else:
+        print(formatSummaries(summaries))
+    print("%d experiments in %.3fs" % (len(experiments), time.perf_counter() - start))
+
+    if args.plot and len(summaries) > 0:
+        renderQueue = RenderQueue()
+        for scenario, throttling in experiments.items():
+            figureDir = os.path.join(args.root, FIGURE_DIR, scenario, DR_FIGURE_DIR)
+            os.makedirs(figureDir, exist_ok=True)
+            throttling.plot(figureDir, renderQueue)
+        figureDir = os.path.join(args.root, FIGURE_DIR, DR_FIGURE_DIR)
+        os.makedirs(figureDir, exist_ok=True)
+        plotComparison(summaries, figureDir, renderQueue)
+        renderQueue.flush()
@@ -0,0 +1,109 @@
+import json
+import os
+import re
+import warnings
+from typing import Dict, Pattern, Union, Optional, Callable
+
+import numpy as np
+
+HISTOGRAM_VALUES_FILE = "histogram_values.json"
+
+# Keys of the series each view of histogram_values.json uses
+RTT_KEYS = re.compile(r"rtt")
+STATUS_DELTA_KEYS = re.compile(r"^eng-status-delta")
+
+# histogram_values.json is one flat object of "name" : [ int, ... ], written by the game's metrics reporter.
+# Pairs are found with one regex pass and only the selected series have their numbers parsed.
+HISTOGRAM_PAIR = re.compile(rb'"((?:[^"\\]|\\.)*)"\s*:\s*\[([-\d\s,]*)\]')
+OBJECT_PUNCTUATION = b"{}, \t\r\n"
+
+Histograms = Dict[str, np.ndarray]
+# A regex searched for in each key, or a predicate on it
+KeyPattern = Union[str, Pattern, Callable[[str], bool], None]
+
+
+def compactInts(values: np.ndarray) -> np.ndarray:
+    if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max):
+        return values.astype(np.int32)
+    return values
+
+
+def selectsKey(keyPattern: KeyPattern, key: str) -> bool:
+    if keyPattern is None:
+        return True
+    if callable(keyPattern):
+        return keyPattern(key)
+    return re.search(keyPattern, key) is not None
+
+
+def parseInts(body: bytes) -> Optional[np.ndarray]:
+    if not body.strip():
+        return np.zeros(0, dtype=np.int64)
+    try:
+        with warnings.catch_warnings():
+            # Raised when parsing stops early
+            warnings.simplefilter("error", DeprecationWarning)
+            values = np.fromstring(body, dtype=np.int64, sep=",")
+    except (ValueError, DeprecationWarning):
+        return None
+    return values if len(values) == body.count(b",") + 1 else None
+
+
+def parseHistogramValuesSlow(data: bytes, keyPattern: KeyPattern = None) -> Histograms:
+    # Anything that isn't the usual flat layout of integer lists goes through the json module
+    histograms: Histograms = {}
+    for key, values in json.loads(data).items():
+        if not isinstance(values, list) or not selectsKey(keyPattern, key):
+            continue
+        values = np.array(values, dtype=np.int64 if len(values) == 0 else None)
+        histograms[key] = compactInts(values) if values.dtype.kind == "i" else values
+    return histograms
+
+
+def parseHistogramValues(data: bytes, keyPattern: KeyPattern = None) -> Histograms:
+    keys = []
+    bodies = []
+    covered = 0
+    for match in HISTOGRAM_PAIR.finditer(data):
+        # Only commas, braces and whitespace may sit between pairs, or this isn't the layout we expect
+        if data[covered:match.start()].strip(OBJECT_PUNCTUATION):
+            return parseHistogramValuesSlow(data, keyPattern)
+        covered = match.end()
+        key = match.group(1).decode()
+        if "\\" in key:
+            key = json.loads(b'"' + match.group(1) + b'"')
+        if selectsKey(keyPattern, key):
+            keys.append(key)
+            bodies.append(match.group(2) if match.group(2).strip() else b"")
+    if data[covered:].strip(OBJECT_PUNCTUATION):
+        return parseHistogramValuesSlow(data, keyPattern)
+
+    # The numbers of every selected series are parsed in one go and split back up by their counts
+    values = parseInts(b",".join(b for b in bodies if b))
+    if values is None:
+        return parseHistogramValuesSlow(data, keyPattern)
+    values = compactInts(values)
+    ends = np.cumsum([b.count(b",") + 1 if b else 0 for b in bodies])
+    return dict(zip(keys, np.split(values, ends[:-1])))
+
+
+def readHistogramValues(nodeDir: str, keyPattern: KeyPattern = None) -> Histograms:
+    with open(os.path.join(nodeDir, HISTOGRAM_VALUES_FILE), "rb") as f:
+        return parseHistogramValues(f.read(), keyPattern)
+
+
+class HistogramStore:
+    # One node's histogram_values.json, read and parsed at most once however many views select from it
+
+    def __init__(self, nodeDir: str, keyPattern: KeyPattern = None):
+        self.nodeDir = nodeDir
+        self.keyPattern = keyPattern
+        self.histograms: Histograms = None
+
+    def getHistograms(self) -> Histograms:
+        if self.histograms is None:
+            self.histograms = readHistogramValues(self.nodeDir, self.keyPattern)
+        return self.histograms
+
+    def select(self, keyPattern: KeyPattern) -> Histograms:
+        return {k: v for k, v in self.getHistograms().items() if selectsKey(keyPattern, k)}
@@ -0,0 +1,352 @@
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Iterator
+
+import numpy as np
+
+from nfd_log_parser import NFD_LOG_FILE, GAME_PREFIX, parseLineTimestamps
+from percentiles import SampleHistogram, formatPercentileTable
+from reading_utils import readLineBlocks, buildFileName
+from render_queue import RenderQueue, recordSubplots
+
+# Joins the nfd.logs of every node of an experiment on the names of the game's interests, to see how long each hop took
+# and where in the network cached content came from. Each node's events are sorted by (name, time) into sub-runs on disk
+# a few blocks at a time and all the runs are merged a chunk at a time, so memory grows with the block and chunk sizes,
+# not the nodes or the experiment.
+ARRIVAL = 0
+HIT = 1
+# An interest reaching a node (a ContentStore lookup or the Forwarder's onIncomingInterest) or being answered from its
+# ContentStore. Groups: event, name, player and object type. A hit's line carries the data's name, so hits are joined
+# on the name of the lookup logged right before them.
+FIND_EVENT = b"find "
+MATCHING_EVENT = b"matching "
+HOP_LINE = r"\[nfd\.(?:ContentStore|Forwarder)\] +(find |matching |onIncomingInterest face=\d+ interest=)(%s\S*)" % \
+           GAME_PREFIX.format(playerName="[^/]+", objectType="[^/]+")
+
+# key: 64 bit hash of the interest name, own: the node is the name's producer
+RUN_DTYPE = np.dtype([("key", "<u8"), ("time", "<f8"), ("node", "<u2"), ("kind", "u1"), ("own", "?")])
+RUN_EXTENSION = ".npy"
+# Blocks of nfd.log scanned into memory before they are sorted and spilled as a sub-run
+DEFAULT_SPILL_BLOCKS = 64
+# Rows held in memory at once while merging, shared between the runs
+DEFAULT_MERGE_ROWS = 1 << 22
+# Successive arrivals of a name further apart than this are taken to be separate requests rather than one hop
+DEFAULT_MAX_HOP_LATENCY = 1.0
+# Latencies are kept in microseconds to 3 significant digits and read back in ms
+MICROS_PER_MS = 1000.0
+LATENCY_DIGITS = 3
+
+PRODUCER = "producer"
+ROUTER = "router"
+GAME_NODE = "other game node"
+HIT_LOCATIONS = [PRODUCER, ROUTER, GAME_NODE]
+
+
+def hashNames(names: List[bytes]) -> np.ndarray:
+    # Unlike hash(), the same in every process, so runs written by different workers can be merged
+    return np.array([int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little") for name in names], dtype=np.uint64)
+
+
+class HopEventScanner:
+    # Events are buffered a few blocks at a time and spilled as sorted sub-runs, so neither the events nor the distinct
+    # names of a whole nfd.log are ever held at once
+
+    def __init__(self, node: str, nodeIndex: int, runPrefix: str, spillBlocks: int = DEFAULT_SPILL_BLOCKS):
+        self.pattern = re.compile(HOP_LINE.encode())
+        self.node = node.encode()
+        self.nodeIndex = nodeIndex
+        self.runPrefix = runPrefix
+        self.spillBlocks = spillBlocks
+        # The key of the last lookup (carried over between blocks), the arrays of the blocks fed since the last spill
+        # and the sub-runs spilled so far
+        self.lastLookup = None
+        self.timestamps: List[np.ndarray] = []
+        self.kinds: List[np.ndarray] = []
+        self.keys: List[np.ndarray] = []
+        self.own: List[np.ndarray] = []
+        self.runFiles: List[str] = []
+
+    def feed(self, block: bytes):
+        matches = list(self.pattern.finditer(block))
+        # Names are numbered within the block only and hashed once per block
+        names: Dict[bytes, int] = {}
+        kinds, nameIds, own, starts = [], [], [], []
+        # -1 stands for the lookup carried over from an earlier block, whose key goes last in blockKeys
+        lastLookup = None if self.lastLookup is None else -1
+        for m in matches:
+            event, name, player, _ = m.groups()
+            if event == MATCHING_EVENT:
+                if lastLookup is None:
+                    continue
+                kinds.append(HIT)
+                nameIds.append(lastLookup)
+            else:
+                kinds.append(ARRIVAL)
+                nameIds.append(names.setdefault(name, len(names)))
+                if event == FIND_EVENT:
+                    lastLookup = nameIds[-1]
+            own.append(player == self.node)
+            starts.append(m.start())
+        if len(starts) == 0:
+            return
+        blockKeys = np.append(hashNames(list(names)), np.uint64(self.lastLookup or 0))
+        if lastLookup is not None:
+            self.lastLookup = blockKeys[lastLookup]
+        self.kinds.append(np.array(kinds, dtype=np.uint8))
+        self.keys.append(blockKeys[np.array(nameIds, dtype=np.int64)])
+        self.own.append(np.array(own, dtype=bool))
+        self.timestamps.append(parseLineTimestamps(block, np.array(starts, dtype=np.int64)))
+        if len(self.timestamps) >= self.spillBlocks:
+            self.spill()
+
+    def scanFile(self, fileName: str):
+        for block in readLineBlocks(fileName, binary=True):
+            self.feed(block)
+
+    def spill(self):
+        # Writes the buffered events in (name key, time) order as the next sub-run
+        if len(self.timestamps) == 0:
+            return
+        run = np.empty(sum(len(t) for t in self.timestamps), dtype=RUN_DTYPE)
+        run["key"] = np.concatenate(self.keys)
+        run["time"] = np.concatenate(self.timestamps)
+        run["node"] = self.nodeIndex
+        run["kind"] = np.concatenate(self.kinds)
+        run["own"] = np.concatenate(self.own)
+        runFile = "%s-%03d%s" % (self.runPrefix, len(self.runFiles), RUN_EXTENSION)
+        np.save(runFile, run[np.lexsort((run["time"], run["key"]))])
+        self.runFiles.append(runFile)
+        self.timestamps, self.kinds, self.keys, self.own = [], [], [], []
+
+    def finish(self) -> List[str]:
+        self.spill()
+        return self.runFiles
+
+
+def writeRunTask(task: Tuple[int, str, str, str]) -> List[str]:
+    # Runs in a worker process: only the names of the sub-run files go back
+    nodeIndex, node, nodeDir, runPrefix = task
+    scanner = HopEventScanner(node, nodeIndex, runPrefix)
+    fileName = buildFileName(nodeDir, NFD_LOG_FILE)
+    try:
+        scanner.scanFile(fileName)
+    except FileNotFoundError:
+        print("Could not find file %s " % fileName)
+    return scanner.finish()
+
+
+def writeRuns(tasks: List[Tuple[int, str, str, str]], jobs: int = 1) -> List[str]:
+    # Every node's sub-runs, all merged together
+    if jobs <= 1 or len(tasks) <= 1:
+        return [runFile for task in tasks for runFile in writeRunTask(task)]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        return [runFile for runFiles in executor.map(writeRunTask, tasks) for runFile in runFiles]
+
+
+def searchRun(keys: np.ndarray, start: int, bound: np.uint64, side: str, window: int) -> int:
+    # start + np.searchsorted(keys[start:], bound, side), reading the memory mapped run a window at a time
+    # instead of copying the rest of it
+    while True:
+        end = min(start + window, len(keys))
+        found = start + int(np.searchsorted(keys[start:end], bound, side=side))
+        if found < end or end == len(keys):
+            return found
+        start, window = end, window * 2
+
+
+def mergeRuns(runFiles: List[str], mergeRows: int = DEFAULT_MERGE_ROWS) -> Iterator[np.ndarray]:
+    # Yields the rows of every run in (key, time) order, in batches that always hold all the rows of the keys in them
+    runs = [run for run in (np.load(f, mmap_mode="r") for f in runFiles) if len(run) > 0]
+    chunk = max(mergeRows // max(len(runs), 1), 1)
+    positions = [0] * len(runs)
+    while True:
+        active = [i for i, run in enumerate(runs) if positions[i] < len(run)]
+        if len(active) == 0:
+            return
+        # Keys below the smallest key any run reaches within its chunk can't turn up again later
+        chunkEnds = [runs[i]["key"][positions[i] + chunk - 1] for i in active if positions[i] + chunk <= len(runs[i])]
+        if len(chunkEnds) == 0:
+            ends = [len(runs[i]) for i in active]
+        else:
+            bound = min(chunkEnds)
+            ends = [searchRun(runs[i]["key"], positions[i], bound, "left", chunk) for i in active]
+            if all(end == positions[i] for i, end in zip(active, ends)):
+                # Every run is at the bound key itself
+                ends = [searchRun(runs[i]["key"], positions[i], bound, "right", chunk) for i in active]
+        batch = np.concatenate([runs[i][positions[i]:end] for i, end in zip(active, ends)])
+        for i, end in zip(active, ends):
+            positions[i] = end
+        yield batch[np.lexsort((batch["time"], batch["key"]))]
+
+
+class HopLatencies:
+    # Per hop latency histograms and cache hit locations, added to one merged batch at a time.
+    # A hop is an arrival of a name at a node following its latest arrival at another node.
+
+    def __init__(self, nodes: List[str], routers: List[str] = None, maxHopLatency: float = DEFAULT_MAX_HOP_LATENCY):
+        self.nodes = nodes
+        self.routers = [] if routers is None else routers
+        self.maxHopLatency = maxHopLatency
+        self.linkHistograms: Dict[Tuple[str, str], SampleHistogram] = {}
+        self.hitsByNode = np.zeros(len(nodes), dtype=np.int64)
+        self.hitsByHop = np.zeros(0, dtype=np.int64)
+        self.hitsByLocation: Counter = Counter()
+        self.numEvents = 0
+        self.numNames = 0
+        self.numNamesWithHits = 0
+        self.numHops = 0
+        self.numSlowHops = 0
+
+    def add(self, batch: np.ndarray):
+        if len(batch) == 0:
+            return
+        times, nodes, kinds = batch["time"], batch["node"].astype(np.int64), batch["kind"]
+        newName = np.ones(len(batch), dtype=bool)
+        newName[1:] = batch["key"][1:] != batch["key"][:-1]
+        nameIds = np.cumsum(newName) - 1
+        self.numEvents += len(batch)
+        self.numNames += int(nameIds[-1]) + 1
+
+        arrivals = np.flatnonzero(kinds == ARRIVAL)
+        self.addHops(nameIds[arrivals], nodes[arrivals], times[arrivals])
+        hits = np.flatnonzero(kinds == HIT)
+        if len(hits) > 0:
+            self.addHits(nameIds, nodes, times, arrivals, hits, batch["own"][hits])
+
+    def addHops(self, nameIds: np.ndarray, nodes: np.ndarray, times: np.ndarray):
+        moved = (nameIds[1:] == nameIds[:-1]) & (nodes[1:] != nodes[:-1])
+        latencies = times[1:] - times[:-1]
+        valid = moved & (latencies <= self.maxHopLatency)
+        self.numHops += int(np.count_nonzero(valid))
+        self.numSlowHops += int(np.count_nonzero(moved & ~valid))
+        # Every link's latencies together, one histogram per link
+        links = nodes[:-1][valid] * len(self.nodes) + nodes[1:][valid]
+        micros = np.round(latencies[valid] * 1e6).astype(np.int64)
+        order = np.argsort(links, kind="stable")
+        uniqueLinks, starts = np.unique(links[order], return_index=True)
+        for link, samples in zip(uniqueLinks.tolist(), np.split(micros[order], starts[1:])):
+            key = (self.nodes[link // len(self.nodes)], self.nodes[link % len(self.nodes)])
+            histogram = SampleHistogram.fromSamples(samples, MICROS_PER_MS, LATENCY_DIGITS)
+            self.linkHistograms[key] = histogram if key not in self.linkHistograms else \
+                SampleHistogram.merge([self.linkHistograms[key], histogram])
+
+    def addHits(self, nameIds: np.ndarray, nodes: np.ndarray, times: np.ndarray, arrivals: np.ndarray, hits: np.ndarray,
+                own: np.ndarray):
+        self.hitsByNode += np.bincount(nodes[hits], minlength=len(self.nodes))
+        self.numNamesWithHits += len(np.unique(nameIds[hits]))
+        isRouter = np.isin(nodes[hits], [self.nodes.index(r) for r in self.routers if r in self.nodes])
+        self.hitsByLocation.update({PRODUCER: int(np.count_nonzero(own)), ROUTER: int(np.count_nonzero(~own & isRouter)),
+                                    GAME_NODE: int(np.count_nonzero(~own & ~isRouter))})
+
+        # A hit's hop is the number of other nodes its name had reached by then: the first arrival of every (name, node),
+        # as one sorted key of name and time since the batch's first event, counted up to each hit
+        order = np.lexsort((times[arrivals], nodes[arrivals], nameIds[arrivals]))
+        firstAtNode = np.ones(len(order), dtype=bool)
+        firstAtNode[1:] = (nameIds[arrivals][order][1:] != nameIds[arrivals][order][:-1]) | \
+                          (nodes[arrivals][order][1:] != nodes[arrivals][order][:-1])
+        firsts = arrivals[order][firstAtNode]
+        elapsed = times - times.min()
+        span = elapsed.max() + 1
+        firstKeys = np.sort(nameIds[firsts] * span + elapsed[firsts])
+        nameStarts = np.searchsorted(firstKeys, nameIds[hits] * span, side="left")
+        reached = np.searchsorted(firstKeys, nameIds[hits] * span + elapsed[hits], side="right") - nameStarts
+        hops = np.maximum(reached - 1, 0)
+        counts = np.bincount(hops)
+        if len(counts) > len(self.hitsByHop):
+            self.hitsByHop = np.concatenate([self.hitsByHop, np.zeros(len(counts) - len(self.hitsByHop), dtype=np.int64)])
+        self.hitsByHop[:len(counts)] += counts
+
+    def getLatencyHistogram(self) -> SampleHistogram:
+        return SampleHistogram.merge(self.linkHistograms.values(), MICROS_PER_MS)
+
+    def getBusiestLinks(self, top: int = None) -> List[Tuple[str, str]]:
+        return sorted(self.linkHistograms, key=lambda link: -self.linkHistograms[link].getCount())[:top]
+
+    def formatReport(self, topLinks: int = 20) -> str:
+        lines = ["%d events of %d names across %d nodes: %d hops, %d more than %gs apart left out"
+                 % (self.numEvents, self.numNames, len(self.nodes), self.numHops, self.numSlowHops, self.maxHopLatency), ""]
+        rows = {"all": self.getLatencyHistogram()}
+        rows.update(("%s->%s" % link, self.linkHistograms[link]) for link in self.getBusiestLinks(topLinks))
+        lines += [formatPercentileTable("Hop latency, %d busiest links" % min(topLinks, len(self.linkHistograms)), rows, "ms"), ""]
+
+        totalHits = sum(self.hitsByLocation.values())
+        lines.append("%d cache hits for %d of %d names" % (totalHits, self.numNamesWithHits, self.numNames))
+        for location in HIT_LOCATIONS:
+            lines.append("  at %-16s %9d %6.1f%%" % (location, self.hitsByLocation[location], 100 * self.hitsByLocation[location] / max(totalHits, 1)))
+        for hop, count in enumerate(self.hitsByHop.tolist()):
+            lines.append("  %-2d hops in        %9d %6.1f%%" % (hop, count, 100 * count / max(totalHits, 1)))
+        for node, count in zip(self.nodes, self.hitsByNode.tolist()):
+            if count > 0:
+                lines.append("  at %-16s %9d" % (node, count))
+        return "\n".join(lines)
+
+    def plot(self, figureDir: str, renderQueue: RenderQueue, topLinks: int = 8):
+        f, ax = recordSubplots()
+        for label, histogram in [("all", self.getLatencyHistogram())] + \
+                                [("%s->%s" % link, self.linkHistograms[link]) for link in self.getBusiestLinks(topLinks)]:
+            values, fractions = histogram.getCdf()
+            ax.step(values, fractions, where="post", label=label)
+        ax.set_xscale("log")
+        ax.set_xlabel("Hop latency (ms)")
+        ax.set_ylabel("Fraction of hops")
+        ax.legend()
+        f.suptitle("Per hop latency, overall and on the busiest links")
+        renderQueue.submit(f, os.path.join(figureDir, "hop-latency-cdf"))
+
+        f, (hopAx, locationAx) = recordSubplots(1, 2)
+        hopAx.bar(np.arange(len(self.hitsByHop)), self.hitsByHop)
+        hopAx.set_xlabel("Hops from the first node to see the name")
+        hopAx.set_ylabel("Cache hits")
+        locationAx.bar(HIT_LOCATIONS, [self.hitsByLocation[location] for location in HIT_LOCATIONS])
+        locationAx.set_ylabel("Cache hits")
+        f.suptitle("Where interests were answered from a cache")
+        renderQueue.submit(f, os.path.join(figureDir, "cache-hit-locations"))
+
+
+def joinExperiment(experimentDir: str, routers: List[str] = None, jobs: int = 1, mergeRows: int = DEFAULT_MERGE_ROWS,
+                   maxHopLatency: float = DEFAULT_MAX_HOP_LATENCY, runDir: str = None) -> HopLatencies:
+    # Runs go to a temporary directory unless runDir is given, in which case they are left there
+    nodes = sorted(entry.name for entry in os.scandir(experimentDir) if entry.is_dir())
+    directory = tempfile.mkdtemp(prefix="ndn-hops-") if runDir is None else runDir
+    os.makedirs(directory, exist_ok=True)
+    try:
+        tasks = [(i, node, os.path.join(experimentDir, node), os.path.join(directory, node)) for i, node in enumerate(nodes)]
+        hops = HopLatencies(nodes, routers, maxHopLatency)
+        for batch in mergeRuns(writeRuns(tasks, jobs), mergeRows):
+            hops.add(batch)
+        return hops
+    finally:
+        if runDir is None:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per hop latency and cache hit locations from every nfd.log of one experiment")
+    parser.add_argument("experimentDir")
+    parser.add_argument("--routers", nargs="*", default=[], help="Nodes that only run NFD, e.g. nodeQ nodeR nodeS nodeT")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Processes the nfd.logs are scanned with")
+    parser.add_argument("--merge-rows", type=int, default=DEFAULT_MERGE_ROWS, help="Rows held in memory while merging the nodes' runs")
+    parser.add_argument("--max-hop-ms", type=float, default=DEFAULT_MAX_HOP_LATENCY * 1000,
+                        help="Arrivals of a name further apart than this are separate requests, not a hop")
+    parser.add_argument("--runs", metavar="DIR", help="Keep the sorted per node runs in DIR")
+    parser.add_argument("--plot", action="store_true", help="Draw into <dataDir>/figures/<experiment>/hops")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    hopLatencies = joinExperiment(args.experimentDir, args.routers, args.jobs, args.merge_rows, args.max_hop_ms / 1000, args.runs)
+    print(hopLatencies.formatReport())
+    if args.plot:
+        experimentDir = os.path.normpath(args.experimentDir)
+        figureDir = os.path.join(os.path.dirname(experimentDir), "figures", os.path.basename(experimentDir), "hops")
+        os.makedirs(figureDir, exist_ok=True)
+        renderQueue = RenderQueue()
+        hopLatencies.plot(figureDir, renderQueue)
+        renderQueue.close()
+    print("Joined in %.1fs" % (time.perf_counter() - start))
@@ -0,0 +1,325 @@
+import builtins
+import contextlib
+import functools
+import inspect
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Callable, Optional
+
+import comparison
+import dead_reckoning_analyzer
+import interest_rate
+import log_reader
+import nfd_log_parser
+import node_loader
+import packet_time_histograms
+import render_queue
+import status_deltas
+
+# Per stage wall time, bytes read, files opened and rows produced, recorded by wrapping the stages' functions.
+# Nothing is wrapped until enable() is called, so an uninstrumented run doesn't pay for any of it.
+PROC_IO = "/proc/self/io"
+NODE_ARGUMENTS = ["node", "nodeName"]
+# Used when a stage is only given its node's directory
+NODE_DIR_ARGUMENTS = ["nodeDir", "subscriberDir"]
+RENDER_STAGE = "render"
+
+# Parsers whose construction is a stage, and how many rows (events, samples, CSV rows...) each one ended up with
+PARSERS: Dict[type, Callable] = {
+    nfd_log_parser.NfdLogParser: lambda p: len(p.events) + len(p.forwarding),
+    packet_time_histograms.PacketTimeHistograms: lambda p: p.getSampleHistogram().getCount(),
+    status_deltas.StatusDeltasHistograms: lambda p: sum(len(sd.samples) for sd in p.statusDeltas),
+    interest_rate.InterestRatesForNode: lambda p: sum(len(getattr(r, "times", ())) for r in p.interestRatesByType.values()),
+    dead_reckoning_analyzer.DeadReckoningAnalyzer: lambda p: len(p.counters),
+    log_reader.LogReader: lambda p: len(p.errors),
+}
+
+
+# (pid, bytes of PROC_IO read by its earlier probes), so a forked worker starts its own count
+probeBytes = (os.getpid(), 0)
+
+
+def readBytesRead() -> int:
+    # Bytes this process has read through read() and friends, page cache hits included, less what reading PROC_IO took.
+    # 0 where /proc isn't available. io.open is the unpatched open, so the probe is never counted as a file a stage opened.
+    global probeBytes
+    pid, probed = probeBytes if probeBytes[0] == os.getpid() else (os.getpid(), 0)
+    try:
+        with io.open(PROC_IO, "rb") as f:
+            data = f.read()
+    except OSError:
+        return 0
+    probeBytes = (pid, probed + len(data))
+    for line in data.splitlines():
+        if line.startswith(b"rchar:"):
+            return int(line.split()[1]) - probed
+    return 0
+
+
+class Span:
+
+    def __init__(self, name: str, node: Optional[str], start: float, depth: int):
+        self.name = name
+        self.node = node
+        self.start = start
+        self.end = start
+        self.depth = depth
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.bytesRead = 0
+        self.filesOpened = 0
+        self.rows = 0
+        # Anything else worth showing in the trace, e.g. a figure's file
+        self.detail = None
+        # Of the stages nested in this one, so each stage's own share can be told apart
+        self.childTime = 0.0
+        self.childBytes = 0
+        self.childFiles = 0
+
+    def getDuration(self) -> float:
+        return self.end - self.start
+
+    def getSelfTime(self) -> float:
+        return self.getDuration() - self.childTime
+
+
+class Recorder:
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.stack: List[Span] = []
+        self.filesOpened = 0
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, node: str = None):
+        span = Span(name, node, time.perf_counter(), len(self.stack))
+        startBytes, startFiles = readBytesRead(), self.filesOpened
+        self.stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            span.bytesRead = readBytesRead() - startBytes
+            span.filesOpened = self.filesOpened - startFiles
+            self.stack.pop()
+            if self.stack:
+                parent = self.stack[-1]
+                parent.childTime += span.getDuration()
+                parent.childBytes += span.bytesRead
+                parent.childFiles += span.filesOpened
+            with self.lock:
+                self.spans.append(span)
+
+    def addSpan(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+
+    def getSummary(self) -> List[dict]:
+        byStage: Dict[str, dict] = {}
+        for span in self.spans:
+            stage = byStage.setdefault(span.name, {"stage": span.name, "calls": 0, "total": 0.0, "self": 0.0, "bytes": 0, "files": 0,
+                                                   "rows": 0})
+            stage["calls"] += 1
+            stage["total"] += span.getDuration()
+            stage["self"] += span.getSelfTime()
+            stage["bytes"] += span.bytesRead - span.childBytes
+            stage["files"] += span.filesOpened - span.childFiles
+            stage["rows"] += span.rows
+        return sorted(byStage.values(), key=lambda s: -s["self"])
+
+    def getNodeSummary(self) -> List[dict]:
+        byNode: Dict[str, dict] = {}
+        for span in self.spans:
+            if span.node is None:
+                continue
+            node = byNode.setdefault(span.node, {"node": span.node, "stages": 0, "total": 0.0, "bytes": 0, "files": 0, "rows": 0})
+            node["stages"] += 1
+            node["total"] += span.getSelfTime()
+            node["bytes"] += span.bytesRead - span.childBytes
+            node["files"] += span.filesOpened - span.childFiles
+            node["rows"] += span.rows
+        return sorted(byNode.values(), key=lambda n: -n["total"])
+
+    def formatSummary(self, topNodes: int = 20) -> str:
+        lines = ["%-44s %7s %9s %9s %9s %7s %10s" % ("stage", "calls", "total (s)", "self (s)", "MB read", "files", "rows")]
+        for s in self.getSummary():
+            lines.append("%-44s %7d %9.3f %9.3f %9.2f %7d %10d" % (s["stage"][-44:], s["calls"], s["total"], s["self"], s["bytes"] / 1e6,
+                                                                 s["files"], s["rows"]))
+        nodes = self.getNodeSummary()
+        if len(nodes) > 0:
+            lines += ["", "%-20s %7s %9s %9s %7s %10s" % ("slowest nodes", "stages", "self (s)", "MB read", "files", "rows")]
+            for n in nodes[:topNodes]:
+                lines.append("%-20s %7d %9.3f %9.2f %7d %10d" % (n["node"], n["stages"], n["total"], n["bytes"] / 1e6, n["files"], n["rows"]))
+        return "\n".join(lines)
+
+    def writeChromeTrace(self, fileName: str):
+        # Opens in chrome://tracing or https://ui.perfetto.dev: one complete ("X") event per stage, per process and thread
+        events = [{"name": span.name, "cat": "stage", "ph": "X", "pid": span.pid, "tid": span.tid,
+                   "ts": (span.start - self.origin) * 1e6, "dur": span.getDuration() * 1e6,
+                   "args": {"node": span.node, "detail": span.detail, "bytesRead": span.bytesRead, "filesOpened": span.filesOpened, "rows": span.rows}}
+                  for span in self.spans]
+        with io.open(fileName, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+recorder: Optional[Recorder] = None
+# (owner, attribute name, original) of everything enable() replaced
+patched: List[tuple] = []
+
+
+def isEnabled() -> bool:
+    return recorder is not None
+
+
+def patch(owner, name: str, replacement):
+    patched.append((owner, name, owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)))
+    setattr(owner, name, replacement)
+
+
+def getNodeArgument(function: Callable, args: tuple, kwargs: dict) -> Optional[str]:
+    try:
+        bound = inspect.signature(function).bind(*args, **kwargs)
+    except TypeError:
+        return None
+    for name in NODE_ARGUMENTS:
+        if isinstance(bound.arguments.get(name), str):
+            return bound.arguments[name]
+    for name in NODE_DIR_ARGUMENTS:
+        if isinstance(bound.arguments.get(name), str):
+            return os.path.basename(os.path.normpath(bound.arguments[name]))
+    return None
+
+
+def wrapStage(function: Callable, name: str, countRows: Callable = None, rowsOf: Callable = None) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if recorder is None:
+            return function(*args, **kwargs)
+        with recorder.stage(name, getNodeArgument(function, args, kwargs)) as span:
+            result = function(*args, **kwargs)
+            if countRows is not None:
+                span.rows = countRows(args[0])
+            elif rowsOf is not None:
+                span.rows = rowsOf(result)
+            return result
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def instrumentClass(cls: type, methods: List[str] = None):
+    # Every public method defined on the class itself becomes a stage named Class.method
+    methods = [n for n, v in vars(cls).items() if inspect.isfunction(v) and not n.startswith("_")] if methods is None else methods
+    for name in methods:
+        patch(cls, name, wrapStage(vars(cls)[name], "%s.%s" % (cls.__name__, name)))
+
+
+def countingOpen(*args, **kwargs):
+    if recorder is not None:
+        recorder.filesOpened += 1
+    return countingOpen.__wrapped__(*args, **kwargs)
+
+
+countingOpen.__wrapped__ = builtins.open
+
+
+def recordedLoadPartsTask(task: node_loader.LoadTask) -> (list, List[Span]):
+    # Runs in a loadNodes worker: its stages are recorded there and sent back with the parsed parts
+    global recorder
+    if recorder is None:
+        # A spawned worker starts without any of the wrappers
+        enable()
+    else:
+        # A forked one starts with a copy of the parent's recorder
+        recorder = Recorder()
+    return node_loader.loadPartsTask(task), recorder.spans
+
+
+def runLoadTasks(tasks: List[node_loader.LoadTask], jobs: int = 1) -> list:
+    if jobs <= 1 or len(tasks) <= 1:
+        return [node_loader.loadPartsTask(task) for task in tasks]
+    results = []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        for result, spans in executor.map(recordedLoadPartsTask, tasks):
+            for span in spans:
+                recorder.addSpan(span)
+            results.append(result)
+    return results
+
+
+def submitRecorded(queue: render_queue.RenderQueue, figure, fileBase: str):
+    # Drawing happens in the render pool, so a figure's render stage runs from its submission until its files are written
+    active = recorder
+    pendingBefore = queue.pending.get(fileBase)
+    span = Span(RENDER_STAGE, None, time.perf_counter(), len(active.stack))
+    span.detail = fileBase
+    submitRecorded.__wrapped__(queue, figure, fileBase)
+    future = queue.pending.get(fileBase)
+    if future is not None and future is not pendingBefore:
+        def done(_):
+            span.end = time.perf_counter()
+            active.addSpan(span)
+        future.add_done_callback(done)
+    elif queue.executor is None:
+        # Drawn right here (or skipped as unchanged) in submit
+        span.end = time.perf_counter()
+        active.addSpan(span)
+
+
+def enable(analysisClass: type = None) -> Recorder:
+    global recorder
+    if recorder is not None:
+        return recorder
+    recorder = Recorder()
+    patch(builtins, "open", countingOpen)
+    for cls, countRows in PARSERS.items():
+        patch(cls, "__init__", wrapStage(vars(cls)["__init__"], cls.__name__, countRows=countRows))
+    patch(node_loader, "readInterestsCounters", wrapStage(node_loader.readInterestsCounters, "readInterestsCounters",
+                                                          rowsOf=lambda counters: sum(len(c) for c in counters.values())))
+    patch(node_loader, "runLoadTasks", runLoadTasks)
+    instrumentClass(comparison.ExperimentComparison, ["loadScenario", "getTable"])
+    submitRecorded.__wrapped__ = render_queue.RenderQueue.submit
+    patch(render_queue.RenderQueue, "submit", submitRecorded)
+    if analysisClass is not None:
+        instrumentClass(analysisClass)
+    return recorder
+
+
+def disable():
+    global recorder
+    while patched:
+        owner, name, original = patched.pop()
+        setattr(owner, name, original)
+    recorder = None
+
+
+@contextlib.contextmanager
+def instrumented(analysisClass: type = None, summary: bool = True, traceFile: str = None, pstatsFile: str = None, out=sys.stderr):
+    # Records the stages of everything run inside it, then prints the summary table and writes the requested dumps
+    profiler = None
+    if pstatsFile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+    active = enable(analysisClass) if summary or traceFile is not None else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield active
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(pstatsFile)
+            print("Wrote cProfile stats to %s (python -m pstats %s)" % (pstatsFile, pstatsFile), file=out)
+        if active is not None:
+            if summary:
+                print("\n" + active.formatSummary(), file=out)
+            if traceFile is not None:
+                active.writeChromeTrace(traceFile)
+                print("Wrote Chrome trace to %s" % traceFile, file=out)
+            disable()
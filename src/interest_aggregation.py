@@ -1,26 +1,54 @@
 import os
+import re
 from typing import List, Dict
 
+import numpy as np
+
 from interest_rate import InterestRatesForNode
-from reading_utils import readCsvSafe
+from metric_csv import readLastMetricRowSafe, COUNTER
 
 fileNameFormat = "sub-{objectType}-interestscounter-{nodeName}.csv"
+fileNamePattern = re.compile(r"sub-(?P<objectType>\w+)-interestscounter-(?P<nodeName>\w+)\.csv$")
+
+# objectType -> publisher -> interests expressed by the subscriber owning the directory
+InterestsCounters = Dict[str, Dict[str, int]]
+
+
+def readInterestsCounters(subscriberDir: str, tables: Dict[str, np.ndarray] = None) -> InterestsCounters:
+    # tables maps file names to already parsed counter CSVs, in which case the directory isn't read
+    counters: InterestsCounters = {}
+    for fileName in (os.listdir(subscriberDir) if tables is None else tables):
+        match = fileNamePattern.match(fileName)
+        if match is None:
+            continue
+        if tables is None:
+            lastRow = readLastMetricRowSafe(os.path.join(subscriberDir, fileName), COUNTER)
+        else:
+            lastRow = tables[fileName][-1] if len(tables[fileName]) > 0 else None
+        count = 0 if lastRow is None else int(lastRow["count"])
+        counters.setdefault(match.group("objectType"), {})[match.group("nodeName")] = count
+    return counters
+
 
 class InterestAggregation:
 
-    def __init__(self, myNode: str, myNodeDir: str, nodes: List[str], dataDir: str, routers: List[str] = None, objectType: str = 'status'):
+    def __init__(self, myNode: str, myNodeDir: str, nodes: List[str], dataDir: str, routers: List[str] = None, objectType: str = 'status',
+                 pubInterestRate: InterestRatesForNode = None, subInterestsCounterByNode: Dict[str, int] = None):
         self.myNode = myNode
-        self.pubInterestRate = InterestRatesForNode(myNodeDir, myNode)
+        self.pubInterestRate = InterestRatesForNode(myNodeDir, myNode) if pubInterestRate is None else pubInterestRate
         self.subInterestsCounterByNode: Dict[str, int] = dict()
         self.objectType = objectType
+        if subInterestsCounterByNode is not None:
+            self.subInterestsCounterByNode = subInterestsCounterByNode
+            return
         for node in [n for n in nodes if n != myNode and n not in ([] if routers == None else routers)]:
             fileName = fileNameFormat.format(objectType=objectType, nodeName=myNode)
             fullFile = os.path.join(dataDir, node, fileName)
-            csvData = readCsvSafe(fullFile)
-            if csvData == None:
+            lastRow = readLastMetricRowSafe(fullFile, COUNTER)
+            if lastRow is None:
                 self.subInterestsCounterByNode[node] = 0
             else:
-                self.subInterestsCounterByNode[node] = int(csvData[-1][1])
+                self.subInterestsCounterByNode[node] = int(lastRow["count"])
 
     def getDifference(self) -> (int, int):
         totalInterestsExpressed: int = sum(self.subInterestsCounterByNode.values())
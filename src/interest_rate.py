@@ -1,7 +1,9 @@
 import os
-from typing import Dict, List
+from typing import Dict
 
-from reading_utils import readCsvSafe
+import numpy as np
+
+from metric_csv import readMetricCsvSafe, readLastMetricRowSafe, METER
 
 fileNameFormat = "pub-interest-rate-{nodeName}-{objectType}-sync.csv"
 rateFormatString: str = "{type}\tcount: {count}\t rate: {meanRate} / sec"
@@ -10,13 +12,20 @@ objectTypes = ["status", "projectiles", "blocks"]
 
 class InterestRatesForNode:
 
-    def __init__(self, directory, nodeName):
+    def __init__(self, directory, nodeName, withSeries: bool = True, metricsByType: Dict[str, np.ndarray] = None):
         self.nodeName: str = nodeName
         self.interestRatesByType: Dict[str, Rate] = dict()
 
         for objectType in objectTypes:
             fileName = os.path.join(directory, fileNameFormat.format(nodeName=nodeName, objectType=objectType))
-            self.interestRatesByType[objectType] = Rate(readCsvSafe(fileName), objectType)
+            if metricsByType is not None:
+                metrics = metricsByType[objectType]
+                self.interestRatesByType[objectType] = Rate(metrics[-1], objectType, metrics if withSeries else None)
+            elif withSeries:
+                metrics = readMetricCsvSafe(fileName, METER)
+                self.interestRatesByType[objectType] = Rate(metrics[-1], objectType, metrics)
+            else:
+                self.interestRatesByType[objectType] = Rate(readLastMetricRowSafe(fileName, METER), objectType)
 
     def getInterestRatesByType(self):
         return self.interestRatesByType
@@ -40,19 +49,22 @@ class InterestRatesForNode:
 
 class Rate:
 
-    def __init__(self, csvData: List[List], objectType: str):
-        csvData = csvData[1:]
-        self.finalMeanRate: float = round(float(csvData[-1][2]), 2)
-        self.totalInterestsSeen: int = int(csvData[-1][1])
-        self.meanRateOverTime: Dict[int, float] = {int(row[0]): float(row[2]) for row in csvData}
+    def __init__(self, lastRow: np.void, objectType: str, metrics: np.ndarray = None):
+        self.finalMeanRate: float = round(float(lastRow["mean_rate"]), 2)
+        self.totalInterestsSeen: int = int(lastRow["count"])
+        # The first report is taken before the game has settled so it is left out of the series
+        metrics = lastRow.reshape(1)[:0] if metrics is None else metrics[1:]
+        self.times: np.ndarray = metrics["t"]
+        self.meanRates: np.ndarray = metrics["mean_rate"]
+        self.counts: np.ndarray = metrics["count"]
         self.objectType = objectType
 
     def getFinalMeanRate(self, type):
         print(rateFormatString.format(type=type, meanRate=self.finalMeanRate))
         return self.finalMeanRate
 
-    def getMeanRateOverTime(self):
-        return self.meanRateOverTime
+    def getMeanRateOverTime(self) -> Dict[int, float]:
+        return dict(zip(self.times.tolist(), self.meanRates.tolist()))
 
     def plotOverTime(self, ax, nodeName: str):
-        ax.plot(self.meanRateOverTime.keys(), self.meanRateOverTime.values(), label=nodeName)
+        ax.plot(self.times, self.meanRates, label=nodeName)
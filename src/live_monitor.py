@@ -0,0 +1,289 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import re
+import struct
+import time
+from typing import Dict, Iterator, List, Set, Optional
+
+import numpy as np
+
+from interest_rate import fileNameFormat as INTEREST_RATE_FILE_FORMAT, objectTypes
+from log_reader import LogErrorScanner, LogError, LOG_FILE, formatErrorReport
+from metric_csv import readLastMetricRow, METER, TIMER
+from nfd_log_parser import CacheLineScanner, NFD_LOG_FILE
+from reading_utils import CHUNK_SIZE
+
+DEFAULT_REFRESH = 5.0
+SUMMARY_OBJECT_TYPE = "status"
+RTT_FILE_PATTERN = re.compile(r"sub-(?P<objectType>\w+)-rtt-(?P<nodeName>\w+)\.csv$")
+# Events arriving within this long of each other are handled together
+DEBOUNCE = 0.2
+
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class FileTail:
+
+    def __init__(self, fileName: str):
+        self.fileName = fileName
+        self.offset = 0
+        self.truncated = False
+
+    def readNew(self, chunkSize: int = CHUNK_SIZE) -> Iterator[bytes]:
+        # Yields the complete lines appended since the last call in blocks of about chunkSize, so a large backlog
+        # is never held at once; a partial last line is left for the next call
+        try:
+            size = os.path.getsize(self.fileName)
+        except FileNotFoundError:
+            return iter(())
+        self.truncated = size < self.offset
+        if self.truncated:
+            self.offset = 0
+        if size == self.offset:
+            return iter(())
+        return self.readBlocks(size, chunkSize)
+
+    def readBlocks(self, size: int, chunkSize: int) -> Iterator[bytes]:
+        with open(self.fileName, "rb") as f:
+            f.seek(self.offset)
+            remainder = b""
+            while self.offset + len(remainder) < size:
+                chunk = f.read(min(chunkSize, size - self.offset - len(remainder)))
+                if not chunk:
+                    break
+                end = chunk.rfind(b"\n") + 1
+                if end == 0:
+                    remainder += chunk
+                    continue
+                block = remainder + chunk[:end]
+                remainder = chunk[end:]
+                self.offset += len(block)
+                yield block
+
+
+class NodeMonitor:
+
+    def __init__(self, node: str, nodeDir: str):
+        self.node = node
+        self.nodeDir = nodeDir
+        self.nfdLog = FileTail(os.path.join(nodeDir, NFD_LOG_FILE))
+        self.cacheScanner = CacheLineScanner()
+        self.javaLog = FileTail(os.path.join(nodeDir, LOG_FILE))
+        self.errorScanner = LogErrorScanner(node)
+        self.reportedErrors = 0
+        # Latest CsvReporter rows: objectType -> meter row, and objectType -> publisher -> timer row
+        self.interestRates: Dict[str, np.void] = {}
+        self.rtts: Dict[str, Dict[str, np.void]] = {}
+        self.csvSizes: Dict[str, int] = {}
+        self.interestRateFiles = {INTEREST_RATE_FILE_FORMAT.format(nodeName=node, objectType=o): o for o in objectTypes}
+
+    def update(self, fileNames: Set[str] = None):
+        # Only the named files are looked at; None means every file in the node directory
+        if fileNames is None:
+            try:
+                fileNames = set(os.listdir(self.nodeDir))
+            except FileNotFoundError:
+                return
+        for fileName in fileNames:
+            if fileName == NFD_LOG_FILE:
+                self.updateCacheRates()
+            elif fileName == LOG_FILE:
+                self.updateErrors()
+            elif fileName in self.interestRateFiles:
+                row = self.readChangedRow(fileName, METER)
+                if row is not None:
+                    self.interestRates[self.interestRateFiles[fileName]] = row
+            else:
+                match = RTT_FILE_PATTERN.match(fileName)
+                if match is None:
+                    continue
+                row = self.readChangedRow(fileName, TIMER)
+                if row is not None:
+                    self.rtts.setdefault(match.group("objectType"), {})[match.group("nodeName")] = row
+
+    def updateCacheRates(self):
+        blocks = self.nfdLog.readNew()
+        if self.nfdLog.truncated:
+            self.cacheScanner = CacheLineScanner()
+        for block in blocks:
+            self.cacheScanner.feed(block)
+
+    def updateErrors(self):
+        blocks = self.javaLog.readNew()
+        if self.javaLog.truncated:
+            self.errorScanner = LogErrorScanner(self.node)
+            self.reportedErrors = 0
+        for block in blocks:
+            self.errorScanner.feed(block)
+
+    def readChangedRow(self, fileName: str, schema) -> Optional[np.void]:
+        fullFile = os.path.join(self.nodeDir, fileName)
+        try:
+            size = os.path.getsize(fullFile)
+        except FileNotFoundError:
+            return None
+        if self.csvSizes.get(fileName) == size:
+            return None
+        self.csvSizes[fileName] = size
+        try:
+            return readLastMetricRow(fullFile, schema)
+        except ValueError:
+            # Nothing but the header has been written yet
+            return None
+
+    def takeNewErrors(self) -> List[LogError]:
+        errors = self.errorScanner.errors[self.reportedErrors:]
+        self.reportedErrors = len(self.errorScanner.errors)
+        return errors
+
+    def getSummary(self, objectType: str = SUMMARY_OBJECT_TYPE) -> List[str]:
+        # Only objectType's lines, like the interest rate and RTT columns
+        cacheRates, _, _ = self.cacheScanner.getCacheRates()
+        byPlayer = [rates[objectType] for rates in cacheRates.values() if objectType in rates]
+        lookups, hits = sum(r.lookups for r in byPlayer), sum(r.hits for r in byPlayer)
+        hitRate = "-" if lookups == 0 else "%.1f" % (100 * hits / lookups)
+        rate = self.interestRates.get(objectType)
+        rtts = list(self.rtts.get(objectType, {}).values())
+        rttColumns = ["-"] * 3
+        if len(rtts) > 0:
+            # Median of the publishers' p50s, worst of their tail percentiles
+            rttColumns = ["%.0f" % np.median([r["p50"] for r in rtts]), "%.0f" % max(r["p95"] for r in rtts), "%.0f" % max(r["p99"] for r in rtts)]
+        return [self.node, str(lookups), str(hits), hitRate,
+                "-" if rate is None else str(rate["count"]), "-" if rate is None else "%.2f" % rate["m1_rate"],
+                *rttColumns, str(len(self.errorScanner.errors))]
+
+
+SUMMARY_HEADER = ["node", "lookups", "hits", "hit %", "interests", "m1 rate", "rtt p50", "rtt p95", "rtt p99", "errors"]
+
+
+def formatSummary(monitors: List[NodeMonitor], objectType: str = SUMMARY_OBJECT_TYPE) -> str:
+    rows = [SUMMARY_HEADER] + [m.getSummary(objectType) for m in monitors]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(SUMMARY_HEADER))]
+    lines = ["[%s] %s, %d nodes" % (time.strftime("%H:%M:%S"), objectType, len(monitors))]
+    lines += ["  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+class InotifyWatcher:
+    # Linux only: one watch per node directory instead of stat-ing every file on a timer
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirsByWatch: Dict[int, str] = {}
+        self.changes: Dict[str, Set[str]] = {}
+        self.changed = asyncio.Event()
+
+    def watch(self, directory: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_MODIFY | IN_CREATE | IN_MOVED_TO)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for %s" % directory)
+        self.dirsByWatch[wd] = directory
+
+    def start(self):
+        asyncio.get_running_loop().add_reader(self.fd, self.readEvents)
+
+    def readEvents(self):
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, nameLength = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + nameLength].rstrip(b"\0").decode()
+            offset += nameLength
+            if wd in self.dirsByWatch and name:
+                self.changes.setdefault(self.dirsByWatch[wd], set()).add(name)
+        self.changed.set()
+
+    async def waitForChanges(self, timeout: float) -> Dict[str, Set[str]]:
+        try:
+            await asyncio.wait_for(self.changed.wait(), timeout)
+            await asyncio.sleep(DEBOUNCE)
+        except asyncio.TimeoutError:
+            pass
+        changes, self.changes = self.changes, {}
+        self.changed.clear()
+        return changes
+
+    def close(self):
+        asyncio.get_running_loop().remove_reader(self.fd)
+        os.close(self.fd)
+
+
+class ExperimentMonitor:
+
+    def __init__(self, experimentDirs: List[str], objectType: str = SUMMARY_OBJECT_TYPE):
+        self.experimentDirs = experimentDirs
+        self.objectType = objectType
+        self.monitors: Dict[str, NodeMonitor] = {}
+
+    def discoverNodes(self) -> List[NodeMonitor]:
+        # Nodes can start writing after we do, so this is re-run on every refresh
+        added = []
+        for experimentDir in self.experimentDirs:
+            if not os.path.isdir(experimentDir):
+                continue
+            for entry in os.scandir(experimentDir):
+                if not entry.is_dir() or entry.path in self.monitors:
+                    continue
+                label = entry.name if len(self.experimentDirs) == 1 else "%s/%s" % (os.path.basename(experimentDir), entry.name)
+                self.monitors[entry.path] = NodeMonitor(label, entry.path)
+                added.append(self.monitors[entry.path])
+        return added
+
+    def printSummary(self):
+        monitors = sorted(self.monitors.values(), key=lambda m: m.node)
+        newErrors = [e for m in monitors for e in m.takeNewErrors()]
+        if len(newErrors) > 0:
+            print(formatErrorReport(newErrors))
+        print(formatSummary(monitors, self.objectType) + "\n", flush=True)
+
+    async def follow(self, refresh: float = DEFAULT_REFRESH):
+        try:
+            watcher = InotifyWatcher()
+        except (OSError, AttributeError, TypeError):
+            # No inotify (not Linux): fall back to listing each node directory once per refresh
+            watcher = None
+        if watcher is not None:
+            watcher.start()
+
+        try:
+            nextSummary = time.monotonic()
+            while True:
+                for monitor in self.discoverNodes():
+                    if watcher is not None:
+                        watcher.watch(monitor.nodeDir)
+                    monitor.update()
+
+                timeout = max(0.0, nextSummary - time.monotonic())
+                if watcher is None:
+                    await asyncio.sleep(timeout)
+                    for monitor in self.monitors.values():
+                        monitor.update()
+                else:
+                    for nodeDir, fileNames in (await watcher.waitForChanges(timeout)).items():
+                        self.monitors[nodeDir].update(fileNames)
+
+                if time.monotonic() >= nextSummary:
+                    self.printSummary()
+                    nextSummary = time.monotonic() + refresh
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+
+def followExperiments(experimentDirs: List[str], refresh: float = DEFAULT_REFRESH, objectType: str = SUMMARY_OBJECT_TYPE):
+    try:
+        asyncio.run(ExperimentMonitor(experimentDirs, objectType).follow(refresh))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,205 @@
+import os
+import re
+import warnings
+from typing import List, Tuple, Dict, Optional
+
+import numpy as np
+
+from reading_utils import readLastCompleteLine
+
+# Schemas of the CSVs written by the game's Dropwizard CsvReporter, keyed on their header line.
+# Columns after the numeric ones (the meters' rate_unit) are text and dropped.
+I8 = np.int64
+F8 = np.float64
+
+
+class MetricSchema:
+
+    def __init__(self, name: str, columns: List[Tuple[str, type]], textColumns: List[str] = None):
+        self.name = name
+        self.columns = columns
+        self.textColumns = [] if textColumns is None else textColumns
+        self.header = ",".join([c for c, _ in columns] + self.textColumns)
+        self.dtype = np.dtype([(c, t) for c, t in columns])
+        # Strips the trailing text fields of every line in one pass
+        self.textPattern = re.compile(rb"(?:,[^,\n]*){%d}$" % len(self.textColumns), re.MULTILINE) if self.textColumns else None
+
+    def numColumns(self) -> int:
+        return len(self.columns)
+
+
+TIMER = MetricSchema("timer", [("t", I8), ("count", I8), ("max", I8), ("mean", F8), ("min", I8), ("stddev", F8),
+                               ("p50", F8), ("p75", F8), ("p95", F8), ("p98", F8), ("p99", F8), ("p999", F8)])
+METER = MetricSchema("meter", [("t", I8), ("count", I8), ("mean_rate", F8), ("m1_rate", F8), ("m5_rate", F8), ("m15_rate", F8)],
+                     ["rate_unit"])
+COUNTER = MetricSchema("counter", [("t", I8), ("count", I8)])
+GAUGE = MetricSchema("gauge", [("t", I8), ("value", F8)])
+
+SCHEMAS_BY_HEADER: Dict[str, MetricSchema] = {s.header: s for s in [TIMER, METER, COUNTER, GAUGE]}
+
+NEWLINES = re.compile(rb"[\r\n]+")
+# Files up to this size are read whole for a time range; larger ones are bisected on byte offsets for its first row
+RANGE_BLOCK_SIZE = 64 * 1024
+
+# Metric CSV and histogram series names -> (family, objectType, peer). The peer is the other node a subscriber's series is about.
+SERIES_PATTERNS = [
+    re.compile(r"^(?P<family>pub-interest-rate|pub-update-percentage)-(?P<peer>\w+?)-(?P<objectType>[a-z]+)-sync$"),
+    re.compile(r"^sub-(?P<objectType>[a-z]+)-(?P<family>rtt|interestscounter)-(?P<peer>\w+)$"),
+    re.compile(r"^eng-(?P<objectType>[a-z]+)-(?P<family>delta)-(?P<peer>\w+)$"),
+    re.compile(r"^(?P<family>packet-size)-(?P<objectType>[a-z]+)$"),
+    re.compile(r"^(?P<family>dr-counter)-\w+$"),
+]
+
+
+def parseSeriesName(name: str) -> Tuple[str, Optional[str], Optional[str]]:
+    for pattern in SERIES_PATTERNS:
+        match = pattern.match(name)
+        if match is not None:
+            groups = match.groupdict()
+            return groups["family"], groups.get("objectType"), groups.get("peer")
+    return name, None, None
+
+
+def getSchema(header: str) -> MetricSchema:
+    try:
+        return SCHEMAS_BY_HEADER[header]
+    except KeyError:
+        raise ValueError("Unknown metric CSV header: %s" % header)
+
+
+def toStructured(values: np.ndarray, schema: MetricSchema) -> np.ndarray:
+    values = values.reshape(-1, schema.numColumns())
+    table = np.empty(len(values), dtype=schema.dtype)
+    for i, (column, _) in enumerate(schema.columns):
+        table[column] = values[:, i]
+    return table
+
+
+def parseRowsSlow(body: bytes, schema: MetricSchema) -> np.ndarray:
+    # Only used when a file has malformed rows in the middle: keeps the rows with the expected field count
+    rows = [line.split(b",") for line in body.split(b"\n") if line.count(b",") == schema.numColumns() - 1]
+    values = []
+    for row in rows:
+        try:
+            values.append([float(v) for v in row])
+        except ValueError:
+            continue
+    return np.array(values, dtype=F8).reshape(-1, schema.numColumns())
+
+
+def parseMetricCsv(data: bytes, schema: MetricSchema = None) -> np.ndarray:
+    data = data.replace(b"\0", b"")
+    headerEnd = data.find(b"\n")
+    if headerEnd == -1:
+        header, body = data, b""
+    else:
+        # A last line without its newline was cut short by a crashed node, so it is dropped
+        header, body = data[:headerEnd], data[headerEnd + 1:data.rfind(b"\n") + 1]
+    schema = getSchema(header.strip().decode()) if schema is None else schema
+    if schema.textPattern is not None:
+        body = schema.textPattern.sub(b"", body)
+
+    try:
+        with warnings.catch_warnings():
+            # Older NumPy only warns when it stops parsing early
+            warnings.simplefilter("error", DeprecationWarning)
+            values = np.fromstring(NEWLINES.sub(b",", body).strip(b","), dtype=F8, sep=",")
+        if len(values) % schema.numColumns() != 0:
+            raise ValueError("Ragged metric CSV")
+    except (ValueError, DeprecationWarning):
+        values = parseRowsSlow(body, schema)
+    return toStructured(values, schema)
+
+
+def readMetricCsv(fileName: str, schema: MetricSchema = None) -> np.ndarray:
+    with open(fileName, "rb") as f:
+        return parseMetricCsv(f.read(), schema)
+
+
+def parseRowTime(line: bytes) -> Optional[int]:
+    try:
+        return int(line.replace(b"\0", b"").split(b",", 1)[0])
+    except ValueError:
+        return None
+
+
+def findRowOffset(f, lo: int, hi: int, t: int) -> int:
+    # A line start at or before the first row with time >= t, lo being a line start. Unparseable rows keep the search left of them.
+    while hi - lo > RANGE_BLOCK_SIZE:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()
+        rowTime = parseRowTime(f.readline())
+        if rowTime is not None and rowTime < t and f.tell() <= hi:
+            lo = f.tell()
+        else:
+            hi = mid
+    return lo
+
+
+def selectTimeRange(table: np.ndarray, start: int = None, end: int = None) -> np.ndarray:
+    if start is not None:
+        table = table[table["t"] >= start]
+    if end is not None:
+        table = table[table["t"] <= end]
+    return table
+
+
+def readMetricCsvRange(fileName: str, schema: MetricSchema = None, start: int = None, end: int = None) -> np.ndarray:
+    # The rows with start <= t <= end. The reporter appends rows in time order, so only the blocks from the first row of the
+    # range up to the one holding a row past its end are read and parsed.
+    with open(fileName, "rb") as f:
+        header = f.readline()
+        size = f.seek(0, os.SEEK_END)
+        f.seek(len(header) if start is None else findRowOffset(f, len(header), size, start))
+        blocks = [header]
+        while True:
+            # Every block ends on a line boundary, so its last line is a whole row
+            block = f.read(RANGE_BLOCK_SIZE)
+            if not block:
+                break
+            block += f.readline()
+            blocks.append(block)
+            if end is not None:
+                lastLineEnd = block.rstrip(b"\0").rfind(b"\n")
+                rowTime = parseRowTime(block[block.rfind(b"\n", 0, lastLineEnd) + 1:lastLineEnd]) if lastLineEnd != -1 else None
+                if rowTime is not None and rowTime > end:
+                    break
+    return selectTimeRange(parseMetricCsv(b"".join(blocks), schema), start, end)
+
+
+def readMetricCsvSafe(fileName: str, schema: MetricSchema = None) -> np.ndarray:
+    try:
+        return readMetricCsv(fileName, schema)
+    except FileNotFoundError:
+        print("Could not find file %s" % fileName)
+
+
+def parseMetricRow(line: bytes, schema: MetricSchema) -> Optional[np.void]:
+    fields = line.split(b",")
+    if len(fields) != schema.numColumns() + len(schema.textColumns):
+        return None
+    try:
+        values = np.array([float(v) for v in fields[:schema.numColumns()]], dtype=F8)
+    except ValueError:
+        return None
+    return toStructured(values, schema)[0]
+
+
+def readLastMetricRow(fileName: str, schema: MetricSchema) -> np.void:
+    # Only the end of the file is read; if its last record can't be parsed the whole file is, and its last good row used
+    line = readLastCompleteLine(fileName)
+    row = None if line is None else parseMetricRow(line, schema)
+    if row is None:
+        table = readMetricCsv(fileName, schema)
+        if len(table) == 0:
+            raise ValueError("No complete rows in %s" % fileName)
+        row = table[-1]
+    return row
+
+
+def readLastMetricRowSafe(fileName: str, schema: MetricSchema) -> Optional[np.void]:
+    try:
+        return readLastMetricRow(fileName, schema)
+    except FileNotFoundError:
+        print("Could not find file %s" % fileName)
@@ -1,13 +1,88 @@
 import re
-from collections import defaultdict, OrderedDict
-from typing import List, Dict
+from collections import defaultdict, OrderedDict, Counter
+from functools import lru_cache
+from typing import Dict, Union, List, Tuple
 
-from reading_utils import readFileSafe
+import numpy as np
+
+from reading_utils import readLineBlocks, buildFileName
 
 NFD_LOG_FILE = "nfd.log"
+CONTENT_STORE_TAG = "[nfd.ContentStore]"
 GAME_PREFIX = "/com/stefanolupo/ndngame/0/({playerName})/({objectType})/sync"
-CACHE_LOOKUP_LINE = "find " + GAME_PREFIX
-CACHE_HIT_LINE = "matching " + GAME_PREFIX
+CACHE_LOOKUP = "find"
+CACHE_HIT = "matching"
+# Lookups and hits in one pass: group 1 is the event kind, groups 2 and 3 the player and object type.
+# The tag is the pattern's literal prefix so the regex engine skips every other line with a substring scan.
+CACHE_LINE = re.escape(CONTENT_STORE_TAG) + " +(%s|%s) " % (CACHE_LOOKUP, CACHE_HIT) + GAME_PREFIX
+
+# Event kinds as stored in CacheEvents.kinds
+LOOKUP_EVENT = 0
+HIT_EVENT = 1
+EVENT_KINDS = {CACHE_LOOKUP: LOOKUP_EVENT, CACHE_HIT: HIT_EVENT}
+
+# NFD prefixes every line with its time as <10 digit seconds>.<6 digit microseconds>
+TIMESTAMP_WIDTH = 17
+TIMESTAMP_POINT = 10
+TIMESTAMP_WEIGHTS = np.concatenate([10.0 ** np.arange(9, -1, -1), [0], 10.0 ** -np.arange(1, 7)])
+
+DEFAULT_BIN_WIDTH = 1.0
+
+# Forwarder pipeline events, only logged when NFD runs with the Forwarder module at DEBUG (log default_level DEBUG in nfd.conf).
+# NFD 0.6 writes them as: <event> [face=<face id> ]<interest|data|nack>=<name>[~<nack reason>][ <details>]
+FORWARDER_TAG = "[nfd.Forwarder]"
+INCOMING_INTEREST = "onIncomingInterest"
+INTEREST_LOOP = "onInterestLoop"
+CONTENT_STORE_MISS = "onContentStoreMiss"
+CONTENT_STORE_HIT = "onContentStoreHit"
+OUTGOING_INTEREST = "onOutgoingInterest"
+INTEREST_FINALIZE = "onInterestFinalize"
+INCOMING_DATA = "onIncomingData"
+DATA_UNSOLICITED = "onDataUnsolicited"
+OUTGOING_DATA = "onOutgoingData"
+INCOMING_NACK = "onIncomingNack"
+OUTGOING_NACK = "onOutgoingNack"
+FORWARDER_EVENTS = [INCOMING_INTEREST, INTEREST_LOOP, CONTENT_STORE_MISS, CONTENT_STORE_HIT, OUTGOING_INTEREST, INTEREST_FINALIZE,
+                    INCOMING_DATA, DATA_UNSOLICITED, OUTGOING_DATA, INCOMING_NACK, OUTGOING_NACK]
+# Groups: event, face, name and "un" for an unsatisfied PIT entry
+FORWARDER_LINE = re.escape(FORWARDER_TAG) + r" (%s) (?:face=(\d+) )?\w+=([^\s~]+)\S*(?: (un)?satisfied)?" % "|".join(FORWARDER_EVENTS)
+
+# Event kinds as stored in ForwardingEvents.kinds, with finalized PIT entries split by whether they were satisfied
+INCOMING_INTEREST_EVENT = 0
+INTEREST_LOOP_EVENT = 1
+CONTENT_STORE_MISS_EVENT = 2
+CONTENT_STORE_HIT_EVENT = 3
+OUTGOING_INTEREST_EVENT = 4
+INTEREST_SATISFIED_EVENT = 5
+INTEREST_UNSATISFIED_EVENT = 6
+INCOMING_DATA_EVENT = 7
+DATA_UNSOLICITED_EVENT = 8
+OUTGOING_DATA_EVENT = 9
+INCOMING_NACK_EVENT = 10
+OUTGOING_NACK_EVENT = 11
+# (event, "un" group) -> kind
+FORWARDER_EVENT_KINDS = {
+    (INCOMING_INTEREST, None): INCOMING_INTEREST_EVENT,
+    (INTEREST_LOOP, None): INTEREST_LOOP_EVENT,
+    (CONTENT_STORE_MISS, None): CONTENT_STORE_MISS_EVENT,
+    (CONTENT_STORE_HIT, None): CONTENT_STORE_HIT_EVENT,
+    (OUTGOING_INTEREST, None): OUTGOING_INTEREST_EVENT,
+    (INTEREST_FINALIZE, None): INTEREST_SATISFIED_EVENT,
+    (INTEREST_FINALIZE, "un"): INTEREST_UNSATISFIED_EVENT,
+    (INCOMING_DATA, None): INCOMING_DATA_EVENT,
+    (DATA_UNSOLICITED, None): DATA_UNSOLICITED_EVENT,
+    (OUTGOING_DATA, None): OUTGOING_DATA_EVENT,
+    (INCOMING_NACK, None): INCOMING_NACK_EVENT,
+    (OUTGOING_NACK, None): OUTGOING_NACK_EVENT,
+}
+NUM_FORWARDER_KINDS = len(FORWARDER_EVENT_KINDS)
+NO_FACE = -1
+
+
+@lru_cache(maxsize=None)
+def compileCacheLinePattern():
+    # Matched against bytes blocks of the log, which is never decoded
+    return re.compile(CACHE_LINE.format(playerName=".*", objectType=".*").encode())
 
 
 class CacheRate:
@@ -16,11 +91,11 @@ class CacheRate:
         self.lookups = 0
         self.hits = 0
 
-    def addLookup(self):
-        self.lookups = self.lookups + 1
+    def addLookup(self, count: int = 1):
+        self.lookups = self.lookups + count
 
-    def addHitWithoutLookup(self):
-        self.hits = self.hits + 1
+    def addHitWithoutLookup(self, count: int = 1):
+        self.hits = self.hits + count
 
     def mergeWithOther(self, other):
         self.lookups += other.lookups
@@ -30,12 +105,867 @@ class CacheRate:
         return 100 * self.hits / self.lookups
 
 
+class CacheLineScanner:
+
+    def __init__(self):
+        self.pattern = compileCacheLinePattern()
+        self.tag = CONTENT_STORE_TAG.encode()
+        # (kind, playerName, objectType) -> number of matching lines
+        self.counts: Counter = Counter()
+
+    def feed(self, block: bytes):
+        # Blocks always end on a line boundary and '.' never crosses a newline, so matches stay within one line
+        if self.tag not in block:
+            return
+        self.counts.update(match.groups() for match in self.pattern.finditer(block))
+
+    def getCacheRates(self) -> (Dict[str, Dict[str, CacheRate]], int, int):
+        return buildCacheRates({tuple(g.decode() for g in groups): count for groups, count in self.counts.items()})
+
+
+def buildCacheRates(counts: Dict[Tuple[str, str, str], int]) -> (Dict[str, Dict[str, CacheRate]], int, int):
+    cacheRates = defaultdict(lambda: defaultdict(CacheRate))
+    numLookups: int = 0
+    numCacheHits: int = 0
+    for (kind, playerName, objectType), count in counts.items():
+        if kind == CACHE_LOOKUP:
+            numLookups += count
+            cacheRates[playerName][objectType].addLookup(count)
+        else:
+            numCacheHits += count
+            cacheRates[playerName][objectType].addHitWithoutLookup(count)
+
+    cacheRates = sorted(cacheRates.items(), key=lambda kv: kv[0])
+    cacheRates = OrderedDict(cacheRates)
+
+    return cacheRates, numLookups, numCacheHits
+
+
+def buildCacheRatesFromCounts(counts: np.ndarray, players: List[str], objectTypes: List[str]) -> (Dict[str, Dict[str, CacheRate]], int, int):
+    # counts indexed by (playerId * number of object types + objectTypeId) * 2 + event kind
+    numTypes = max(len(objectTypes), 1)
+    kindNames = {v: k for k, v in EVENT_KINDS.items()}
+    countsByKey = {}
+    for key in np.flatnonzero(counts).tolist():
+        playerAndType, kind = divmod(key, 2)
+        playerId, objectTypeId = divmod(playerAndType, numTypes)
+        countsByKey[(kindNames[kind], players[playerId], objectTypes[objectTypeId])] = int(counts[key])
+    return buildCacheRates(countsByKey)
+
+
+def parseLineTimestamps(block: bytes, positions: np.ndarray) -> np.ndarray:
+    # Timestamps of the lines containing each position, parsed for all lines at once
+    buffer = np.frombuffer(block, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == ord("\n"))
+    linesBefore = np.searchsorted(newlines, positions)
+    lineStarts = np.where(linesBefore > 0, newlines[linesBefore - 1] + 1, 0)
+    if len(lineStarts) == 0:
+        return np.zeros(0)
+    if lineStarts.max() + TIMESTAMP_WIDTH < len(buffer):
+        digits = buffer[lineStarts[:, None] + np.arange(TIMESTAMP_WIDTH + 1)].astype(np.int64) - ord("0")
+        if (digits[:, TIMESTAMP_POINT] == ord(".") - ord("0")).all() and (digits[:, TIMESTAMP_WIDTH] == ord(" ") - ord("0")).all():
+            return digits[:, :TIMESTAMP_WIDTH] @ TIMESTAMP_WEIGHTS
+    # Some line doesn't have the usual fixed width timestamp
+    return np.array([float(block[start:block.find(b" ", start)]) for start in lineStarts.tolist()])
+
+
+class CacheRateSeries:
+    # Lookups and hits counted in consecutive bins of binWidth seconds, the first starting at start
+
+    def __init__(self, start: float, binWidth: float, lookups: np.ndarray, hits: np.ndarray):
+        self.start = start
+        self.binWidth = binWidth
+        self.lookups = lookups
+        self.hits = hits
+
+    def __len__(self):
+        return len(self.lookups)
+
+    def getTimes(self) -> np.ndarray:
+        return self.start + self.binWidth * np.arange(len(self))
+
+    def getHitRates(self) -> np.ndarray:
+        # Percentages like CacheRate.getCacheRate, NaN for bins without lookups
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.lookups > 0, 100 * self.hits / self.lookups, np.nan)
+
+
+class CacheEvents:
+    # Every ContentStore lookup and hit of a game name in one nfd.log as parallel arrays,
+    # with players and object types dictionary encoded
+    def __init__(self, timestamps: np.ndarray, kinds: np.ndarray, playerIds: np.ndarray, objectTypeIds: np.ndarray,
+                 players: List[str], objectTypes: List[str]):
+        self.timestamps = timestamps
+        self.kinds = kinds
+        self.playerIds = playerIds
+        self.objectTypeIds = objectTypeIds
+        self.players = players
+        self.objectTypes = objectTypes
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def getCacheRates(self) -> (Dict[str, Dict[str, CacheRate]], int, int):
+        numTypes = max(len(self.objectTypes), 1)
+        keys = (self.playerIds.astype(np.int64) * numTypes + self.objectTypeIds) * 2 + self.kinds
+        return buildCacheRatesFromCounts(np.bincount(keys, minlength=len(self.players) * numTypes * 2), self.players, self.objectTypes)
+
+    def getTimeRange(self) -> (float, float):
+        if len(self) == 0:
+            return np.nan, np.nan
+        return float(self.timestamps.min()), float(self.timestamps.max())
+
+    def select(self, playerName: str = None, objectType: str = None) -> np.ndarray:
+        selected = np.ones(len(self), dtype=bool)
+        if playerName is not None:
+            selected &= self.playerIds == (self.players.index(playerName) if playerName in self.players else -1)
+        if objectType is not None:
+            selected &= self.objectTypeIds == (self.objectTypes.index(objectType) if objectType in self.objectTypes else -1)
+        return selected
+
+    def countByBin(self, groupIds: np.ndarray, numGroups: int, binWidth: float, start: float, end: float,
+                   selected: np.ndarray) -> (np.ndarray, np.ndarray):
+        # One bincount over (group, bin, kind) for all groups at once; returns lookups and hits shaped (group, bin)
+        numBins = max(int((end - start) // binWidth) + 1, 0)
+        bins = np.floor((self.timestamps - start) / binWidth).astype(np.int64)
+        selected = selected & (bins >= 0) & (bins < numBins)
+        keys = (groupIds[selected].astype(np.int64) * numBins + bins[selected]) * 2 + self.kinds[selected]
+        counts = np.bincount(keys, minlength=numGroups * numBins * 2).reshape(numGroups, numBins, 2)
+        return counts[:, :, LOOKUP_EVENT], counts[:, :, HIT_EVENT]
+
+    def getBinRange(self, start: float = None, end: float = None) -> (float, float):
+        first, last = self.getTimeRange()
+        start = (np.floor(first) if len(self) > 0 else 0.0) if start is None else start
+        end = (last if len(self) > 0 else start) if end is None else end
+        return start, end
+
+    def getCacheRateSeries(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None,
+                           playerName: str = None, objectType: str = None) -> CacheRateSeries:
+        # Pass the same start and end to every router's events to line their bins up
+        start, end = self.getBinRange(start, end)
+        lookups, hits = self.countByBin(np.zeros(len(self), dtype=np.int64), 1, binWidth, start, end,
+                                        self.select(playerName, objectType))
+        return CacheRateSeries(start, binWidth, lookups[0], hits[0])
+
+    def getCacheRateSeriesByPlayer(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None,
+                                   objectType: str = None) -> Dict[str, CacheRateSeries]:
+        start, end = self.getBinRange(start, end)
+        lookups, hits = self.countByBin(self.playerIds, len(self.players), binWidth, start, end, self.select(objectType=objectType))
+        return {player: CacheRateSeries(start, binWidth, lookups[i], hits[i]) for i, player in enumerate(self.players)}
+
+    def getCacheRateSeriesByObjectType(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None,
+                                       playerName: str = None) -> Dict[str, CacheRateSeries]:
+        start, end = self.getBinRange(start, end)
+        lookups, hits = self.countByBin(self.objectTypeIds, len(self.objectTypes), binWidth, start, end, self.select(playerName=playerName))
+        return {objectType: CacheRateSeries(start, binWidth, lookups[i], hits[i]) for i, objectType in enumerate(self.objectTypes)}
+
+
+class CacheEventScanner:
+
+    def __init__(self):
+        self.pattern = compileCacheLinePattern()
+        self.tag = CONTENT_STORE_TAG.encode()
+        # (kind, playerName, objectType) -> key id, and the arrays of every block fed so far
+        self.keys: Dict[Tuple[bytes, bytes, bytes], int] = {}
+        self.timestamps: List[np.ndarray] = []
+        self.keyIds: List[np.ndarray] = []
+
+    def feed(self, block: bytes):
+        if self.tag not in block:
+            return
+        matches = list(self.pattern.finditer(block))
+        keys = self.keys
+        self.keyIds.append(np.array([keys.setdefault(m.groups(), len(keys)) for m in matches], dtype=np.int32))
+        self.timestamps.append(parseLineTimestamps(block, np.array([m.start() for m in matches], dtype=np.int64)))
+
+    def scanFile(self, fileName: str):
+        for block in readLineBlocks(fileName, binary=True):
+            self.feed(block)
+
+    def getEvents(self) -> CacheEvents:
+        players = sorted({player.decode() for _, player, _ in self.keys})
+        objectTypes = sorted({objectType.decode() for _, _, objectType in self.keys})
+        playerIndex = {p: i for i, p in enumerate(players)}
+        objectTypeIndex = {o: i for i, o in enumerate(objectTypes)}
+        # Lookup tables from key id to each column
+        byKey = sorted(self.keys.items(), key=lambda kv: kv[1])
+        kindOf = np.array([EVENT_KINDS[k.decode()] for (k, _, _), _ in byKey], dtype=np.uint8)
+        playerOf = np.array([playerIndex[p.decode()] for (_, p, _), _ in byKey], dtype=np.int32)
+        objectTypeOf = np.array([objectTypeIndex[o.decode()] for (_, _, o), _ in byKey], dtype=np.uint8)
+
+        keyIds = np.concatenate(self.keyIds) if self.keyIds else np.zeros(0, dtype=np.int32)
+        timestamps = np.concatenate(self.timestamps) if self.timestamps else np.zeros(0)
+        return CacheEvents(timestamps, kindOf[keyIds], playerOf[keyIds], objectTypeOf[keyIds], players, objectTypes)
+
+
+def getBins(timestamps: np.ndarray, binWidth: float, start: float, end: float) -> (np.ndarray, int):
+    # Bin of every timestamp, -1 or numBins where outside [start, end]
+    numBins = max(int((end - start) // binWidth) + 1, 0)
+    bins = np.floor((timestamps - start) / binWidth).astype(np.int64)
+    return np.clip(bins, -1, numBins), numBins
+
+
+class BinnedSeries:
+    # One value for each of consecutive bins of binWidth seconds, the first starting at start
+
+    def __init__(self, start: float, binWidth: float, values: np.ndarray):
+        self.start = start
+        self.binWidth = binWidth
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def getTimes(self) -> np.ndarray:
+        return self.start + self.binWidth * np.arange(len(self))
+
+
+class ForwardingCounts:
+    # How a router's forwarder handled the interests and data of a selection of names
+
+    def __init__(self, countsByKind: np.ndarray, aggregated: int, pitEntries: int):
+        self.incoming = int(countsByKind[INCOMING_INTEREST_EVENT])
+        self.loops = int(countsByKind[INTEREST_LOOP_EVENT])
+        self.contentStoreHits = int(countsByKind[CONTENT_STORE_HIT_EVENT])
+        self.forwarded = int(countsByKind[OUTGOING_INTEREST_EVENT])
+        self.satisfied = int(countsByKind[INTEREST_SATISFIED_EVENT])
+        self.unsatisfied = int(countsByKind[INTEREST_UNSATISFIED_EVENT])
+        self.incomingData = int(countsByKind[INCOMING_DATA_EVENT])
+        self.unsolicitedData = int(countsByKind[DATA_UNSOLICITED_EVENT])
+        self.outgoingData = int(countsByKind[OUTGOING_DATA_EVENT])
+        self.incomingNacks = int(countsByKind[INCOMING_NACK_EVENT])
+        # Interests that arrived while their name already had a pending PIT entry, and the entries created
+        self.aggregated = aggregated
+        self.pitEntries = pitEntries
+
+    def getAggregationFactor(self) -> float:
+        # Interests received (duplicates excluded) per interest sent upstream: 1 when nothing was aggregated or answered from cache
+        return (self.incoming - self.loops) / self.forwarded if self.forwarded > 0 else np.nan
+
+    def getAggregatedPercentage(self) -> float:
+        return 100 * self.aggregated / (self.incoming - self.loops) if self.incoming > self.loops else np.nan
+
+    def getSatisfiedPercentage(self) -> float:
+        finalized = self.satisfied + self.unsatisfied
+        return 100 * self.satisfied / finalized if finalized > 0 else np.nan
+
+    def toDict(self) -> Dict[str, float]:
+        counts = dict(vars(self))
+        counts.update(aggregationFactor=self.getAggregationFactor(), aggregatedPercentage=self.getAggregatedPercentage(),
+                      satisfiedPercentage=self.getSatisfiedPercentage())
+        return counts
+
+
+class ForwardingEvents:
+    # Every Forwarder pipeline event of one nfd.log as parallel arrays, with names dictionary encoded.
+    # Names of data (which carry the producer's extra components) and interests get separate ids.
+    def __init__(self, timestamps: np.ndarray, kinds: np.ndarray, faces: np.ndarray, nameIds: np.ndarray, names: List[str]):
+        self.timestamps = timestamps
+        self.kinds = kinds
+        self.faces = faces
+        self.nameIds = nameIds
+        self.names = names
+        # Worked out on first use: player and object type ids of every name, and the PIT changes of every event
+        self.nameKeys: Tuple[np.ndarray, np.ndarray, List[str], List[str]] = None
+        self.pitChanges: Tuple[np.ndarray, np.ndarray, np.ndarray] = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["pitChanges"] = None
+        return state
+
+    def getTimeRange(self) -> (float, float):
+        if len(self) == 0:
+            return np.nan, np.nan
+        return float(self.timestamps.min()), float(self.timestamps.max())
+
+    def getBinRange(self, start: float = None, end: float = None) -> (float, float):
+        first, last = self.getTimeRange()
+        start = (np.floor(first) if len(self) > 0 else 0.0) if start is None else start
+        end = (last if len(self) > 0 else start) if end is None else end
+        return start, end
+
+    def getNameKeys(self) -> (np.ndarray, np.ndarray, List[str], List[str]):
+        # (player id, object type id) of every name, -1 for names outside the game's sync prefix
+        if self.nameKeys is None:
+            pattern = re.compile(GAME_PREFIX.format(playerName="[^/]+", objectType="[^/]+"))
+            matches = [pattern.match(name) for name in self.names]
+            players = sorted({m.group(1) for m in matches if m is not None})
+            objectTypes = sorted({m.group(2) for m in matches if m is not None})
+            playerIndex = {p: i for i, p in enumerate(players)}
+            objectTypeIndex = {o: i for i, o in enumerate(objectTypes)}
+            playerIds = np.array([-1 if m is None else playerIndex[m.group(1)] for m in matches], dtype=np.int32)
+            objectTypeIds = np.array([-1 if m is None else objectTypeIndex[m.group(2)] for m in matches], dtype=np.int32)
+            self.nameKeys = (playerIds, objectTypeIds, players, objectTypes)
+        return self.nameKeys
+
+    def select(self, playerName: str = None, objectType: str = None) -> np.ndarray:
+        selected = np.ones(len(self), dtype=bool)
+        if playerName is None and objectType is None:
+            return selected
+        playerIds, objectTypeIds, players, objectTypes = self.getNameKeys()
+        if playerName is not None:
+            selected &= playerIds[self.nameIds] == (players.index(playerName) if playerName in players else -2)
+        if objectType is not None:
+            selected &= objectTypeIds[self.nameIds] == (objectTypes.index(objectType) if objectType in objectTypes else -2)
+        return selected
+
+    def getPitChanges(self) -> (np.ndarray, np.ndarray, np.ndarray):
+        # For every event whether it inserted a PIT entry, was aggregated into a pending one or removed one.
+        # An entry lives from the first incoming interest for its name until onInterestFinalize; incoming interests
+        # in between are aggregated, except those the forwarder dropped as loops (followed by onInterestLoop).
+        if self.pitChanges is not None:
+            return self.pitChanges
+        kinds = self.kinds
+        finalized = (kinds == INTEREST_SATISFIED_EVENT) | (kinds == INTEREST_UNSATISFIED_EVENT)
+        relevant = np.flatnonzero((kinds == INCOMING_INTEREST_EVENT) | (kinds == INTEREST_LOOP_EVENT) | finalized)
+        # Each name's events together, in log order
+        order = relevant[np.argsort(self.nameIds[relevant], kind="stable")]
+        names, orderedKinds = self.nameIds[order], kinds[order]
+        sameName = names[1:] == names[:-1]
+        looped = np.zeros(len(order), dtype=bool)
+        looped[:-1] = sameName & (orderedKinds[1:] == INTEREST_LOOP_EVENT) & (orderedKinds[:-1] == INCOMING_INTEREST_EVENT)
+        keep = (orderedKinds != INTEREST_LOOP_EVENT) & ~looped
+        order, names, orderedKinds = order[keep], names[keep], orderedKinds[keep]
+
+        # A name's entry is pending after an incoming interest and gone after a finalize
+        pending = np.zeros(len(order), dtype=bool)
+        pending[1:] = (names[1:] == names[:-1]) & (orderedKinds[:-1] == INCOMING_INTEREST_EVENT)
+        isIncoming = orderedKinds == INCOMING_INTEREST_EVENT
+        inserted, aggregated, removed = (np.zeros(len(self), dtype=bool) for _ in range(3))
+        inserted[order[isIncoming & ~pending]] = True
+        aggregated[order[isIncoming & pending]] = True
+        removed[order[~isIncoming & pending]] = True
+        self.pitChanges = (inserted, aggregated, removed)
+        return self.pitChanges
+
+    def getCounts(self, playerName: str = None, objectType: str = None) -> ForwardingCounts:
+        selected = self.select(playerName, objectType)
+        inserted, aggregated, _ = self.getPitChanges()
+        return ForwardingCounts(np.bincount(self.kinds[selected], minlength=NUM_FORWARDER_KINDS), int(np.count_nonzero(aggregated & selected)),
+                                int(np.count_nonzero(inserted & selected)))
+
+    def getPitOccupancy(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None) -> BinnedSeries:
+        # PIT entries pending at the end of each bin. Entries already pending when the log starts aren't known about.
+        start, end = self.getBinRange(start, end)
+        numBins = max(int((end - start) // binWidth) + 1, 0)
+        inserted, _, removed = self.getPitChanges()
+        order = np.argsort(self.timestamps, kind="stable")
+        occupancy = np.cumsum(inserted[order].astype(np.int64) - removed[order])
+        last = np.searchsorted(self.timestamps[order], start + binWidth * np.arange(1, numBins + 1), side="right") - 1
+        return BinnedSeries(start, binWidth, np.where(last >= 0, occupancy[np.maximum(last, 0)] if len(occupancy) > 0 else 0, 0))
+
+    def getPeakPitOccupancy(self) -> int:
+        inserted, _, removed = self.getPitChanges()
+        order = np.argsort(self.timestamps, kind="stable")
+        return int(np.cumsum(inserted[order].astype(np.int64) - removed[order]).max(initial=0))
+
+    def getRatesByFace(self, kind: int = INCOMING_INTEREST_EVENT, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None,
+                       end: float = None, objectType: str = None) -> Dict[int, BinnedSeries]:
+        # Events of one kind per second, for each face they happened on. One bincount over (face, bin) for all faces at once.
+        start, end = self.getBinRange(start, end)
+        selected = (self.kinds == kind) & (self.faces != NO_FACE) & self.select(objectType=objectType)
+        bins, numBins = getBins(self.timestamps[selected], binWidth, start, end)
+        faces, faceIndex = np.unique(self.faces[selected], return_inverse=True)
+        inRange = (bins >= 0) & (bins < numBins)
+        counts = np.bincount(faceIndex[inRange] * numBins + bins[inRange], minlength=len(faces) * numBins).reshape(len(faces), numBins)
+        return {int(face): BinnedSeries(start, binWidth, counts[i] / binWidth) for i, face in enumerate(faces)}
+
+    def getCountsByFace(self, kind: int = INCOMING_INTEREST_EVENT, objectType: str = None) -> Dict[int, int]:
+        selected = (self.kinds == kind) & (self.faces != NO_FACE) & self.select(objectType=objectType)
+        faces, counts = np.unique(self.faces[selected], return_counts=True)
+        return dict(zip(faces.tolist(), counts.tolist()))
+
+
+class ForwardingEventScanner:
+
+    def __init__(self):
+        self.pattern = re.compile(FORWARDER_LINE.encode())
+        self.tag = FORWARDER_TAG.encode()
+        # Finalized entries are counted as satisfied here and told apart by the "un" group in feed
+        self.kindsByEvent = {event.encode(): kind for (event, un), kind in FORWARDER_EVENT_KINDS.items() if un is None}
+        # name -> name id, and the arrays of every block fed so far
+        self.names: Dict[bytes, int] = {}
+        self.timestamps: List[np.ndarray] = []
+        self.kinds: List[np.ndarray] = []
+        self.faces: List[np.ndarray] = []
+        self.nameIds: List[np.ndarray] = []
+
+    def parseBlock(self, block: bytes) -> (np.ndarray, np.ndarray, np.ndarray, Tuple[bytes]):
+        # Timestamps, kinds, faces and names of the block's events, None when it has none
+        if self.tag not in block:
+            return None
+        matches = list(self.pattern.finditer(block))
+        if len(matches) == 0:
+            return None
+        # One column per group, each turned into an array in one go
+        events, faces, names, unsatisfied = zip(*[m.groups() for m in matches])
+        kinds = np.array([self.kindsByEvent[event] for event in events], dtype=np.uint8)
+        kinds[np.array([u is not None for u in unsatisfied])] = INTEREST_UNSATISFIED_EVENT
+        timestamps = parseLineTimestamps(block, np.array([m.start() for m in matches], dtype=np.int64))
+        return timestamps, kinds, np.array([int(face) if face else NO_FACE for face in faces], dtype=np.int32), names
+
+    def feed(self, block: bytes):
+        parsed = self.parseBlock(block)
+        if parsed is None:
+            return
+        timestamps, kinds, faces, names = parsed
+        nameIds = self.names
+        self.kinds.append(kinds)
+        self.faces.append(faces)
+        self.nameIds.append(np.array([nameIds.setdefault(name, len(nameIds)) for name in names], dtype=np.int32))
+        self.timestamps.append(timestamps)
+
+    def scanFile(self, fileName: str):
+        for block in readLineBlocks(fileName, binary=True):
+            self.feed(block)
+
+    def getEvents(self) -> ForwardingEvents:
+        def concatenate(arrays: List[np.ndarray], dtype) -> np.ndarray:
+            return np.concatenate(arrays) if arrays else np.zeros(0, dtype=dtype)
+        return ForwardingEvents(concatenate(self.timestamps, np.float64), concatenate(self.kinds, np.uint8), concatenate(self.faces, np.int32),
+                                concatenate(self.nameIds, np.int32), [name.decode() for name in self.names])
+
+
+def scanNfdLog(nodeDir: str) -> (CacheEvents, ForwardingEvents):
+    # ContentStore and Forwarder events from one read of the file
+    cacheScanner = CacheEventScanner()
+    forwardingScanner = ForwardingEventScanner()
+    fileName = buildFileName(nodeDir, NFD_LOG_FILE)
+    try:
+        for block in readLineBlocks(fileName, binary=True):
+            cacheScanner.feed(block)
+            forwardingScanner.feed(block)
+    except FileNotFoundError:
+        print("Could not find file %s " % fileName)
+    return cacheScanner.getEvents(), forwardingScanner.getEvents()
+
+
+def scanCacheEvents(nodeDir: str) -> CacheEvents:
+    scanner = CacheEventScanner()
+    fileName = buildFileName(nodeDir, NFD_LOG_FILE)
+    try:
+        scanner.scanFile(fileName)
+    except FileNotFoundError:
+        print("Could not find file %s " % fileName)
+    return scanner.getEvents()
+
+
+class BinCounts:
+    # Per key sums of events in bins of binWidth seconds numbered from time 0, grown as events arrive. Any bins lying on
+    # the same grid (a whole number of binWidths wide, starting on a bin boundary) can be added up from them.
+
+    def __init__(self, binWidth: float = DEFAULT_BIN_WIDTH, dtype=np.int32):
+        self.binWidth = binWidth
+        self.firstBin = 0
+        self.counts = np.zeros((0, 0), dtype=dtype)
+
+    def getBins(self, timestamps: np.ndarray) -> np.ndarray:
+        return np.floor(timestamps / self.binWidth).astype(np.int64)
+
+    def add(self, keyIds: np.ndarray, bins: np.ndarray, weights: np.ndarray = None):
+        if len(bins) == 0:
+            return
+        low, high = int(bins.min()), int(bins.max())
+        numKeys = int(keyIds.max()) + 1
+        rows, width = self.counts.shape
+        if numKeys > rows or width == 0 or low < self.firstBin or high >= self.firstBin + width:
+            first = low if width == 0 else min(self.firstBin, low)
+            end = high + 1 if width == 0 else max(self.firstBin + width, high + 1)
+            # Room to grow into, so a long log is copied a handful of times rather than once per block
+            end = max(end, first + 2 * width)
+            grown = np.zeros((max(numKeys, rows), end - first), dtype=self.counts.dtype)
+            grown[:rows, self.firstBin - first:self.firstBin - first + width] = self.counts
+            self.counts, self.firstBin = grown, first
+        span = high - low + 1
+        summed = np.bincount(keyIds.astype(np.int64) * span + bins - low, weights, minlength=numKeys * span).reshape(numKeys, span)
+        self.counts[:numKeys, low - self.firstBin:low - self.firstBin + span] += summed.astype(self.counts.dtype)
+
+    def getRows(self) -> int:
+        return self.counts.shape[0]
+
+    def getTotals(self) -> np.ndarray:
+        return self.counts.sum(axis=1, dtype=np.int64)
+
+    def getGridOffset(self, binWidth: float, start: float) -> (int, int):
+        # (bins of this grid per bin of binWidth, bin of this grid start falls on)
+        factor, offset = binWidth / self.binWidth, start / self.binWidth
+        if factor < 1 or factor != round(factor) or offset != round(offset):
+            raise ValueError("Counted in %gs bins from 0, which can't be added up into %gs bins from %f" % (self.binWidth, binWidth, start))
+        return int(round(factor)), int(round(offset))
+
+    def getSeries(self, keyIds: np.ndarray, binWidth: float, start: float, numBins: int) -> np.ndarray:
+        # Sums shaped (key, bin) in numBins bins of binWidth from start
+        factor, offset = self.getGridOffset(binWidth, start)
+        series = np.zeros((len(keyIds), numBins * factor), dtype=np.int64)
+        first = offset - self.firstBin
+        low, high = max(first, 0), min(first + numBins * factor, self.counts.shape[1])
+        if low < high:
+            series[:, low - first:high - first] = self.counts[keyIds, low:high]
+        return series.reshape(len(keyIds), numBins, factor).sum(axis=2)
+
+    def getTotalsBefore(self, keyIds: np.ndarray, start: float) -> np.ndarray:
+        _, offset = self.getGridOffset(self.binWidth, start)
+        return self.counts[keyIds, :min(max(offset - self.firstBin, 0), self.counts.shape[1])].sum(axis=1, dtype=np.int64)
+
+    def remapRows(self, rowMap: np.ndarray, numRows: int):
+        # Row i becomes row rowMap[i]
+        counts = np.zeros((numRows, self.counts.shape[1]), dtype=self.counts.dtype)
+        np.add.at(counts, rowMap[:self.counts.shape[0]], self.counts)
+        self.counts = counts
+
+
+def getBinCount(start: float, end: float, binWidth: float) -> int:
+    return max(int((end - start) // binWidth) + 1, 0)
+
+
+class BinnedCacheEvents:
+    # The lookups and hits of CacheEvents counted into DEFAULT_BIN_WIDTH bins as the log is read, instead of kept one by one:
+    # the same totals and time series, for bins on that grid, in memory that doesn't grow with the log
+    def __init__(self, counts: BinCounts, players: List[str], objectTypes: List[str], numEvents: int, timeRange: Tuple[float, float]):
+        # counts keyed like buildCacheRatesFromCounts
+        self.counts = counts
+        self.players = players
+        self.objectTypes = objectTypes
+        self.numEvents = numEvents
+        self.timeRange = timeRange
+
+    @staticmethod
+    def fromEvents(events: CacheEvents, chunkRows: int = 1 << 20):
+        counts = BinCounts()
+        numTypes = max(len(events.objectTypes), 1)
+        for i in range(0, len(events), chunkRows):
+            keys = (events.playerIds[i:i + chunkRows].astype(np.int64) * numTypes + events.objectTypeIds[i:i + chunkRows]) * 2 + \
+                   events.kinds[i:i + chunkRows]
+            counts.add(keys, counts.getBins(events.timestamps[i:i + chunkRows]))
+        return BinnedCacheEvents(counts, events.players, events.objectTypes, len(events), events.getTimeRange())
+
+    def __len__(self):
+        return self.numEvents
+
+    def getCacheRates(self) -> (Dict[str, Dict[str, CacheRate]], int, int):
+        return buildCacheRatesFromCounts(self.counts.getTotals(), self.players, self.objectTypes)
+
+    def getTimeRange(self) -> (float, float):
+        return self.timeRange
+
+    def getBinRange(self, start: float = None, end: float = None) -> (float, float):
+        first, last = self.getTimeRange()
+        start = (np.floor(first) if len(self) > 0 else 0.0) if start is None else start
+        end = (last if len(self) > 0 else start) if end is None else end
+        return start, end
+
+    def countByBin(self, groupOfPair: np.ndarray, numGroups: int, binWidth: float, start: float, end: float) -> (np.ndarray, np.ndarray):
+        # Like CacheEvents.countByBin, grouping every (player, object type) pair by groupOfPair, -1 leaving it out
+        numBins = getBinCount(start, end, binWidth)
+        keys = np.arange(self.counts.getRows())
+        keys = keys[groupOfPair[keys // 2] >= 0]
+        series = self.counts.getSeries(keys, binWidth, start, numBins)
+        counts = np.zeros((numGroups, numBins, 2), dtype=np.int64)
+        np.add.at(counts, (groupOfPair[keys // 2], slice(None), keys % 2), series)
+        return counts[:, :, LOOKUP_EVENT], counts[:, :, HIT_EVENT]
+
+    def getPairGroups(self, playerName: str = None, objectType: str = None) -> (np.ndarray, np.ndarray, np.ndarray):
+        # (player id, object type id, whether selected) of every (player, object type) pair
+        numTypes = max(len(self.objectTypes), 1)
+        pairs = np.arange(len(self.players) * numTypes)
+        playerIds, objectTypeIds = pairs // numTypes, pairs % numTypes
+        selected = np.ones(len(pairs), dtype=bool)
+        if playerName is not None:
+            selected &= playerIds == (self.players.index(playerName) if playerName in self.players else -1)
+        if objectType is not None:
+            selected &= objectTypeIds == (self.objectTypes.index(objectType) if objectType in self.objectTypes else -1)
+        return playerIds, objectTypeIds, selected
+
+    def getCacheRateSeries(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None,
+                           playerName: str = None, objectType: str = None) -> CacheRateSeries:
+        start, end = self.getBinRange(start, end)
+        _, _, selected = self.getPairGroups(playerName, objectType)
+        lookups, hits = self.countByBin(np.where(selected, 0, -1), 1, binWidth, start, end)
+        return CacheRateSeries(start, binWidth, lookups[0], hits[0])
+
+    def getCacheRateSeriesByPlayer(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None,
+                                   objectType: str = None) -> Dict[str, CacheRateSeries]:
+        start, end = self.getBinRange(start, end)
+        playerIds, _, selected = self.getPairGroups(objectType=objectType)
+        lookups, hits = self.countByBin(np.where(selected, playerIds, -1), len(self.players), binWidth, start, end)
+        return {player: CacheRateSeries(start, binWidth, lookups[i], hits[i]) for i, player in enumerate(self.players)}
+
+    def getCacheRateSeriesByObjectType(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None,
+                                       playerName: str = None) -> Dict[str, CacheRateSeries]:
+        start, end = self.getBinRange(start, end)
+        _, objectTypeIds, selected = self.getPairGroups(playerName=playerName)
+        lookups, hits = self.countByBin(np.where(selected, objectTypeIds, -1), len(self.objectTypes), binWidth, start, end)
+        return {objectType: CacheRateSeries(start, binWidth, lookups[i], hits[i]) for i, objectType in enumerate(self.objectTypes)}
+
+
+class BinnedCacheEventScanner(CacheEventScanner):
+    # Each block's events are counted and dropped as soon as they are parsed
+
+    def __init__(self):
+        super().__init__()
+        self.counts = BinCounts()
+        self.numEvents = 0
+        self.first, self.last = np.inf, -np.inf
+
+    def feed(self, block: bytes):
+        super().feed(block)
+        if len(self.timestamps) == 0:
+            return
+        timestamps, keyIds = self.timestamps.pop(), self.keyIds.pop()
+        if len(timestamps) == 0:
+            return
+        self.counts.add(keyIds, self.counts.getBins(timestamps))
+        self.numEvents += len(timestamps)
+        self.first, self.last = min(self.first, float(timestamps.min())), max(self.last, float(timestamps.max()))
+
+    def getEvents(self) -> BinnedCacheEvents:
+        players = sorted({player.decode() for _, player, _ in self.keys})
+        objectTypes = sorted({objectType.decode() for _, _, objectType in self.keys})
+        numTypes = max(len(objectTypes), 1)
+        # Scanner key ids -> keys of buildCacheRatesFromCounts
+        rowMap = np.zeros(len(self.keys), dtype=np.int64)
+        for (kind, player, objectType), keyId in self.keys.items():
+            rowMap[keyId] = (players.index(player.decode()) * numTypes + objectTypes.index(objectType.decode())) * 2 + EVENT_KINDS[kind.decode()]
+        self.counts.remapRows(rowMap, len(players) * numTypes * 2)
+        timeRange = (self.first, self.last) if self.numEvents > 0 else (np.nan, np.nan)
+        return BinnedCacheEvents(self.counts, players, objectTypes, self.numEvents, timeRange)
+
+
+class BinnedForwardingEvents:
+    # The totals, PIT changes and per face time series of ForwardingEvents, worked out as the log is read:
+    # memory grows with the names, faces and bins seen rather than with the events
+    def __init__(self, groups: List[Tuple[str, str]], totals: Dict[Tuple[int, int, int], int], aggregated: np.ndarray, inserted: np.ndarray,
+                 rateKeys: List[Tuple[str, int, int]], rates: BinCounts, pitChanges: BinCounts, peakPitOccupancy: int, numEvents: int,
+                 timeRange: Tuple[float, float]):
+        # (player, object type) of every group of names, None for names outside the game's sync prefix
+        self.groups = groups
+        # (group, kind, face) -> events, and the interests aggregated and PIT entries inserted for every group
+        self.totals = totals
+        self.aggregated = aggregated
+        self.inserted = inserted
+        # Events of every (object type, kind, face) by bin, and PIT entries inserted less those removed by bin
+        self.rateKeys = rateKeys
+        self.rates = rates
+        self.pitChanges = pitChanges
+        self.peakPitOccupancy = peakPitOccupancy
+        self.numEvents = numEvents
+        self.timeRange = timeRange
+
+    def __len__(self):
+        return self.numEvents
+
+    def getTimeRange(self) -> (float, float):
+        return self.timeRange
+
+    def getBinRange(self, start: float = None, end: float = None) -> (float, float):
+        first, last = self.getTimeRange()
+        start = (np.floor(first) if len(self) > 0 else 0.0) if start is None else start
+        end = (last if len(self) > 0 else start) if end is None else end
+        return start, end
+
+    def selectGroups(self, playerName: str = None, objectType: str = None) -> np.ndarray:
+        return np.array([(playerName is None or player == playerName) and (objectType is None or o == objectType) for player, o in self.groups],
+                        dtype=bool)
+
+    def getCounts(self, playerName: str = None, objectType: str = None) -> ForwardingCounts:
+        selected = self.selectGroups(playerName, objectType)
+        countsByKind = np.zeros(NUM_FORWARDER_KINDS, dtype=np.int64)
+        for (group, kind, _), count in self.totals.items():
+            if selected[group]:
+                countsByKind[kind] += count
+        return ForwardingCounts(countsByKind, int(self.aggregated[selected].sum()), int(self.inserted[selected].sum()))
+
+    def getPitOccupancy(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None) -> BinnedSeries:
+        # PIT changes are binned by the end of their bin, so each bin's occupancy includes an entry inserted right at its end
+        start, end = self.getBinRange(start, end)
+        keys = np.zeros(1, dtype=np.int64)
+        changes = self.pitChanges.getSeries(keys, binWidth, start, getBinCount(start, end, binWidth))[0]
+        return BinnedSeries(start, binWidth, self.pitChanges.getTotalsBefore(keys, start)[0] + np.cumsum(changes))
+
+    def getPeakPitOccupancy(self) -> int:
+        return self.peakPitOccupancy
+
+    def getRatesByFace(self, kind: int = INCOMING_INTEREST_EVENT, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None,
+                       end: float = None, objectType: str = None) -> Dict[int, BinnedSeries]:
+        start, end = self.getBinRange(start, end)
+        keys = [i for i, (o, k, face) in enumerate(self.rateKeys) if k == kind and face != NO_FACE and (objectType is None or o == objectType)]
+        series = self.rates.getSeries(np.array(keys, dtype=np.int64), binWidth, start, getBinCount(start, end, binWidth))
+        byFace = defaultdict(int)
+        for key, counts in zip(keys, series):
+            byFace[self.rateKeys[key][2]] = byFace[self.rateKeys[key][2]] + counts
+        return {face: BinnedSeries(start, binWidth, byFace[face] / binWidth) for face in sorted(byFace)}
+
+    def getCountsByFace(self, kind: int = INCOMING_INTEREST_EVENT, objectType: str = None) -> Dict[int, int]:
+        byFace = Counter()
+        for (group, k, face), count in self.totals.items():
+            if k == kind and face != NO_FACE and (objectType is None or self.groups[group][1] == objectType):
+                byFace[face] += count
+        return {face: byFace[face] for face in sorted(byFace)}
+
+
+class BinnedForwardingEventScanner(ForwardingEventScanner):
+    # Follows the PIT as the log is read, remembering only the names with a pending entry. A block's last event is held
+    # back when it is an incoming interest, since the onInterestLoop that drops it would be the next block's first line.
+
+    def __init__(self):
+        super().__init__()
+        self.namePattern = re.compile(GAME_PREFIX.format(playerName="[^/]+", objectType="[^/]+").encode())
+        self.groups: Dict[Tuple[str, str], int] = {}
+        self.groupObjectTypes: List[str] = []
+        self.totals: Counter = Counter()
+        self.aggregated: Counter = Counter()
+        self.inserted: Counter = Counter()
+        self.rateKeys: Dict[Tuple[str, int, int], int] = {}
+        self.rates = BinCounts()
+        self.pitChanges = BinCounts()
+        self.pending = set()
+        self.occupancy = 0
+        self.peakPitOccupancy = 0
+        self.numEvents = 0
+        self.first, self.last = np.inf, -np.inf
+        self.heldBack = None
+
+    def feed(self, block: bytes):
+        parsed = self.parseBlock(block)
+        if parsed is not None:
+            self.addEvents(*parsed)
+
+    def addEvents(self, timestamps: np.ndarray, kinds: np.ndarray, faces: np.ndarray, names: List[bytes]):
+        if self.heldBack is not None:
+            t, k, f, name = self.heldBack
+            timestamps, kinds, faces, names = np.append(t, timestamps), np.append(k, kinds), np.append(f, faces), [name] + list(names)
+            self.heldBack = None
+        if len(kinds) > 0 and kinds[-1] == INCOMING_INTEREST_EVENT:
+            self.heldBack = (timestamps[-1:], kinds[-1:], faces[-1:], names[-1])
+            timestamps, kinds, faces, names = timestamps[:-1], kinds[:-1], faces[:-1], names[:-1]
+        if len(kinds) > 0:
+            self.countEvents(timestamps, kinds, faces, names)
+
+    def getGroupIds(self, names: List[bytes]) -> np.ndarray:
+        groupIds = []
+        for name in names:
+            m = self.namePattern.match(name)
+            group = (None, None) if m is None else (m.group(1).decode(), m.group(2).decode())
+            if group not in self.groups:
+                self.groups[group] = len(self.groups)
+                self.groupObjectTypes.append(group[1])
+            groupIds.append(self.groups[group])
+        return np.array(groupIds, dtype=np.int64)
+
+    def countEvents(self, timestamps: np.ndarray, kinds: np.ndarray, faces: np.ndarray, names: List[bytes]):
+        localNames: Dict[bytes, int] = {}
+        nameIds = np.array([localNames.setdefault(name, len(localNames)) for name in names], dtype=np.int64)
+        uniqueNames = list(localNames)
+        groupIds = self.getGroupIds(uniqueNames)[nameIds]
+        self.numEvents += len(kinds)
+        self.first, self.last = min(self.first, float(timestamps.min())), max(self.last, float(timestamps.max()))
+
+        # Totals by (group, kind, face) and events by (object type, kind, face) and bin
+        keys, keyIds, counts = np.unique(np.stack([groupIds, kinds.astype(np.int64), faces.astype(np.int64)]), axis=1, return_inverse=True,
+                                         return_counts=True)
+        rateIds = []
+        for (group, kind, face), count in zip(keys.T.tolist(), counts.tolist()):
+            self.totals[(group, kind, face)] += count
+            rateKey = (self.groupObjectTypes[group], kind, face)
+            rateIds.append(self.rateKeys.setdefault(rateKey, len(self.rateKeys)))
+        self.rates.add(np.array(rateIds, dtype=np.int64)[keyIds.ravel()], self.rates.getBins(timestamps))
+
+        # The PIT changes of ForwardingEvents.getPitChanges, each name starting from whether it was pending after the last block
+        finalized = (kinds == INTEREST_SATISFIED_EVENT) | (kinds == INTEREST_UNSATISFIED_EVENT)
+        relevant = np.flatnonzero((kinds == INCOMING_INTEREST_EVENT) | (kinds == INTEREST_LOOP_EVENT) | finalized)
+        order = relevant[np.argsort(nameIds[relevant], kind="stable")]
+        orderedNames, orderedKinds = nameIds[order], kinds[order]
+        looped = np.zeros(len(order), dtype=bool)
+        looped[:-1] = (orderedNames[1:] == orderedNames[:-1]) & (orderedKinds[1:] == INTEREST_LOOP_EVENT) & \
+                      (orderedKinds[:-1] == INCOMING_INTEREST_EVENT)
+        keep = (orderedKinds != INTEREST_LOOP_EVENT) & ~looped
+        order, orderedNames, orderedKinds = order[keep], orderedNames[keep], orderedKinds[keep]
+
+        firstOfName = np.ones(len(order), dtype=bool)
+        firstOfName[1:] = orderedNames[1:] != orderedNames[:-1]
+        wasPending = np.array([name in self.pending for name in uniqueNames], dtype=bool)
+        pending = np.zeros(len(order), dtype=bool)
+        pending[1:] = orderedKinds[:-1] == INCOMING_INTEREST_EVENT
+        pending[firstOfName] = wasPending[orderedNames[firstOfName]]
+        isIncoming = orderedKinds == INCOMING_INTEREST_EVENT
+        lastOfName = np.ones(len(order), dtype=bool)
+        lastOfName[:-1] = firstOfName[1:]
+        for nameId, incoming in zip(orderedNames[lastOfName].tolist(), isIncoming[lastOfName].tolist()):
+            if incoming:
+                self.pending.add(uniqueNames[nameId])
+            else:
+                self.pending.discard(uniqueNames[nameId])
+
+        inserted, aggregated = order[isIncoming & ~pending], order[isIncoming & pending]
+        self.inserted.update(Counter(groupIds[inserted].tolist()))
+        self.aggregated.update(Counter(groupIds[aggregated].tolist()))
+        changes = np.zeros(len(kinds), dtype=np.int64)
+        changes[inserted] = 1
+        changes[order[~isIncoming & pending]] = -1
+        # In time order, as far as a block goes: lines logged out of order across a block boundary aren't swapped back
+        running = self.occupancy + np.cumsum(changes[np.argsort(timestamps, kind="stable")])
+        self.peakPitOccupancy = max(self.peakPitOccupancy, int(running.max()))
+        self.occupancy = int(running[-1])
+        changed = np.flatnonzero(changes)
+        # By the bin they end, like ForwardingEvents.getPitOccupancy's occupancy at the end of each bin
+        self.pitChanges.add(np.zeros(len(changed), dtype=np.int64), np.ceil(timestamps[changed] / self.pitChanges.binWidth).astype(np.int64) - 1,
+                            changes[changed])
+
+    def getEvents(self) -> BinnedForwardingEvents:
+        if self.heldBack is not None:
+            heldBack, self.heldBack = self.heldBack, None
+            self.countEvents(heldBack[0], heldBack[1], heldBack[2], [heldBack[3]])
+        groups = list(self.groups)
+        timeRange = (self.first, self.last) if self.numEvents > 0 else (np.nan, np.nan)
+        return BinnedForwardingEvents(groups, dict(self.totals), np.array([self.aggregated[i] for i in range(len(groups))], dtype=np.int64),
+                                      np.array([self.inserted[i] for i in range(len(groups))], dtype=np.int64), list(self.rateKeys), self.rates,
+                                      self.pitChanges, self.peakPitOccupancy, self.numEvents, timeRange)
+
+    @staticmethod
+    def fromEvents(events: ForwardingEvents, chunkRows: int = 1 << 20) -> BinnedForwardingEvents:
+        scanner = BinnedForwardingEventScanner()
+        names = [name.encode() for name in events.names]
+        for i in range(0, len(events), chunkRows):
+            scanner.addEvents(events.timestamps[i:i + chunkRows], events.kinds[i:i + chunkRows], events.faces[i:i + chunkRows],
+                              [names[nameId] for nameId in events.nameIds[i:i + chunkRows].tolist()])
+        return scanner.getEvents()
+
+
+def scanNfdLogBinned(nodeDir: str) -> (BinnedCacheEvents, BinnedForwardingEvents):
+    # scanNfdLog, counting the events as they are read instead of keeping them
+    cacheScanner = BinnedCacheEventScanner()
+    forwardingScanner = BinnedForwardingEventScanner()
+    fileName = buildFileName(nodeDir, NFD_LOG_FILE)
+    try:
+        for block in readLineBlocks(fileName, binary=True):
+            cacheScanner.feed(block)
+            forwardingScanner.feed(block)
+    except FileNotFoundError:
+        print("Could not find file %s " % fileName)
+    return cacheScanner.getEvents(), forwardingScanner.getEvents()
+
+
 class NfdLogParser:
 
-    def __init__(self, nodeName: str, nodeDir: str):
-        self.lines: List[str] = readFileSafe(nodeDir, NFD_LOG_FILE)
+    def __init__(self, nodeName: str, nodeDir: str, events: CacheEvents = None, forwarding: ForwardingEvents = None,
+                 boundedMemory: bool = False):
         self.nodeName = nodeName
-        (cacheRates, totalLookups, totalHits) = self.buildCacheRates()
+        self.nodeDir = nodeDir
+        # Every lookup and hit with its time, kept for the time series; the totals below are derived from them.
+        # With boundedMemory only their counts by DEFAULT_BIN_WIDTH bin are kept, which is all the analysis plots.
+        if events is None:
+            events, forwarding = scanNfdLogBinned(nodeDir) if boundedMemory else scanNfdLog(nodeDir)
+        elif boundedMemory and isinstance(events, CacheEvents):
+            events = BinnedCacheEvents.fromEvents(events)
+            forwarding = None if forwarding is None else BinnedForwardingEventScanner.fromEvents(forwarding)
+        self.events: Union[CacheEvents, BinnedCacheEvents] = events
+        # Empty unless NFD logged its Forwarder at DEBUG
+        self.forwarding: Union[ForwardingEvents, BinnedForwardingEvents] = ForwardingEventScanner().getEvents() if forwarding is None else forwarding
+        (cacheRates, totalLookups, totalHits) = self.events.getCacheRates()
         self.cacheRates: Dict[str, Dict[str, CacheRate]] = cacheRates
         self.totalLookups = totalLookups
         self.totalHits = totalHits
@@ -60,6 +990,14 @@ class NfdLogParser:
         return 100 * hits / lookups
 
 
+    def getCacheRateSeries(self, binWidth: float = DEFAULT_BIN_WIDTH, start: float = None, end: float = None,
+                           playerName: str = None, objectType: str = None) -> CacheRateSeries:
+        return self.events.getCacheRateSeries(binWidth, start, end, playerName, objectType)
+
+    def plotCacheRateOverTime(self, ax, start: float, binWidth: float = DEFAULT_BIN_WIDTH, end: float = None, objectType: str = None):
+        series = self.getCacheRateSeries(binWidth, start, end, objectType=objectType)
+        ax.plot(series.getTimes() - start, series.getHitRates(), label=self.nodeName)
+
     def getCacheRatesForPlayer(self, playerName: str) -> Dict[str, CacheRate]:
         return self.cacheRates[playerName]
 
@@ -68,32 +1006,3 @@ class NfdLogParser:
         for player, cacheRateByObjectType in self.cacheRates.items():
             cacheRateByPlayer[player] = cacheRateByObjectType[objectType]
         return cacheRateByPlayer
-
-    def buildCacheRates(self, playerName: str = ".*", objectType: str = ".*") -> (CacheRate, int, int):
-        cacheRates = defaultdict(lambda: defaultdict(CacheRate))
-        cacheLookupLine = CACHE_LOOKUP_LINE.format(playerName=playerName, objectType=objectType)
-        cacheHitLine = CACHE_HIT_LINE.format(playerName=playerName, objectType=objectType)
-        numLookups: int = 0
-        numCacheHits: int = 0
-
-        for i, line in enumerate(self.lines):
-            cacheLookupMatch = re.search(cacheLookupLine, line)
-            if cacheLookupMatch:
-                numLookups = numLookups + 1
-                playerName: str = cacheLookupMatch.group(1)
-                objectType: str = cacheLookupMatch.group(2)
-                cacheRates[playerName][objectType].addLookup()
-                continue
-
-            cacheHitMatch = re.search(cacheHitLine, line)
-            if cacheHitMatch:
-                numCacheHits = numCacheHits + 1
-                playerName: str = cacheHitMatch.group(1)
-                objectType: str = cacheHitMatch.group(2)
-                cacheRates[playerName][objectType].addHitWithoutLookup()
-                continue
-
-        cacheRates = sorted(cacheRates.items(), key=lambda kv: kv[0])
-        cacheRates = OrderedDict(cacheRates)
-
-        return cacheRates, numLookups, numCacheHits
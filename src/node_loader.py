@@ -0,0 +1,226 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import dead_reckoning_analyzer
+import interest_aggregation
+import interest_rate
+from dead_reckoning_analyzer import DeadReckoningAnalyzer
+from histogram_store import HistogramStore, HISTOGRAM_VALUES_FILE, RTT_KEYS, STATUS_DELTA_KEYS
+from interest_aggregation import readInterestsCounters
+from interest_rate import InterestRatesForNode
+from log_reader import LogReader, LOG_FILE
+from nfd_log_parser import NfdLogParser, NFD_LOG_FILE
+from packet_time_histograms import PacketTimeHistograms
+from parse_cache import ParseCache, fingerprint
+from snapshot import ExperimentSnapshot
+from status_deltas import StatusDeltasHistograms
+
+NFD = "nfdLogParser"
+PACKET_TIMES = "packetTimeHistograms"
+STATUS_DELTAS = "statusDeltasHistograms"
+INTEREST_RATES = "interestRates"
+INTERESTS_COUNTERS = "interestsCounters"
+DEAD_RECKONING = "deadReckoning"
+LOG_ERRORS = "logReader"
+BOUNDED_MEMORY = "boundedMemory"
+
+ROUTER_PARTS = [NFD]
+GAME_NODE_PARTS = [NFD, PACKET_TIMES, STATUS_DELTAS, INTEREST_RATES, INTERESTS_COUNTERS, DEAD_RECKONING, LOG_ERRORS]
+
+# Bump a part's version whenever its parser's output changes so stale cache entries are ignored
+PART_VERSIONS = {
+    NFD: 3,
+    PACKET_TIMES: 3,
+    STATUS_DELTAS: 3,
+    INTEREST_RATES: 3,
+    INTERESTS_COUNTERS: 2,
+    DEAD_RECKONING: 2,
+    LOG_ERRORS: 2,
+}
+
+# Parts parsed from the same file: when several are needed for a node they are loaded by one task that reads the file once
+SHARED_SOURCES = {
+    PACKET_TIMES: HISTOGRAM_VALUES_FILE,
+    STATUS_DELTAS: HISTOGRAM_VALUES_FILE,
+}
+HISTOGRAM_KEYS = "|".join([RTT_KEYS.pattern, STATUS_DELTA_KEYS.pattern])
+
+# (node, nodeDir, parts, boundedMemory)
+LoadTask = Tuple[str, str, List[str], bool]
+
+
+class NodeData:
+
+    def __init__(self, node: str, nodeDir: str):
+        self.node = node
+        self.nodeDir = nodeDir
+        self.nfdLogParser: NfdLogParser = None
+        self.packetTimeHistograms: PacketTimeHistograms = None
+        self.statusDeltasHistograms: StatusDeltasHistograms = None
+        self.interestRates: InterestRatesForNode = None
+        self.interestsCounters: Dict[str, Dict[str, int]] = None
+        self.deadReckoning: DeadReckoningAnalyzer = None
+        self.logReader: LogReader = None
+        self.loadedParts = set()
+
+    def hasPart(self, part: str) -> bool:
+        return part in self.loadedParts
+
+    def setPart(self, part: str, value):
+        setattr(self, part, value)
+        self.loadedParts.add(part)
+
+
+def loadPart(node: str, nodeDir: str, part: str, histogramStore: HistogramStore = None, boundedMemory: bool = False):
+    # Runs in a worker process: everything returned here must be picklable
+    try:
+        if part == NFD:
+            return NfdLogParser(node, nodeDir, boundedMemory=boundedMemory)
+        if part == PACKET_TIMES:
+            return PacketTimeHistograms(nodeDir, node, None if histogramStore is None else histogramStore.select(RTT_KEYS))
+        if part == STATUS_DELTAS:
+            return StatusDeltasHistograms(node, nodeDir, None if histogramStore is None else histogramStore.select(STATUS_DELTA_KEYS))
+        if part == INTEREST_RATES:
+            return InterestRatesForNode(nodeDir, node)
+        if part == INTERESTS_COUNTERS:
+            return readInterestsCounters(nodeDir)
+        if part == DEAD_RECKONING:
+            return DeadReckoningAnalyzer(node, nodeDir)
+        if part == LOG_ERRORS:
+            return LogReader(node, nodeDir, interactive=False)
+    except FileNotFoundError as e:
+        print("Could not load %s for %s: %s" % (part, node, e))
+        return None
+    raise ValueError("Unknown node data part %s" % part)
+
+
+def loadSnapshotPart(snapshot: ExperimentSnapshot, node: str, nodeDir: str, part: str, boundedMemory: bool = False):
+    # Same results as loadPart, built from the arrays of an already mapped snapshot instead of the node directory
+    try:
+        if part == NFD:
+            events = snapshot.getCacheEvents(node)
+            if events is None:
+                print("Could not find file %s " % os.path.join(nodeDir, NFD_LOG_FILE))
+            return NfdLogParser(node, nodeDir, events=events, forwarding=snapshot.getForwardingEvents(node), boundedMemory=boundedMemory)
+        if part in (PACKET_TIMES, STATUS_DELTAS):
+            histograms = snapshot.getHistograms(node)
+            if histograms is None:
+                raise FileNotFoundError(os.path.join(nodeDir, HISTOGRAM_VALUES_FILE))
+            if part == PACKET_TIMES:
+                return PacketTimeHistograms(nodeDir, node, histograms)
+            return StatusDeltasHistograms(node, nodeDir, histograms)
+        if part == INTEREST_RATES:
+            metricsByType = {o: snapshot.getMetricTable(node, interest_rate.fileNameFormat.format(nodeName=node, objectType=o))
+                             for o in interest_rate.objectTypes}
+            return InterestRatesForNode(nodeDir, node, metricsByType=metricsByType)
+        if part == INTERESTS_COUNTERS:
+            return readInterestsCounters(nodeDir, snapshot.getMetricTables(node))
+        if part == DEAD_RECKONING:
+            try:
+                counters = {name: int(snapshot.getMetricTable(node, dead_reckoning_analyzer.FILE_FORMAT.format(name))[-1]["count"])
+                            for name in dead_reckoning_analyzer.counterNames}
+            except FileNotFoundError:
+                counters = {}
+            return DeadReckoningAnalyzer(node, nodeDir, counters)
+        if part == LOG_ERRORS:
+            errors = snapshot.getErrors(node)
+            if errors is None:
+                print("Could not find file %s " % os.path.join(nodeDir, LOG_FILE))
+            return LogReader(node, nodeDir, interactive=False, errors=[] if errors is None else errors)
+    except FileNotFoundError as e:
+        print("Could not load %s for %s: %s" % (part, node, e))
+        return None
+    raise ValueError("Unknown node data part %s" % part)
+
+
+def getSourceFiles(node: str, nodeDir: str, part: str) -> List[str]:
+    if part == NFD:
+        fileNames = [NFD_LOG_FILE]
+    elif part in (PACKET_TIMES, STATUS_DELTAS):
+        fileNames = [HISTOGRAM_VALUES_FILE]
+    elif part == INTEREST_RATES:
+        fileNames = [interest_rate.fileNameFormat.format(nodeName=node, objectType=o) for o in interest_rate.objectTypes]
+    elif part == INTERESTS_COUNTERS:
+        fileNames = [f for f in os.listdir(nodeDir) if interest_aggregation.fileNamePattern.match(f)] if os.path.isdir(nodeDir) else []
+    elif part == DEAD_RECKONING:
+        fileNames = [dead_reckoning_analyzer.FILE_FORMAT.format(name) for name in dead_reckoning_analyzer.counterNames]
+    elif part == LOG_ERRORS:
+        fileNames = [LOG_FILE]
+    else:
+        raise ValueError("Unknown node data part %s" % part)
+    return [os.path.join(nodeDir, f) for f in fileNames]
+
+
+def getCacheKey(nodeDir: str, part: str, boundedMemory: bool = False) -> tuple:
+    # Binned nfd.log parses are cached apart from full ones, so switching modes doesn't throw either away
+    if boundedMemory and part == NFD:
+        return os.path.abspath(nodeDir), part, BOUNDED_MEMORY
+    return os.path.abspath(nodeDir), part
+
+
+def loadParts(node: str, nodeDir: str, parts: List[str], boundedMemory: bool = False) -> list:
+    histogramStore = HistogramStore(nodeDir, HISTOGRAM_KEYS) if sum(p in SHARED_SOURCES for p in parts) > 1 else None
+    return [loadPart(node, nodeDir, part, histogramStore, boundedMemory) for part in parts]
+
+
+def loadPartsTask(task: LoadTask) -> list:
+    return loadParts(*task)
+
+
+def runLoadTasks(tasks: List[LoadTask], jobs: int = 1) -> list:
+    if jobs <= 1 or len(tasks) <= 1:
+        return [loadPartsTask(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        return list(executor.map(loadPartsTask, tasks))
+
+
+def loadNodes(nodeDirs: Dict[str, str], partsByNode: Dict[str, List[str]], jobs: int = 1,
+              loaded: Dict[str, NodeData] = None, cache: ParseCache = None, snapshot: ExperimentSnapshot = None,
+              boundedMemory: bool = False) -> Dict[str, NodeData]:
+    # boundedMemory: keep only binned counts of each nfd.log's events (see NfdLogParser) so memory doesn't grow with the logs
+    nodeData: Dict[str, NodeData] = {} if loaded is None else loaded
+    cache = ParseCache() if cache is None else cache
+    for node, nodeDir in nodeDirs.items():
+        nodeData.setdefault(node, NodeData(node, nodeDir))
+
+    if snapshot is not None:
+        # Everything is already parsed into the snapshot's arrays so there is nothing worth caching or farming out
+        for part in GAME_NODE_PARTS:
+            for node, parts in partsByNode.items():
+                if part in parts and not nodeData[node].hasPart(part):
+                    nodeData[node].setPart(part, loadSnapshotPart(snapshot, node, nodeDirs[node], part, boundedMemory))
+        return nodeData
+
+    # One task per (node, part) so a single big nfd.log doesn't hold up the rest of its node,
+    # with the nfd.log parses (the slowest parts) queued first. Parts sharing a source file share a task.
+    tasks: List[LoadTask] = []
+    sharedTasks: Dict[Tuple[str, str], LoadTask] = {}
+    filePrints = {}
+    for part in GAME_NODE_PARTS:
+        for node, parts in partsByNode.items():
+            if part not in parts or nodeData[node].hasPart(part):
+                continue
+            nodeDir = nodeDirs[node]
+            filePrint = fingerprint(getSourceFiles(node, nodeDir, part), PART_VERSIONS[part])
+            hit, value = cache.get(getCacheKey(nodeDir, part, boundedMemory), filePrint)
+            if hit:
+                nodeData[node].setPart(part, value)
+                continue
+            filePrints[(node, part)] = filePrint
+            if (node, SHARED_SOURCES.get(part)) in sharedTasks:
+                sharedTasks[(node, SHARED_SOURCES[part])][2].append(part)
+                continue
+            tasks.append((node, nodeDir, [part], boundedMemory))
+            if part in SHARED_SOURCES:
+                sharedTasks[(node, SHARED_SOURCES[part])] = tasks[-1]
+
+    for (node, nodeDir, parts, _), results in zip(tasks, runLoadTasks(tasks, jobs)):
+        for part, result in zip(parts, results):
+            nodeData[node].setPart(part, result)
+            cache.put(getCacheKey(nodeDir, part, boundedMemory), filePrints[(node, part)], result)
+    return nodeData
+
+
+def defaultJobs() -> int:
+    return os.cpu_count() or 1
@@ -1,12 +1,11 @@
-import json
-import os
 from typing import List, Dict
 
 import numpy as np
 
-HISTOGRAM_VALUES_FILE = "histogram_values.json"
+from histogram_store import readHistogramValues, RTT_KEYS
+from percentiles import SampleHistogram
 
-HistogramValues = List[int]
+HistogramValues = np.ndarray
 
 
 # Format of metric names is : sub-<object-type>-<latency|rtt>-<player_name>
@@ -16,7 +15,7 @@ class PacketTimeMetric:
         self.objectType: str = pieces[1]
         self.metricType: str = pieces[2]
         self.playerName: str = pieces[3]
-        self.histogramValues: HistogramValues = histogramValues
+        self.histogramValues: HistogramValues = np.asarray(histogramValues)
 
 
 Metrics = List[PacketTimeMetric]
@@ -25,16 +24,15 @@ MetricsByObjectType = Dict[str, Dict[str, Metrics]]
 
 class PacketTimeHistograms:
 
-    def __init__(self, dir, nodeName):
+    def __init__(self, dir, nodeName, histograms: Dict[str, HistogramValues] = None):
         self.nodeName = nodeName
-        histogramsFile = os.path.join(dir, HISTOGRAM_VALUES_FILE)
-        with open(histogramsFile) as f:
-            histograms = json.load(f)
-            metrics = []
-            for name, val in histograms.items():
-                if "rtt" not in name:
-                    continue
-                metrics.append(PacketTimeMetric(name, val))
+        if histograms is None:
+            histograms = readHistogramValues(dir, RTT_KEYS)
+        metrics = []
+        for name, val in histograms.items():
+            if "rtt" not in name:
+                continue
+            metrics.append(PacketTimeMetric(name, val))
 
         self.metricsByObjectType: MetricsByObjectType = {"status": {}, "blocks": {}, "projectiles": {}}
         for playerMetric in metrics:
@@ -61,9 +59,10 @@ class PacketTimeHistograms:
             ax.set_xlabel("Time (ms)")
             ax.legend(loc='upper right')
 
-    def getAllData(self):
-        listByPlayer = [ptm.histogramValues for ptm in self.metricsByObjectType["status"]["rtt"]]
-        agg = [val for sublist in listByPlayer for val in sublist]
-        return agg
+    def getAllData(self, objectType='status', metricType="rtt") -> np.ndarray:
+        return np.concatenate([ptm.histogramValues for ptm in self.metricsByObjectType[objectType][metricType]])
+
+    def getSampleHistogram(self, objectType='status', metricType="rtt") -> SampleHistogram:
+        return SampleHistogram.fromSamples(self.getAllData(objectType, metricType))
 
 
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import pickle
+from typing import List, Tuple, Optional, Dict
+
+CACHE_DIR_NAME = ".ndn-analytics-cache"
+
+# (version, ((fileName, size, mtime), ...)) with size and mtime None for missing files
+Fingerprint = Tuple[int, Tuple[Tuple[str, Optional[int], Optional[int]], ...]]
+
+# Shared by every ParseCache in the process so repeated runs over the same directories never touch the disk cache
+memo: Dict[Tuple[str, str], Tuple[Fingerprint, object]] = {}
+
+
+def getCacheDirFor(dataDir: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(dataDir)), CACHE_DIR_NAME)
+
+
+def fingerprint(fileNames: List[str], version: int) -> Fingerprint:
+    stats = []
+    for fileName in sorted(fileNames):
+        try:
+            st = os.stat(fileName)
+            stats.append((fileName, st.st_size, st.st_mtime_ns))
+        except FileNotFoundError:
+            stats.append((fileName, None, None))
+    return version, tuple(stats)
+
+
+class ParseCache:
+
+    def __init__(self, cacheDir: str = None):
+        # Without a cache directory only the in-process memo is used
+        self.cacheDir = cacheDir
+        if cacheDir is not None:
+            os.makedirs(cacheDir, exist_ok=True)
+
+    def getCacheFile(self, key: Tuple[str, str]) -> str:
+        digest = hashlib.sha1("\0".join(key).encode()).hexdigest()
+        return os.path.join(self.cacheDir, digest + ".pickle")
+
+    def get(self, key: Tuple[str, str], filePrint: Fingerprint):
+        # Returns (hit, value) as None is a valid parsed result
+        if key in memo and memo[key][0] == filePrint:
+            return True, memo[key][1]
+        if self.cacheDir is None:
+            return False, None
+        try:
+            with open(self.getCacheFile(key), "rb") as f:
+                cachedPrint, value = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return False, None
+        if cachedPrint != filePrint:
+            return False, None
+        memo[key] = (filePrint, value)
+        return True, value
+
+    def put(self, key: Tuple[str, str], filePrint: Fingerprint, value):
+        memo[key] = (filePrint, value)
+        if self.cacheDir is None:
+            return
+        # Write then rename so an interrupted run never leaves a truncated entry behind
+        cacheFile = self.getCacheFile(key)
+        tmpFile = "%s.%d.tmp" % (cacheFile, os.getpid())
+        with open(tmpFile, "wb") as f:
+            pickle.dump((filePrint, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpFile, cacheFile)
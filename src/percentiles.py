@@ -0,0 +1,96 @@
+from typing import List, Dict, Iterable
+
+import numpy as np
+
+PERCENTILES = [50, 95, 99, 99.9]
+PERCENTILE_NAMES = ["p50", "p95", "p99", "p999"]
+
+
+def roundToSignificantDigits(values: np.ndarray, significantDigits: int) -> np.ndarray:
+    # HDR histogram style buckets: every value is kept to within a relative error of 10^-(significantDigits - 1)
+    magnitudes = np.floor(np.log10(np.maximum(np.abs(values), 1)))
+    step = 10 ** np.maximum(magnitudes - significantDigits + 1, 0)
+    return (np.round(values / step) * step).astype(values.dtype)
+
+
+class SampleHistogram:
+    # Every distinct sample value and how often it was seen. The histogram_values.json samples are integers
+    # with few distinct values, so this is both exact and much smaller than the samples, and histograms of
+    # different nodes and experiments merge by adding counts instead of concatenating samples.
+    # Values are stored as sampled and divided by divisor (e.g. DISTANCE_SCALE_FACTOR) in everything read back.
+
+    def __init__(self, values: np.ndarray, counts: np.ndarray, divisor: float = 1.0):
+        self.values = values
+        self.counts = counts
+        self.divisor = divisor
+
+    @staticmethod
+    def fromSamples(samples: np.ndarray, divisor: float = 1.0, significantDigits: int = None):
+        samples = np.asarray(samples, dtype=np.int64)
+        if significantDigits is not None:
+            samples = roundToSignificantDigits(samples, significantDigits)
+        values, counts = np.unique(samples, return_counts=True)
+        return SampleHistogram(values, counts, divisor)
+
+    @staticmethod
+    def merge(histograms: Iterable, divisor: float = None):
+        histograms = list(histograms)
+        if len(histograms) == 0:
+            return SampleHistogram(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), 1.0 if divisor is None else divisor)
+        divisor = histograms[0].divisor if divisor is None else divisor
+        values, inverse = np.unique(np.concatenate([h.values for h in histograms]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([h.counts for h in histograms]), minlength=len(values))
+        return SampleHistogram(values, counts.astype(np.int64), divisor)
+
+    def getCount(self) -> int:
+        return int(self.counts.sum())
+
+    def getMean(self) -> float:
+        if self.getCount() == 0:
+            return np.nan
+        return float(np.dot(self.values, self.counts) / self.getCount() / self.divisor)
+
+    def getPercentiles(self, percentiles: List[float] = PERCENTILES) -> np.ndarray:
+        # Same as np.percentile of the samples (linear interpolation between the closest ranks)
+        count = self.getCount()
+        if count == 0:
+            return np.full(len(percentiles), np.nan)
+        ranks = (count - 1) * np.asarray(percentiles, dtype=np.float64) / 100
+        below = np.floor(ranks)
+        cumulative = np.cumsum(self.counts)
+        lower = self.values[np.searchsorted(cumulative, below, side="right")]
+        upper = self.values[np.searchsorted(cumulative, np.minimum(below + 1, count - 1), side="right")]
+        return (lower + (ranks - below) * (upper - lower)) / self.divisor
+
+    def getSummary(self, percentiles: List[float] = PERCENTILES, names: List[str] = PERCENTILE_NAMES) -> Dict[str, float]:
+        summary = {"count": self.getCount(), "mean": self.getMean()}
+        summary.update(zip(names, self.getPercentiles(percentiles).tolist()))
+        return summary
+
+    def getCdf(self) -> (np.ndarray, np.ndarray):
+        # Each distinct value and the fraction of samples at or below it
+        return self.values / self.divisor, np.cumsum(self.counts) / max(self.getCount(), 1)
+
+    def getHistogram(self, bins: np.ndarray, percentage: bool = True) -> np.ndarray:
+        # Counts (or % of all samples) per bin, as np.histogram of the samples would give
+        counts, _ = np.histogram(self.values / self.divisor, bins=bins, weights=self.counts)
+        if percentage:
+            counts = 100 * counts / max(self.getCount(), 1)
+        return counts
+
+
+def plotMergedHistograms(ax, histograms: List[SampleHistogram], labels: List[str], bins: np.ndarray):
+    # Draws what ax.hist(samples, weights=<% of each sample set>) would, from the summaries alone
+    centres = (bins[:-1] + bins[1:]) / 2
+    ax.hist([centres] * len(histograms), bins=bins, weights=[h.getHistogram(bins) for h in histograms], label=labels)
+
+
+def formatPercentileTable(title: str, histogramsByRow: Dict[str, SampleHistogram], unit: str = "") -> str:
+    lines = [title, "%-16s %9s %9s " % ("", "count", "mean") + " ".join("%9s" % name for name in PERCENTILE_NAMES)]
+    for row, histogram in histogramsByRow.items():
+        summary = histogram.getSummary()
+        lines.append("%-16s %9d %9.2f " % (row, summary["count"], summary["mean"]) +
+                     " ".join("%9.2f" % summary[name] for name in PERCENTILE_NAMES))
+    if unit:
+        lines[0] += " (%s)" % unit
+    return "\n".join(lines)
@@ -0,0 +1,206 @@
+import argparse
+import fnmatch
+import os
+import time
+from typing import List, Union, Optional, Tuple, Iterable
+
+import numpy as np
+
+from catalogue import Catalogue, ExperimentEntry, loadCatalogue, METRIC_EXTENSION
+from histogram_store import HISTOGRAM_VALUES_FILE, readHistogramValues
+from metric_csv import parseSeriesName, readMetricCsvRange, selectTimeRange
+from snapshot import ExperimentSnapshot, openFreshSnapshot
+
+# select() answers questions like "p95 status RTT of nodeC as seen by every subscriber in every dead reckoning scenario"
+# from the catalogue of the data root. Its filters pick the experiments, nodes and series by their names alone, so only the
+# files that can match are opened, a metric CSV is read from the first row of the time range up to its last, and of
+# histogram_values.json only the selected series have their numbers parsed.
+CSV = "csv"
+HISTOGRAM = "histogram"
+SOURCES = [CSV, HISTOGRAM]
+
+# One name, any of several, or None for all of them
+Filter = Union[str, Iterable[str], None]
+# (start, end) in the metric CSVs' epoch seconds, both inclusive and either None for open
+TimeRange = Tuple[Optional[int], Optional[int]]
+
+
+class Series:
+    # One series of one node: its CSV rows' times (None for histogram samples) and values, the field asked for or whole rows
+
+    def __init__(self, scenario: str, node: str, name: str, objectType: Optional[str], player: Optional[str], t: Optional[np.ndarray],
+                 values: np.ndarray):
+        self.scenario = scenario
+        self.node = node
+        self.name = name
+        self.objectType = objectType
+        self.player = player
+        self.t = t
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+
+def toSet(values: Filter) -> Optional[set]:
+    if values is None:
+        return None
+    return {values} if isinstance(values, str) else set(values)
+
+
+class SeriesFilter:
+    # Matches series names (CSV files without .csv, histogram keys) on their family, object type and peer.
+    # name is an fnmatch pattern on the whole name, for the series without either, e.g. dr-counter-velocity.
+
+    def __init__(self, metric: str, objectType: Filter = None, player: Filter = None, name: str = None):
+        self.metric = metric
+        self.objectTypes = toSet(objectType)
+        self.players = toSet(player)
+        self.name = name
+
+    def matches(self, series: str) -> bool:
+        family, objectType, peer = parseSeriesName(series)
+        return family == self.metric and (self.objectTypes is None or objectType in self.objectTypes) \
+            and (self.players is None or peer in self.players) and (self.name is None or fnmatch.fnmatchcase(series, self.name))
+
+
+def makeSeries(scenario: str, node: str, series: str, table: np.ndarray, field: Optional[str]) -> Series:
+    _, objectType, peer = parseSeriesName(series)
+    if field is not None and field not in table.dtype.names:
+        raise ValueError("%s has no field %s, only %s" % (series, field, ", ".join(table.dtype.names)))
+    return Series(scenario, node, series, objectType, peer, table["t"], table if field is None else table[field])
+
+
+def selectFromDir(entry: ExperimentEntry, node: str, seriesFilter: SeriesFilter, source: str, timeRange: TimeRange,
+                  field: Optional[str]) -> List[Series]:
+    # Which files exist comes from the catalogue, so nothing but the matching files is touched
+    files = entry.nodes[node].files
+    selected = []
+    if source == HISTOGRAM:
+        if HISTOGRAM_VALUES_FILE not in files:
+            return selected
+        try:
+            histograms = readHistogramValues(os.path.join(entry.path, node), seriesFilter.matches)
+        except FileNotFoundError:
+            print("Could not find file %s" % entry.getFilePath(node, HISTOGRAM_VALUES_FILE))
+            return selected
+        for series, samples in sorted(histograms.items()):
+            _, objectType, peer = parseSeriesName(series)
+            selected.append(Series(entry.scenario, node, series, objectType, peer, None, samples))
+        return selected
+
+    for fileName in sorted(files):
+        series = fileName[:-len(METRIC_EXTENSION)]
+        if not fileName.endswith(METRIC_EXTENSION) or not seriesFilter.matches(series):
+            continue
+        try:
+            table = readMetricCsvRange(entry.getFilePath(node, fileName), None, *timeRange)
+        except FileNotFoundError:
+            print("Could not find file %s" % entry.getFilePath(node, fileName))
+            continue
+        selected.append(makeSeries(entry.scenario, node, series, table, field))
+    return selected
+
+
+def selectFromSnapshot(snapshot: ExperimentSnapshot, scenario: str, node: str, seriesFilter: SeriesFilter, source: str,
+                       timeRange: TimeRange, field: Optional[str]) -> List[Series]:
+    selected = []
+    if source == HISTOGRAM:
+        histograms = snapshot.getHistograms(node) or {}
+        for series in sorted(filter(seriesFilter.matches, histograms)):
+            _, objectType, peer = parseSeriesName(series)
+            selected.append(Series(scenario, node, series, objectType, peer, None, histograms[series]))
+        return selected
+
+    for fileName in sorted(snapshot.getNodeHeader(node)["metrics"]):
+        series = fileName[:-len(METRIC_EXTENSION)]
+        if seriesFilter.matches(series):
+            table = selectTimeRange(snapshot.getMetricTable(node, fileName), *timeRange)
+            selected.append(makeSeries(scenario, node, series, table, field))
+    return selected
+
+
+def select(root: Union[str, Catalogue], metric: str, scenario: str = None, node: Filter = None, objectType: Filter = None,
+           player: Filter = None, timeRange: TimeRange = None, field: str = None, name: str = None, topology: str = None,
+           source: str = CSV, useSnapshots: bool = False) -> List[Series]:
+    # metric is a series family: rtt, interestscounter, pub-interest-rate, pub-update-percentage, delta, packet-size or
+    # dr-counter. scenario is an fnmatch pattern as in Catalogue.find, player the peer a series is about (the publisher a
+    # subscriber's RTT is to, or the node itself for its pub-* series) and field a CSV column such as p95, else whole rows.
+    # An experiment is read from its snapshot when asked to, or when the snapshot is all there is of it.
+    if source not in SOURCES:
+        raise ValueError("Unknown source %s, expected one of %s" % (source, ", ".join(SOURCES)))
+    if source == HISTOGRAM and (timeRange is not None or field is not None):
+        raise ValueError("Histogram samples have no times or fields to select on")
+    catalogue = loadCatalogue(root) if isinstance(root, str) else root
+    seriesFilter = SeriesFilter(metric, objectType, player, name)
+    nodes = toSet(node)
+    timeRange = (None, None) if timeRange is None else timeRange
+
+    selected = []
+    for entry in catalogue.find(topology, scenario):
+        onlySnapshot = all(len(n.files) == 0 for n in entry.nodes.values())
+        snapshot = openFreshSnapshot(entry.snapshot, entry.path) if entry.snapshot is not None and (useSnapshots or onlySnapshot) else None
+        for nodeName in entry.getNodes():
+            if nodes is not None and nodeName not in nodes:
+                continue
+            if snapshot is not None:
+                selected += selectFromSnapshot(snapshot, entry.scenario, nodeName, seriesFilter, source, timeRange, field)
+            else:
+                selected += selectFromDir(entry, nodeName, seriesFilter, source, timeRange, field)
+    return selected
+
+
+def stackValues(selected: List[Series]) -> np.ndarray:
+    # Every selected series' values as one array, e.g. for percentiles over all subscribers
+    if len(selected) == 0:
+        return np.zeros(0)
+    return np.concatenate([s.values for s in selected])
+
+
+def formatSeries(selected: List[Series]) -> str:
+    # Each name column as wide as its longest value
+    widths = [max([len(heading)] + [len(getattr(s, column)) for s in selected]) for heading, column in
+              [("scenario", "scenario"), ("node", "node"), ("series", "name")]]
+    lines = ["%-*s %-*s %-*s %8s %12s %12s %12s" % (widths[0], "scenario", widths[1], "node", widths[2], "series", "rows", "min", "mean", "max")]
+    for s in selected:
+        if s.values.dtype.names is None and len(s) > 0:
+            stats = "%12.3f %12.3f %12.3f" % (np.min(s.values), np.mean(s.values), np.max(s.values))
+        else:
+            stats = "%12s %12s %12s" % ("-", "-", "-")
+        lines.append("%-*s %-*s %-*s %8d %s" % (widths[0], s.scenario, widths[1], s.node, widths[2], s.name, len(s), stats))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select one metric's series from the experiments under a data root, "
+                                                 "opening only the files the filters can match")
+    parser.add_argument("root")
+    parser.add_argument("metric", help="Series family: rtt, interestscounter, pub-interest-rate, pub-update-percentage, delta, "
+                                       "packet-size or dr-counter")
+    parser.add_argument("--scenario", help="fnmatch pattern on the scenario's path under root")
+    parser.add_argument("--topology")
+    parser.add_argument("--node", nargs="+")
+    parser.add_argument("--object-type", dest="objectType", nargs="+")
+    parser.add_argument("--player", nargs="+")
+    parser.add_argument("--name", help="fnmatch pattern on the series name, e.g. 'dr-counter-velocity'")
+    parser.add_argument("--from", dest="start", type=int, help="First epoch second of the rows to select")
+    parser.add_argument("--to", dest="end", type=int, help="Last epoch second of the rows to select")
+    parser.add_argument("--field", help="CSV column, e.g. p95 or m1_rate")
+    parser.add_argument("--histograms", action="store_true", help="Select samples of histogram_values.json instead of CSV rows")
+    parser.add_argument("--snapshots", action="store_true", help="Read experiments from their snapshots where present")
+    parser.add_argument("--rescan", action="store_true", help="Rebuild the catalogue of root first")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalogue = loadCatalogue(args.root, args.rescan)
+    try:
+        found = select(catalogue, args.metric, args.scenario, args.node, args.objectType, args.player,
+                       None if args.start is None and args.end is None else (args.start, args.end), args.field, args.name,
+                       args.topology, HISTOGRAM if args.histograms else CSV, args.snapshots)
+    except ValueError as e:
+        parser.error(str(e))
+    print(formatSeries(found))
+    values = stackValues(found)
+    if values.dtype.names is None and len(values) > 0:
+        print("%d values over %d series: p50 %.3f p95 %.3f p99 %.3f" % (len(values), len(found), *np.percentile(values, [50, 95, 99])))
+    print("Selected in %.3fs" % (time.perf_counter() - start))
@@ -0,0 +1,154 @@
+import argparse
+import time
+import warnings
+from collections import defaultdict
+from typing import List, Dict, Tuple
+
+import numpy as np
+
+from catalogue import loadCatalogue
+from interest_rate import Rate, objectTypes
+from query import select
+
+# The interest rate series of an experiment's nodes as one nodes x bins array. Each node's cumulative meter count is
+# interpolated onto a grid of fixed steps from the experiment's first report and differenced, giving the rate over every
+# step: nodes that started late line up with the rest, and the bursts the meters' cumulative mean_rate smooths away show.
+INTEREST_RATE_METRIC = "pub-interest-rate"
+# The CsvReporter's reporting period
+DEFAULT_STEP = 10
+ROLLING_STATS = {"mean": np.nanmean, "std": np.nanstd, "min": np.nanmin, "max": np.nanmax}
+
+
+def getCountDeltas(counts: np.ndarray) -> np.ndarray:
+    # Increase of a cumulative count over each report interval. A drop is the meter restarting, so its new count is the increase.
+    counts = counts.astype(np.float64)
+    deltas = np.diff(counts)
+    restarts = deltas < 0
+    deltas[restarts] = counts[1:][restarts]
+    return deltas
+
+
+def getInstantRates(times: np.ndarray, counts: np.ndarray) -> (np.ndarray, np.ndarray):
+    # (end of each report interval, interests per second over it)
+    intervals = np.diff(times.astype(np.float64))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(intervals > 0, getCountDeltas(counts) / intervals, np.nan)
+    return times[1:], rates
+
+
+def resampleCounts(times: np.ndarray, counts: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    # The count at every grid time, linear between reports and NaN outside them, with restarts undone so it only grows
+    if len(times) == 0:
+        return np.full(len(grid), np.nan)
+    cumulative = np.concatenate([counts[:1].astype(np.float64), counts[0] + np.cumsum(getCountDeltas(counts))])
+    return np.interp(grid, times.astype(np.float64), cumulative, left=np.nan, right=np.nan)
+
+
+def rolling(values: np.ndarray, window: int, stat: str = "mean") -> np.ndarray:
+    # Stat of the trailing window along the last axis, over as many of its values as aren't NaN; same shape as values
+    if window <= 1:
+        return values.copy()
+    padding = np.full(values.shape[:-1] + (window - 1,), np.nan)
+    windows = np.lib.stride_tricks.sliding_window_view(np.concatenate([padding, values], axis=-1), window, axis=-1)
+    with warnings.catch_warnings():
+        # Windows with nothing but NaN in them stay NaN
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return ROLLING_STATS[stat](windows, axis=-1)
+
+
+class ExperimentRates:
+
+    def __init__(self, scenario: str, nodes: List[str], times: List[np.ndarray], counts: List[np.ndarray], step: float = DEFAULT_STEP,
+                 start: float = None):
+        self.scenario = scenario
+        self.nodes = nodes
+        self.step = step
+        reported = [t for t in times if len(t) > 0]
+        self.start = (min(t[0] for t in reported) if reported else 0) if start is None else start
+        end = max(t[-1] for t in reported) if reported else self.start
+        self.grid = self.start + step * np.arange(int(np.ceil((end - self.start) / step)) + 1)
+        # nodes x grid counts, and the rate over each step between grid times
+        self.counts = np.vstack([resampleCounts(t, c, self.grid) for t, c in zip(times, counts)]) if nodes else np.zeros((0, len(self.grid)))
+        self.rates = np.diff(self.counts, axis=1) / step
+
+    @staticmethod
+    def fromRates(scenario: str, ratesByNode: List[Tuple[str, Rate]], step: float = DEFAULT_STEP):
+        return ExperimentRates(scenario, [node for node, _ in ratesByNode], [r.times for _, r in ratesByNode],
+                               [r.counts for _, r in ratesByNode], step)
+
+    @staticmethod
+    def fromTables(scenario: str, tablesByNode: Dict[str, np.ndarray], step: float = DEFAULT_STEP):
+        # Meter tables as read from pub-interest-rate CSVs. As in Rate, the first report is taken before the game has settled
+        # and left out.
+        nodes = sorted(tablesByNode)
+        return ExperimentRates(scenario, nodes, [tablesByNode[n]["t"][1:] for n in nodes], [tablesByNode[n]["count"][1:] for n in nodes],
+                               step)
+
+    def getElapsed(self) -> np.ndarray:
+        # Seconds from the experiment's start to the end of each step
+        return self.grid[1:] - self.start
+
+    def getTotalRates(self) -> np.ndarray:
+        # Summed over the nodes reporting in each step, NaN where none are
+        reporting = ~np.isnan(self.rates)
+        return np.where(reporting.any(axis=0), np.nansum(self.rates, axis=0), np.nan)
+
+    def getRolling(self, window: int, stat: str = "mean") -> np.ndarray:
+        return rolling(self.rates, window, stat)
+
+    def getNodeSummary(self, window: int = 1) -> List[dict]:
+        # Per node mean rate, the peak of its rolling mean and how far above the mean that peak is
+        peaks = self.getRolling(window)
+        summary = []
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            for i, node in enumerate(self.nodes):
+                mean, peak = np.nanmean(self.rates[i]), np.nanmax(peaks[i])
+                summary.append({"node": node, "mean": mean, "peak": peak, "p95": np.nanpercentile(self.rates[i], 95),
+                                "burstiness": peak / mean if mean > 0 else np.nan})
+        return summary
+
+    def plot(self, ax, window: int = 1):
+        elapsed = self.getElapsed()
+        for node, rates in zip(self.nodes, self.getRolling(window)):
+            ax.plot(elapsed, rates, label=node)
+
+
+def loadExperimentRates(root: str, scenario: str = None, objectType: str = "status", step: float = DEFAULT_STEP,
+                        rescan: bool = False) -> Dict[str, ExperimentRates]:
+    # Every matching experiment under root, its meters read through the catalogue
+    tablesByScenario: Dict[str, Dict[str, np.ndarray]] = defaultdict(dict)
+    for series in select(loadCatalogue(root, rescan), INTEREST_RATE_METRIC, scenario, objectType=objectType):
+        tablesByScenario[series.scenario][series.node] = series.values
+    return {s: ExperimentRates.fromTables(s, tables, step) for s, tables in sorted(tablesByScenario.items())}
+
+
+def formatSummary(experiments: Dict[str, ExperimentRates], window: int) -> str:
+    width = max([len("scenario")] + [len(scenario) for scenario in experiments])
+    lines = ["%-*s %6s %9s %12s %12s %12s %11s" % (width, "scenario", "nodes", "secs", "total/s", "peak/s", "node p95/s", "burstiness")]
+    for scenario, rates in experiments.items():
+        summary = rates.getNodeSummary(window)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            total = rates.getTotalRates()
+            lines.append("%-*s %6d %9.0f %12.2f %12.2f %12.2f %11.2f" % (
+                width, scenario, len(rates.nodes), rates.grid[-1] - rates.start, np.nanmean(total), np.nanmax(rolling(total, window)),
+                np.nanmax([s["p95"] for s in summary]) if summary else np.nan,
+                np.nanmax([s["burstiness"] for s in summary]) if summary else np.nan))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aligned, resampled interest rates of every experiment under a data root")
+    parser.add_argument("root")
+    parser.add_argument("--scenario", help="fnmatch pattern on the scenario's path under root")
+    parser.add_argument("--object-type", dest="objectType", choices=objectTypes, default="status")
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP, help="Seconds between resampled points (default: %(default)s)")
+    parser.add_argument("--window", type=int, default=3, help="Steps in the rolling mean peaks are taken from (default: %(default)s)")
+    parser.add_argument("--rescan", action="store_true", help="Rebuild the catalogue of root first")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    experiments = loadExperimentRates(args.root, args.scenario, args.objectType, args.step, args.rescan)
+    print(formatSummary(experiments, args.window))
+    print("%d experiments in %.3fs" % (len(experiments), time.perf_counter() - start))
@@ -1,6 +1,9 @@
 import csv
 import os
-from typing import List
+from typing import List, Iterator, Union, Optional
+
+CHUNK_SIZE = 1 << 20
+TAIL_BLOCK_SIZE = 4096
 
 def readCsv(fileName: str, keepHeader = False):
     with open(fileName) as f:
@@ -23,5 +26,43 @@ def readFileSafe(*args: str) -> List[str]:
         print("Could not find file %s " % fileName)
 
 
+def readLineBlocks(fileName: str, binary: bool = False, chunkSize: int = CHUNK_SIZE) -> Iterator[Union[str, bytes]]:
+    # Yields large blocks of the file, each ending on a line boundary, without ever holding all lines at once
+    newline = b"\n" if binary else "\n"
+    with open(fileName, "rb" if binary else "r") as f:
+        remainder = newline[:0]
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                break
+            end = chunk.rfind(newline)
+            if end == -1:
+                remainder += chunk
+                continue
+            yield remainder + chunk[:end + 1]
+            remainder = chunk[end + 1:]
+        if remainder:
+            yield remainder
+
+
+def readLastCompleteLine(fileName: str, blockSize: int = TAIL_BLOCK_SIZE) -> Optional[bytes]:
+    # Seeks back from the end of the file until a whole line is in view, so only the last block or two are read.
+    # NUL padding is dropped and a last line without its newline (cut short by a crashed node) is skipped.
+    with open(fileName, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while True:
+            start = max(0, end - blockSize)
+            f.seek(start)
+            tail = f.read(end - start).replace(b"\0", b"")
+            lastNewline = tail.rfind(b"\n")
+            if lastNewline != -1:
+                lineStart = tail.rfind(b"\n", 0, lastNewline) + 1
+                if lineStart > 0 or start == 0:
+                    return tail[lineStart:lastNewline].rstrip(b"\r")
+            if start == 0:
+                return None
+            blockSize *= 2
+
+
 def buildFileName(*arg):
     return os.path.join(*arg)
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import List, Dict, Tuple, Any
+
+import numpy as np
+
+DEFAULT_FORMATS = ["png"]
+SAVEFIG_KWARGS = {"bbox_inches": "tight"}
+# Hashes of the specs each figure in a directory was last rendered from
+MANIFEST_FILE = ".figure-specs.json"
+
+DICT_VIEWS = (type({}.keys()), type({}.values()), type({}.items()))
+
+# (axes index or None for the figure, method name, args, kwargs)
+PlotCall = Tuple[Any, str, tuple, dict]
+
+
+def toPicklable(value):
+    # Specs are hashed and sent to worker processes, so dict views become lists and array views (e.g. of a snapshot's mmap) plain arrays
+    if isinstance(value, DICT_VIEWS):
+        return [toPicklable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return np.asarray(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(toPicklable(v) for v in value)
+    if isinstance(value, dict):
+        return {k: toPicklable(v) for k, v in value.items()}
+    return value
+
+
+class RecordedAxes:
+    # Stands in for matplotlib Axes: every method call is recorded into the owning figure's spec.
+    # Calls return None, so plotting code that uses what an Axes method returns needs a real figure.
+
+    def __init__(self, figure, index: int):
+        self._figure = figure
+        self._index = index
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            # Not an Axes method, e.g. numpy probing for __array_struct__
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self._figure.calls.append((self._index, name, toPicklable(args), toPicklable(kwargs)))
+        return record
+
+
+class RecordedFigure:
+    # A plot spec: the plt.subplots arguments plus every call made on the figure and its axes, with their data
+
+    def __init__(self, *subplotArgs, **subplotKwargs):
+        self.subplotArgs = subplotArgs
+        self.subplotKwargs = subplotKwargs
+        self.calls: List[PlotCall] = []
+        nrows, ncols = (list(subplotArgs) + [1, 1])[:2]
+        self.shape = (subplotKwargs.get("nrows", nrows), subplotKwargs.get("ncols", ncols))
+        self.axes = [RecordedAxes(self, i) for i in range(self.shape[0] * self.shape[1])]
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def record(*args, **kwargs):
+            self.calls.append((None, name, toPicklable(args), toPicklable(kwargs)))
+        return record
+
+    def getSubplots(self):
+        # Returned like plt.subplots: one axes, or an array of them shaped (nrows, ncols) with singleton dimensions squeezed
+        if len(self.axes) == 1:
+            return self, self.axes[0]
+        axes = np.empty(len(self.axes), dtype=object)
+        axes[:] = self.axes
+        return self, axes.reshape(self.shape).squeeze()
+
+    def getSpec(self, rcParams: Dict[str, Any]) -> tuple:
+        return self.subplotArgs, self.subplotKwargs, self.calls, rcParams
+
+
+def recordSubplots(*args, **kwargs):
+    return RecordedFigure(*args, **kwargs).getSubplots()
+
+
+def hashSpec(spec: tuple, formats: List[str]) -> str:
+    return hashlib.sha1(pickle.dumps((spec, formats, SAVEFIG_KWARGS), protocol=4)).hexdigest()
+
+
+def renderSpec(spec: tuple, fileNames: List[str]) -> List[str]:
+    # Runs in a worker process: matplotlib is only imported where figures are actually drawn
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    subplotArgs, subplotKwargs, calls, rcParams = spec
+    with plt.rc_context(rcParams):
+        fig, axes = plt.subplots(*subplotArgs, **subplotKwargs)
+        axes = np.atleast_1d(axes).flatten()
+        for target, name, args, kwargs in calls:
+            getattr(fig if target is None else axes[target], name)(*args, **kwargs)
+        for fileName in fileNames:
+            fig.savefig(fileName, **SAVEFIG_KWARGS)
+        plt.close(fig)
+    return fileNames
+
+
+class RenderQueue:
+    # Plot specs are handed to a pool of Agg workers as soon as they are recorded, so drawing overlaps with computing
+    # the next figure's data. A figure whose spec hashes the same as when its files were last written is skipped.
+
+    def __init__(self, jobs: int = 1, formats: List[str] = None, rcParams: Dict[str, Any] = None, skipUnchanged: bool = True,
+                 draw: bool = True):
+        self.formats = DEFAULT_FORMATS if formats is None else formats
+        self.rcParams = {} if rcParams is None else rcParams
+        self.skipUnchanged = skipUnchanged
+        # Without drawing, submitted figures are dropped and figure directories left alone
+        self.draw = draw
+        # Without workers figures are drawn as they are submitted
+        self.executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        self.pending: Dict[str, Future] = {}
+        self.manifests: Dict[str, Dict[str, str]] = {}
+        self.rendered: Dict[str, set] = {}
+        self.numRendered = 0
+        self.numSkipped = 0
+
+    def getManifest(self, directory: str) -> Dict[str, str]:
+        if directory not in self.manifests:
+            try:
+                with open(os.path.join(directory, MANIFEST_FILE)) as f:
+                    self.manifests[directory] = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.manifests[directory] = {}
+        return self.manifests[directory]
+
+    def submit(self, figure: RecordedFigure, fileBase: str):
+        if not self.draw:
+            return
+        directory, name = os.path.split(fileBase)
+        fileNames = ["%s.%s" % (fileBase, extension) for extension in self.formats]
+        spec = figure.getSpec(self.rcParams)
+        specHash = hashSpec(spec, self.formats)
+        manifest = self.getManifest(directory)
+        self.rendered.setdefault(directory, set()).add(name)
+        if fileBase in self.pending:
+            # The same figure saved twice: the last one wins, as it would saving synchronously
+            self.pending.pop(fileBase).result()
+        elif self.skipUnchanged and manifest.get(name) == specHash and all(os.path.exists(f) for f in fileNames):
+            self.numSkipped += 1
+            return
+        manifest[name] = specHash
+        self.numRendered += 1
+        if self.executor is None:
+            renderSpec(spec, fileNames)
+        else:
+            self.pending[fileBase] = self.executor.submit(renderSpec, spec, fileNames)
+
+    def removeStale(self, directory: str):
+        # Figures from an earlier run that weren't produced this time
+        manifest = self.getManifest(directory)
+        for name in [n for n in manifest if n not in self.rendered.get(directory, set())]:
+            for extension in self.formats:
+                fileName = os.path.join(directory, "%s.%s" % (name, extension))
+                if os.path.exists(fileName):
+                    os.remove(fileName)
+            del manifest[name]
+
+    def flush(self):
+        for future in self.pending.values():
+            future.result()
+        self.pending = {}
+        for directory, manifest in self.manifests.items():
+            self.removeStale(directory)
+            with open(os.path.join(directory, MANIFEST_FILE), "w") as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+        self.manifests = {}
+        self.rendered = {}
+
+    def close(self):
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown()
@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+
+from histogram_store import readHistogramValues, HISTOGRAM_VALUES_FILE
+from log_reader import LogError, LogReader, LOG_FILE
+from metric_csv import readMetricCsv, SCHEMAS_BY_HEADER
+from nfd_log_parser import CacheEvents, ForwardingEvents, NFD_LOG_FILE, scanNfdLog
+from reading_utils import buildFileName
+
+# One experiment (every node directory of e.g. thesis/interest-mgmt/scalability/im-dr) packed into a single file:
+#   MAGIC | header length (u64) | JSON header | arrays, each 64 byte aligned
+# The header holds each array's dtype, shape and offset plus every node's slices of those arrays,
+# so the whole experiment is loaded with one mmap and arrays are handed out as views of it.
+MAGIC = b"NDNSNAP1"
+HEADER_LENGTH = struct.Struct("<Q")
+ALIGNMENT = 64
+SNAPSHOT_EXTENSION = ".ndnsnap"
+
+TIMESTAMPS = "nfd/timestamps"
+KINDS = "nfd/kinds"
+PLAYER_IDS = "nfd/playerIds"
+OBJECT_TYPE_IDS = "nfd/objectTypeIds"
+FORWARDING_TIMESTAMPS = "forwarding/timestamps"
+FORWARDING_KINDS = "forwarding/kinds"
+FORWARDING_FACES = "forwarding/faces"
+FORWARDING_NAME_IDS = "forwarding/nameIds"
+# Every node's names, newline separated, numbered per node
+FORWARDING_NAMES = "forwarding/names"
+HISTOGRAMS = "histograms"
+METRICS_FORMAT = "metrics/{}"
+
+# (start, end) of a node's rows in one of the concatenated arrays
+Slice = Tuple[int, int]
+
+
+def getSnapshotFile(experimentDir: str) -> str:
+    return os.path.normpath(experimentDir) + SNAPSHOT_EXTENSION
+
+
+def findSnapshot(dataDir: str, subDir: str) -> Optional[str]:
+    # The subDir's snapshot, unless its directory has changed since it was exported
+    fileName = getSnapshotFile(os.path.join(dataDir, subDir))
+    if not os.path.isfile(fileName) or openFreshSnapshot(fileName, os.path.join(dataDir, subDir)) is None:
+        return None
+    return fileName
+
+
+def openFreshSnapshot(fileName: str, experimentDir: str) -> Optional["ExperimentSnapshot"]:
+    # None, and a warning, when the experiment's directory has changed since the snapshot was exported
+    snapshot = ExperimentSnapshot(fileName)
+    if snapshot.isStale(experimentDir):
+        print("%s is older than %s, reading the directory instead" % (fileName, experimentDir))
+        return None
+    return snapshot
+
+
+def getFileStats(nodeDir: str) -> Dict[str, List[int]]:
+    # fileName -> [size, mtime in ns] of everything in a node directory, as recorded in a snapshot's header
+    with os.scandir(nodeDir) as entries:
+        return {entry.name: [entry.stat().st_size, entry.stat().st_mtime_ns] for entry in entries}
+
+
+class NodeExport:
+    # Everything read from one node directory, before being merged with the other nodes'
+
+    def __init__(self, node: str, nodeDir: str):
+        self.node = node
+        # Taken before anything is read, so a file changing during the export makes the snapshot stale
+        self.stats = getFileStats(nodeDir)
+        self.files = sorted(self.stats)
+        self.events: CacheEvents = None
+        self.forwarding: ForwardingEvents = None
+        if NFD_LOG_FILE in self.files:
+            self.events, self.forwarding = scanNfdLog(nodeDir)
+
+        self.histograms: Dict[str, np.ndarray] = None
+        if HISTOGRAM_VALUES_FILE in self.files:
+            self.histograms = readHistogramValues(nodeDir)
+
+        # fileName -> (schema name, table)
+        self.metrics: Dict[str, Tuple[str, np.ndarray]] = {}
+        for fileName in self.files:
+            if not fileName.endswith(".csv"):
+                continue
+            fullFile = buildFileName(nodeDir, fileName)
+            with open(fullFile, "rb") as f:
+                header = f.readline().replace(b"\0", b"").strip().decode(errors="replace")
+            if header not in SCHEMAS_BY_HEADER:
+                print("Skipping %s: unknown metric CSV header" % fullFile)
+                continue
+            schema = SCHEMAS_BY_HEADER[header]
+            self.metrics[fileName] = (schema.name, readMetricCsv(fullFile, schema))
+
+        self.errors: List[LogError] = None
+        if LOG_FILE in self.files:
+            self.errors = LogReader(node, nodeDir, interactive=False).errors
+
+
+def exportNodeTask(task: Tuple[str, str]) -> NodeExport:
+    return NodeExport(*task)
+
+
+class SnapshotWriter:
+
+    def __init__(self):
+        self.header = {"arrays": {}, "nodes": {}, "players": [], "objectTypes": []}
+        self.chunks: Dict[str, List[np.ndarray]] = {}
+        self.lengths: Dict[str, int] = {}
+
+    def append(self, name: str, values: np.ndarray) -> Slice:
+        start = self.lengths.get(name, 0)
+        self.chunks.setdefault(name, []).append(values)
+        self.lengths[name] = start + len(values)
+        return start, start + len(values)
+
+    def addEvents(self, events: CacheEvents) -> Slice:
+        # Players and object types are numbered across the whole experiment, not per node
+        players, objectTypes = self.header["players"], self.header["objectTypes"]
+        for value, known in [(p, players) for p in events.players] + [(o, objectTypes) for o in events.objectTypes]:
+            if value not in known:
+                known.append(value)
+        playerIds = np.array([players.index(p) for p in events.players], dtype=np.int32)
+        objectTypeIds = np.array([objectTypes.index(o) for o in events.objectTypes], dtype=np.uint8)
+
+        start, end = self.append(TIMESTAMPS, events.timestamps)
+        self.append(KINDS, events.kinds)
+        self.append(PLAYER_IDS, playerIds[events.playerIds] if len(events) > 0 else np.zeros(0, dtype=np.int32))
+        self.append(OBJECT_TYPE_IDS, objectTypeIds[events.objectTypeIds] if len(events) > 0 else np.zeros(0, dtype=np.uint8))
+        return start, end
+
+    def addForwarding(self, forwarding: ForwardingEvents) -> List[int]:
+        # Events slice, then the slice of the names blob
+        start, end = self.append(FORWARDING_TIMESTAMPS, forwarding.timestamps)
+        self.append(FORWARDING_KINDS, forwarding.kinds)
+        self.append(FORWARDING_FACES, forwarding.faces)
+        self.append(FORWARDING_NAME_IDS, forwarding.nameIds)
+        names = "\n".join(forwarding.names).encode()
+        return [start, end, *self.append(FORWARDING_NAMES, np.frombuffer(names, dtype=np.uint8))]
+
+    def addNode(self, export: NodeExport):
+        nodeHeader = {"files": export.files, "stats": export.stats, "nfd": None, "forwarding": None, "histograms": None, "metrics": {}, "errors": None}
+        if export.events is not None:
+            nodeHeader["nfd"] = self.addEvents(export.events)
+        if export.forwarding is not None:
+            nodeHeader["forwarding"] = self.addForwarding(export.forwarding)
+        if export.histograms is not None:
+            nodeHeader["histograms"] = [[name, *self.append(HISTOGRAMS, np.array(values, dtype=np.int64))]
+                                        for name, values in export.histograms.items()]
+        for fileName, (schemaName, table) in export.metrics.items():
+            nodeHeader["metrics"][fileName] = [schemaName, *self.append(METRICS_FORMAT.format(schemaName), table)]
+        if export.errors is not None:
+            nodeHeader["errors"] = [[e.lineNumber, e.pattern, e.context] for e in export.errors]
+        self.header["nodes"][export.node] = nodeHeader
+
+    def getArrays(self) -> Dict[str, np.ndarray]:
+        arrays = {name: np.concatenate(chunks) for name, chunks in self.chunks.items()}
+        histograms = arrays.get(HISTOGRAMS)
+        if histograms is not None and (len(histograms) == 0 or np.abs(histograms).max() < 2 ** 31):
+            arrays[HISTOGRAMS] = histograms.astype(np.int32)
+        return arrays
+
+    def write(self, fileName: str):
+        arrays = self.getArrays()
+        offset = 0
+        for name, array in arrays.items():
+            self.header["arrays"][name] = {"dtype": np.lib.format.dtype_to_descr(array.dtype), "shape": array.shape, "offset": offset}
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header = json.dumps(self.header).encode()
+        # Pad the header so the arrays start aligned too
+        header += b" " * (-(len(MAGIC) + HEADER_LENGTH.size + len(header)) % ALIGNMENT)
+
+        tmpFile = "%s.%d.tmp" % (fileName, os.getpid())
+        with open(tmpFile, "wb") as f:
+            f.write(MAGIC + HEADER_LENGTH.pack(len(header)) + header)
+            for array in arrays.values():
+                data = np.ascontiguousarray(array).tobytes()
+                f.write(data + b"\0" * (-len(data) % ALIGNMENT))
+        os.replace(tmpFile, fileName)
+
+
+def exportNodes(tasks: List[Tuple[str, str]], jobs: int = 1) -> List[NodeExport]:
+    if jobs <= 1 or len(tasks) <= 1:
+        return [exportNodeTask(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+        return list(executor.map(exportNodeTask, tasks))
+
+
+def exportExperiment(experimentDir: str, fileName: str = None, jobs: int = 1) -> str:
+    fileName = getSnapshotFile(experimentDir) if fileName is None else fileName
+    tasks = [(entry.name, entry.path) for entry in sorted(os.scandir(experimentDir), key=lambda e: e.name) if entry.is_dir()]
+    writer = SnapshotWriter()
+    for export in exportNodes(tasks, jobs):
+        writer.addNode(export)
+    writer.write(fileName)
+    return fileName
+
+
+class ExperimentSnapshot:
+
+    def __init__(self, fileName: str):
+        self.fileName = fileName
+        self.buffer = np.memmap(fileName, dtype=np.uint8, mode="r")
+        if bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError("%s is not an experiment snapshot" % fileName)
+        headerStart = len(MAGIC) + HEADER_LENGTH.size
+        (headerLength,) = HEADER_LENGTH.unpack(bytes(self.buffer[len(MAGIC):headerStart]))
+        self.header = json.loads(bytes(self.buffer[headerStart:headerStart + headerLength]))
+        dataStart = headerStart + headerLength
+
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, spec in self.header["arrays"].items():
+            dtype = np.lib.format.descr_to_dtype(spec["dtype"])
+            shape = tuple(spec["shape"])
+            start = dataStart + spec["offset"]
+            self.arrays[name] = self.buffer[start:start + dtype.itemsize * int(np.prod(shape))].view(dtype).reshape(shape)
+        self.nodes: List[str] = sorted(self.header["nodes"].keys())
+        self.players: List[str] = self.header["players"]
+        self.objectTypes: List[str] = self.header["objectTypes"]
+
+    def isStale(self, experimentDir: str = None) -> bool:
+        # Whether the experiment directory's nodes or their files have changed since the export, by size and mtime. A snapshot
+        # with no directory beside it is all there is, so never stale; one exported without the files' stats can't be checked.
+        experimentDir = self.fileName[:-len(SNAPSHOT_EXTENSION)] if experimentDir is None else experimentDir
+        if not os.path.isdir(experimentDir):
+            return False
+        with os.scandir(experimentDir) as entries:
+            if sorted(entry.name for entry in entries if entry.is_dir()) != self.nodes:
+                return True
+        for node in self.nodes:
+            stats = self.header["nodes"][node].get("stats")
+            if stats is None or getFileStats(os.path.join(experimentDir, node)) != stats:
+                return True
+        return False
+
+    def getNodeHeader(self, node: str) -> dict:
+        try:
+            return self.header["nodes"][node]
+        except KeyError:
+            raise FileNotFoundError("No node %s in %s" % (node, self.fileName))
+
+    def hasFile(self, node: str, fileName: str) -> bool:
+        return fileName in self.getNodeHeader(node)["files"]
+
+    def getCacheEvents(self, node: str) -> Optional[CacheEvents]:
+        nfd = self.getNodeHeader(node)["nfd"]
+        if nfd is None:
+            return None
+        start, end = nfd
+        return CacheEvents(self.arrays[TIMESTAMPS][start:end], self.arrays[KINDS][start:end], self.arrays[PLAYER_IDS][start:end],
+                           self.arrays[OBJECT_TYPE_IDS][start:end], self.players, self.objectTypes)
+
+    def getForwardingEvents(self, node: str) -> Optional[ForwardingEvents]:
+        # None for snapshots written before forwarding events were kept too
+        forwarding = self.getNodeHeader(node).get("forwarding")
+        if forwarding is None:
+            return None
+        start, end, namesStart, namesEnd = forwarding
+        names = bytes(self.arrays[FORWARDING_NAMES][namesStart:namesEnd]).decode()
+        return ForwardingEvents(self.arrays[FORWARDING_TIMESTAMPS][start:end], self.arrays[FORWARDING_KINDS][start:end],
+                                self.arrays[FORWARDING_FACES][start:end], self.arrays[FORWARDING_NAME_IDS][start:end],
+                                names.split("\n") if len(names) > 0 else [])
+
+    def getHistograms(self, node: str) -> Optional[Dict[str, np.ndarray]]:
+        histograms = self.getNodeHeader(node)["histograms"]
+        if histograms is None:
+            return None
+        return {name: self.arrays[HISTOGRAMS][start:end] for name, start, end in histograms}
+
+    def getMetricTables(self, node: str) -> Dict[str, np.ndarray]:
+        return {fileName: self.arrays[METRICS_FORMAT.format(schemaName)][start:end]
+                for fileName, (schemaName, start, end) in self.getNodeHeader(node)["metrics"].items()}
+
+    def getMetrics(self, node: str) -> Dict[str, Tuple[str, np.ndarray]]:
+        # fileName -> (schema name, table), as in NodeExport.metrics
+        return {fileName: (schemaName, self.arrays[METRICS_FORMAT.format(schemaName)][start:end])
+                for fileName, (schemaName, start, end) in self.getNodeHeader(node)["metrics"].items()}
+
+    def getMetricTable(self, node: str, fileName: str) -> np.ndarray:
+        metrics = self.getNodeHeader(node)["metrics"]
+        if fileName not in metrics:
+            raise FileNotFoundError("No %s for %s in %s" % (fileName, node, self.fileName))
+        schemaName, start, end = metrics[fileName]
+        return self.arrays[METRICS_FORMAT.format(schemaName)][start:end]
+
+    def getErrors(self, node: str) -> Optional[List[LogError]]:
+        errors = self.getNodeHeader(node)["errors"]
+        if errors is None:
+            return None
+        return [LogError(node, lineNumber, pattern, context) for lineNumber, pattern, context in errors]
+
+
+def printInfo(fileName: str):
+    start = time.perf_counter()
+    snapshot = ExperimentSnapshot(fileName)
+    elapsed = time.perf_counter() - start
+    print("%s: %.1f MB, %d nodes, opened in %.1f ms" % (fileName, os.path.getsize(fileName) / 1e6, len(snapshot.nodes), 1000 * elapsed))
+    for name, array in snapshot.arrays.items():
+        print("  %-20s %10d rows %10.1f MB" % (name, len(array), array.nbytes / 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subParsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subParsers.add_parser("export", help="Pack every node directory of an experiment into one snapshot file")
+    export.add_argument("experimentDir")
+    export.add_argument("--output", "-o", help="Defaults to <experimentDir>%s" % SNAPSHOT_EXTENSION)
+    export.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1)
+
+    info = subParsers.add_parser("info", help="Print the arrays held by a snapshot")
+    info.add_argument("snapshot")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        start = time.perf_counter()
+        snapshotFile = exportExperiment(args.experimentDir, args.output, args.jobs)
+        print("Wrote %s in %.1fs" % (snapshotFile, time.perf_counter() - start))
+        printInfo(snapshotFile)
+    elif args.command == "info":
+        printInfo(args.snapshot)
@@ -1,10 +1,10 @@
-import json
-import os
 from typing import Dict, List
 
 import numpy as np
 
-HISTOGRAM_VALUES_FILE = "histogram_values.json"
+from histogram_store import readHistogramValues, STATUS_DELTA_KEYS
+from percentiles import SampleHistogram
+
 DISTANCE_SCALE_FACTOR = 100
 
 def rejectOutliers(data, m=2):
@@ -13,18 +13,19 @@ def rejectOutliers(data, m=2):
 class StatusDelta:
     def __init__(self, name: str, values: List[int]):
         self.name = name.split("-")[3]
-        self.values = [value / DISTANCE_SCALE_FACTOR for value in values]
+        self.samples = np.asarray(values)
+        self.values = self.samples / DISTANCE_SCALE_FACTOR
 
 class StatusDeltasHistograms:
 
-    def __init__(self, nodeName, nodeNameDir):
+    def __init__(self, nodeName, nodeNameDir, histograms: Dict[str, List[int]] = None):
         self.nodeName = nodeName
-        with open(os.path.join(nodeNameDir, HISTOGRAM_VALUES_FILE)) as f:
-            jsonDict: Dict[str, List[int]] = json.load(f)
-            self.statusDeltas = []
-            for k, v in jsonDict.items():
-                if k.startswith("eng-status-delta"):
-                    self.statusDeltas.append(StatusDelta(k, v))
+        if histograms is None:
+            histograms = readHistogramValues(nodeNameDir, STATUS_DELTA_KEYS)
+        self.statusDeltas = []
+        for k, v in histograms.items():
+            if k.startswith("eng-status-delta"):
+                self.statusDeltas.append(StatusDelta(k, v))
 
     def plotStatusDeltas(self, ax):
         data = [statusDelta.values for statusDelta in self.statusDeltas]
@@ -42,6 +43,9 @@ class StatusDeltasHistograms:
         percentile = np.percentile(allData, 95)
         print(percentile)
 
-    def getAllData(self):
-        # item for sublist in l for item in sublist
-        return [item for sublist in [sd.values for sd in self.statusDeltas] for item in sublist]
+    def getAllData(self) -> np.ndarray:
+        return np.concatenate([sd.values for sd in self.statusDeltas]) if self.statusDeltas else np.zeros(0)
+
+    def getSampleHistogram(self) -> SampleHistogram:
+        samples = np.concatenate([sd.samples for sd in self.statusDeltas]) if self.statusDeltas else np.zeros(0, dtype=np.int64)
+        return SampleHistogram.fromSamples(samples, DISTANCE_SCALE_FACTOR)
@@ -0,0 +1,324 @@
+import argparse
+import csv
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+from catalogue import loadCatalogue, ExperimentEntry, GAME_NODE
+from comparison import MetricTable, METRICS, COMPARED_METRICS, DEFAULT_OBJECT_TYPE, INTEREST_RATE, INTERESTS_SEEN, INTERESTS_EXPRESSED, \
+    AGGREGATION_FACTOR, CACHE_LOOKUPS, CACHE_HITS, CACHE_HIT_RATE, RTT_FORMAT, POSITION_DELTA_FORMAT, DEAD_RECKONING_FORMAT, \
+    DEAD_RECKONING_TYPES
+from nfd_log_parser import CacheLineScanner, NFD_LOG_FILE, CACHE_LOOKUP
+from node_loader import loadParts, getSourceFiles, defaultJobs, PACKET_TIMES, STATUS_DELTAS, INTEREST_RATES, INTERESTS_COUNTERS, \
+    DEAD_RECKONING
+from parse_cache import ParseCache, getCacheDirFor, fingerprint
+from percentiles import SampleHistogram, PERCENTILES, PERCENTILE_NAMES
+from reading_utils import CHUNK_SIZE
+from render_queue import RenderQueue, recordSubplots
+
+# A whole parameter sweep (every experiment under a data root) reduced to one row per scenario. The map tasks are one per
+# game node for its small files, and one per byte range of every nfd.log, so a giant log is split across the pool rather than
+# holding up the batch. Each task returns only what its reducer keeps (final rates, counts, sample histograms), and the
+# reduce step builds the same per node metrics as ExperimentComparison from them.
+SWEEP_VERSION = 1
+SWEEP_PART = "sweep"
+SWEEP_NFD_PART = "sweep-nfd"
+NODE_PARTS = [PACKET_TIMES, STATUS_DELTAS, INTEREST_RATES, INTERESTS_COUNTERS, DEAD_RECKONING]
+DEFAULT_CHUNK_MB = 64
+POOLED_RTT_FORMAT = "pooled-rtt-{}"
+# Numeric settings in a scenario's name, each named by the token before it: cache-20ms, dr-0.5, nodes-16
+PARAMETER_VALUE = re.compile(r"^(\d+(?:\.\d+)?)[a-z%]*$")
+SCENARIO_SEPARATORS = re.compile(r"[-_/\\]")
+FIGURE_DIR = "figures"
+SWEEP_FIGURE_DIR = "sweep"
+
+# (scenario, node, nodeDir) of a game node, (scenario, node, nfd.log, start, end) of a byte range of a log
+NodeTask = Tuple[str, str, str]
+ChunkTask = Tuple[str, str, str, int, int]
+
+
+class NodeSummary:
+    # What a game node's small files contribute to its scenario, cheap to send back from a worker and to cache
+
+    def __init__(self, node: str):
+        self.node = node
+        # objectType -> (final mean rate, interests seen)
+        self.interestRates: Dict[str, Tuple[float, int]] = {}
+        # objectType -> publisher -> interests this node expressed to it
+        self.interestsCounters: Dict[str, Dict[str, int]] = {}
+        self.rtt: Optional[SampleHistogram] = None
+        self.positionDelta: Optional[SampleHistogram] = None
+        self.deadReckoning: Dict[str, float] = {}
+
+
+def summarizeNode(task: NodeTask) -> NodeSummary:
+    _, node, nodeDir = task
+    packetTimes, statusDeltas, interestRates, interestsCounters, deadReckoning = loadParts(node, nodeDir, NODE_PARTS)
+    summary = NodeSummary(node)
+    if interestRates is not None:
+        summary.interestRates = {o: (r.finalMeanRate, r.totalInterestsSeen) for o, r in interestRates.getInterestRatesByType().items()}
+    summary.interestsCounters = {} if interestsCounters is None else interestsCounters
+    summary.rtt = None if packetTimes is None else packetTimes.getSampleHistogram()
+    summary.positionDelta = None if statusDeltas is None else statusDeltas.getSampleHistogram()
+    summary.deadReckoning = {} if deadReckoning is None else deadReckoning.getPercentages()
+    return summary
+
+
+def countCacheLines(task: ChunkTask) -> Counter:
+    # (kind, player, objectType) counts of the ContentStore lines starting in [start, end) of the log. A range starting mid
+    # line leaves that line to the range before it, which reads on to its end.
+    _, _, fileName, start, end = task
+    scanner = CacheLineScanner()
+    with open(fileName, "rb") as f:
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            block = f.read(min(CHUNK_SIZE, end - f.tell()))
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                block += f.readline()
+            scanner.feed(block)
+    return Counter({tuple(g.decode() for g in groups): count for groups, count in scanner.counts.items()})
+
+
+def runTask(task: tuple):
+    return summarizeNode(task) if len(task) == 3 else countCacheLines(task)
+
+
+def getByteRanges(size: int, chunkBytes: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + chunkBytes, size)) for start in range(0, size, chunkBytes)]
+
+
+def getParameters(scenario: str) -> Dict[str, float]:
+    tokens = SCENARIO_SEPARATORS.split(scenario)
+    parameters = {}
+    for name, token in zip(tokens, tokens[1:]):
+        match = PARAMETER_VALUE.match(token)
+        if match is not None and name.isalpha():
+            parameters[name] = float(match.group(1))
+    return parameters
+
+
+def getCurveName(scenario: str, parameter: str) -> str:
+    # The scenario with the parameter's value left out, naming the curve it is a point of
+    tokens = SCENARIO_SEPARATORS.split(scenario)
+    return "-".join("*" if i > 0 and tokens[i - 1] == parameter and PARAMETER_VALUE.match(token) else token
+                    for i, token in enumerate(tokens))
+
+
+class Sweep:
+
+    def __init__(self, experiments: List[ExperimentEntry], objectType: str = DEFAULT_OBJECT_TYPE):
+        self.experiments = experiments
+        self.objectType = objectType
+        self.scenarios = [e.scenario for e in experiments]
+        self.summaries: Dict[str, Dict[str, NodeSummary]] = defaultdict(dict)
+        # scenario -> node -> ContentStore line counts, summed over the log's byte ranges
+        self.cacheCounts: Dict[str, Dict[str, Counter]] = defaultdict(dict)
+
+    def getTasks(self, chunkBytes: int, cache: ParseCache) -> (List[tuple], Dict[tuple, tuple]):
+        # Tasks not answered by the cache, largest first so the long ones start early and the small ones fill in behind them
+        tasks, filePrints = [], {}
+        for entry in self.experiments:
+            for node in entry.getNodes():
+                nodeDir = os.path.join(entry.path, node)
+                nodeEntry = entry.nodes[node]
+                if nodeEntry.role == GAME_NODE:
+                    filePrint = fingerprint([f for part in NODE_PARTS for f in getSourceFiles(node, nodeDir, part)], SWEEP_VERSION)
+                    hit, summary = cache.get((nodeDir, SWEEP_PART), filePrint)
+                    if hit:
+                        self.summaries[entry.scenario][node] = summary
+                    else:
+                        filePrints[(entry.scenario, node, SWEEP_PART)] = ((nodeDir, SWEEP_PART), filePrint)
+                        tasks.append((nodeEntry.getBytes() - nodeEntry.files.get(NFD_LOG_FILE, (0, 0))[0], (entry.scenario, node, nodeDir)))
+                if nodeEntry.hasFile(NFD_LOG_FILE):
+                    logFile = entry.getFilePath(node, NFD_LOG_FILE)
+                    filePrint = fingerprint([logFile], SWEEP_VERSION)
+                    # The log's size as fingerprinted, in case it grew since the catalogue was scanned
+                    size = filePrint[1][0][1]
+                    if size is None:
+                        print("Could not find file %s" % logFile)
+                        continue
+                    hit, counts = cache.get((nodeDir, SWEEP_NFD_PART), filePrint)
+                    if hit:
+                        self.cacheCounts[entry.scenario][node] = counts
+                        continue
+                    self.cacheCounts[entry.scenario][node] = Counter()
+                    filePrints[(entry.scenario, node, SWEEP_NFD_PART)] = ((nodeDir, SWEEP_NFD_PART), filePrint)
+                    for start, end in getByteRanges(size, chunkBytes):
+                        tasks.append((end - start, (entry.scenario, node, logFile, start, end)))
+        tasks.sort(key=lambda t: -t[0])
+        return [task for _, task in tasks], filePrints
+
+    def addResult(self, task: tuple, result):
+        if len(task) == 3:
+            self.summaries[task[0]][task[1]] = result
+        else:
+            self.cacheCounts[task[0]][task[1]].update(result)
+
+    def run(self, jobs: int = 1, chunkBytes: int = DEFAULT_CHUNK_MB << 20, cache: ParseCache = None):
+        cache = ParseCache() if cache is None else cache
+        tasks, filePrints = self.getTasks(chunkBytes, cache)
+        if jobs <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                self.addResult(task, runTask(task))
+        else:
+            # Workers take the next task off the pool's one queue whenever they finish, so with the logs split into ranges a
+            # single giant log keeps every worker busy instead of one
+            with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as executor:
+                futures = {executor.submit(runTask, task): task for task in tasks}
+                for future in as_completed(futures):
+                    self.addResult(futures[future], future.result())
+        for (scenario, node, part), (key, filePrint) in filePrints.items():
+            cache.put(key, filePrint, self.summaries[scenario][node] if part == SWEEP_PART else self.cacheCounts[scenario][node])
+
+    def getNodeMetrics(self, scenario: str, node: str, gameNodes: List[str]) -> Dict[str, float]:
+        # As comparison.getNodeMetrics, from the reduced summaries
+        metrics = {}
+        summaries = self.summaries[scenario]
+        summary = summaries.get(node)
+        if summary is not None and self.objectType in summary.interestRates:
+            rate, seen = summary.interestRates[self.objectType]
+            expressed = sum(summaries[sub].interestsCounters.get(self.objectType, {}).get(node, 0)
+                            for sub in gameNodes if sub != node and sub in summaries)
+            metrics[INTEREST_RATE] = rate
+            metrics[INTERESTS_SEEN] = seen
+            metrics[INTERESTS_EXPRESSED] = expressed
+            metrics[AGGREGATION_FACTOR] = 100 * seen / expressed if expressed > 0 else np.nan
+
+        counts = self.cacheCounts[scenario].get(node)
+        if counts is not None:
+            lookups = sum(c for (kind, _, objectType), c in counts.items() if objectType == self.objectType and kind == CACHE_LOOKUP)
+            hits = sum(c for (kind, _, objectType), c in counts.items() if objectType == self.objectType and kind != CACHE_LOOKUP)
+            metrics[CACHE_LOOKUPS] = lookups
+            metrics[CACHE_HITS] = hits
+            metrics[CACHE_HIT_RATE] = 100 * hits / lookups if lookups > 0 else np.nan
+
+        if summary is not None:
+            for histogram, nameFormat in [(summary.rtt, RTT_FORMAT), (summary.positionDelta, POSITION_DELTA_FORMAT)]:
+                if histogram is not None:
+                    metrics.update(zip([nameFormat.format(name) for name in PERCENTILE_NAMES], histogram.getPercentiles(PERCENTILES)))
+            for drType, percentage in summary.deadReckoning.items():
+                if drType in DEAD_RECKONING_TYPES:
+                    metrics[DEAD_RECKONING_FORMAT.format(drType)] = percentage
+        return metrics
+
+    def getTable(self) -> MetricTable:
+        nodes = sorted({node for entry in self.experiments for node in entry.getNodes()})
+        table = MetricTable(self.scenarios, nodes)
+        for entry in self.experiments:
+            gameNodes = entry.getNodes(GAME_NODE)
+            for node in entry.getNodes():
+                for metric, value in self.getNodeMetrics(entry.scenario, node, gameNodes).items():
+                    table.set(entry.scenario, node, metric, value)
+        return table
+
+    def getSummaryRows(self, metrics: List[str] = COMPARED_METRICS) -> List[dict]:
+        # One row per scenario: its parameters, the node mean of each metric and RTT percentiles over all of its samples
+        table = self.getTable()
+        means = {metric: table.getScenarioMeans(metric) for metric in metrics}
+        rows = []
+        for i, scenario in enumerate(self.scenarios):
+            row = {"scenario": scenario}
+            row.update(getParameters(scenario))
+            row.update({metric: float(means[metric][i]) for metric in metrics})
+            pooled = SampleHistogram.merge(s.rtt for s in self.summaries[scenario].values() if s.rtt is not None)
+            row.update(zip([POOLED_RTT_FORMAT.format(name) for name in PERCENTILE_NAMES], pooled.getPercentiles(PERCENTILES).tolist()))
+            rows.append(row)
+        return rows
+
+
+def formatRows(rows: List[dict], columns: List[str]) -> str:
+    # Every column as wide as its name, as the scenarios' column is as wide as theirs
+    width = max([16] + [len(row["scenario"]) + 1 for row in rows])
+    widths = [max(9, len(c)) for c in columns]
+    lines = ["scenario".ljust(width) + " ".join(c.rjust(w) for c, w in zip(columns, widths))]
+    for row in rows:
+        lines.append(row["scenario"].ljust(width) + " ".join("%*.2f" % (w, row.get(c, np.nan)) for c, w in zip(columns, widths)))
+    return "\n".join(lines)
+
+
+def writeRows(rows: List[dict], columns: List[str], fileName: str):
+    with open(fileName, "w", newline="") as f:
+        writer = csv.DictWriter(f, ["scenario"] + columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def getSweptParameter(rows: List[dict], parameters: List[str]) -> Optional[str]:
+    # The one taking the most distinct values
+    distinct = {p: len({row[p] for row in rows if p in row}) for p in parameters}
+    return max(distinct, key=distinct.get) if distinct else None
+
+
+def plotSweep(rows: List[dict], parameter: str, metrics: List[str], figureDir: str, renderQueue: RenderQueue):
+    curves: Dict[str, List[dict]] = defaultdict(list)
+    for row in rows:
+        if parameter in row:
+            curves[getCurveName(row["scenario"], parameter)].append(row)
+    for metric in metrics:
+        f, ax = recordSubplots()
+        for curve, points in sorted(curves.items()):
+            points = sorted(points, key=lambda row: row[parameter])
+            ax.plot([row[parameter] for row in points], [row[metric] for row in points], marker="o", label=curve)
+        ax.set_xlabel(parameter)
+        ax.set_ylabel(metric)
+        ax.legend(fontsize="small")
+        f.suptitle("%s against %s" % (metric, parameter))
+        renderQueue.submit(f, os.path.join(figureDir, metric))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reduce every experiment of a parameter sweep to one summary row per scenario")
+    parser.add_argument("root")
+    parser.add_argument("--scenario", help="fnmatch pattern on the scenario's path under root")
+    parser.add_argument("--object-type", dest="objectType", default=DEFAULT_OBJECT_TYPE)
+    parser.add_argument("--jobs", "-j", type=int, default=defaultJobs())
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_MB, help="Largest byte range of an nfd.log one task parses")
+    parser.add_argument("--metrics", nargs="+", choices=METRICS + [POOLED_RTT_FORMAT.format(n) for n in PERCENTILE_NAMES],
+                        help="Columns of the summary (default: %s)" % " ".join(COMPARED_METRICS))
+    parser.add_argument("--output", "-o", help="Also write the summary table to this CSV")
+    parser.add_argument("--plot", action="store_true", help="Draw each metric against the swept parameter into <root>/figures/%s"
+                                                            % SWEEP_FIGURE_DIR)
+    parser.add_argument("--parameter", help="Parameter to plot against (default: the one with the most distinct values)")
+    parser.add_argument("--no-cache", dest="useCache", action="store_false", help="Don't read or write the on-disk parse cache")
+    parser.add_argument("--rescan", action="store_true", help="Rebuild the catalogue of root first")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    catalogue = loadCatalogue(args.root, args.rescan)
+    experiments = []
+    for entry in catalogue.find(scenario=args.scenario):
+        if all(len(node.files) == 0 for node in entry.nodes.values()):
+            print("Skipping %s: only its snapshot is left" % entry.scenario)
+        else:
+            experiments.append(entry)
+    sweep = Sweep(experiments, args.objectType)
+    sweep.run(args.jobs, int(args.chunk_mb * (1 << 20)), ParseCache(getCacheDirFor(args.root) if args.useCache else None))
+    metrics = COMPARED_METRICS + [POOLED_RTT_FORMAT.format("p95")] if args.metrics is None else args.metrics
+    tableMetrics = [m for m in metrics if m in METRICS]
+    rows = sweep.getSummaryRows(tableMetrics)
+    parameters = sorted({p for row in rows for p in getParameters(row["scenario"])})
+    print(formatRows(rows, parameters + metrics))
+    print("%d scenarios in %.1fs" % (len(rows), time.perf_counter() - start))
+    if args.output is not None:
+        writeRows(rows, parameters + metrics, args.output)
+        print("Wrote %s" % args.output)
+
+    if args.plot:
+        parameter = getSweptParameter(rows, parameters) if args.parameter is None else args.parameter
+        if parameter is None:
+            print("No numeric parameters in the scenarios' names to plot against")
+        else:
+            figureDir = os.path.join(args.root, FIGURE_DIR, SWEEP_FIGURE_DIR)
+            os.makedirs(figureDir, exist_ok=True)
+            renderQueue = RenderQueue()
+            plotSweep(rows, parameter, metrics, figureDir, renderQueue)
+            renderQueue.flush()
@@ -0,0 +1,264 @@
+import argparse
+import os
+import time
+from typing import List, Dict
+
+import numpy as np
+
+from dead_reckoning_analyzer import FILE_FORMAT as DR_FILE_FORMAT, counterNames as DR_COUNTER_NAMES
+from histogram_store import HISTOGRAM_VALUES_FILE
+from interest_aggregation import fileNameFormat as INTERESTS_COUNTER_FILE_FORMAT
+from interest_rate import fileNameFormat as INTEREST_RATE_FILE_FORMAT, objectTypes as OBJECT_TYPES
+from log_reader import LOG_FILE
+from metric_csv import TIMER, METER, COUNTER, GAUGE
+from nfd_log_parser import NFD_LOG_FILE, CONTENT_STORE_TAG, CACHE_LOOKUP, CACHE_HIT, FORWARDER_TAG, INCOMING_INTEREST, CONTENT_STORE_MISS, \
+    CONTENT_STORE_HIT, OUTGOING_INTEREST, INTEREST_FINALIZE, INCOMING_DATA, OUTGOING_DATA
+
+# Experiment trees in the formats the game and NFD write, at any number of nodes and log sizes, for benchmarking.
+# Values are random but plausible; only the layout and line formats are meant to match real experiments.
+START_TIME = 1554848728
+DURATION = 300
+CSV_INTERVAL = 10
+# The game subscribes to at most this many other players (facemanager.max.num.sub.faces)
+DEFAULT_PEERS = 15
+DEFAULT_HIT_RATE = 0.05
+DEFAULT_HISTOGRAM_SAMPLES = 80
+OBJECT_TYPE_WEIGHTS = [0.8, 0.15, 0.05]
+SYNC_PREFIX = "/com/stefanolupo/ndngame/0/{}/{}/sync"
+RTT_FILE_FORMAT = "sub-{objectType}-rtt-{nodeName}.csv"
+STATUS_DELTA_FILE_FORMAT = "eng-status-delta-{nodeName}.csv"
+UPDATE_PERCENTAGE_FILE_FORMAT = "pub-update-percentage-{nodeName}-{objectType}-sync.csv"
+PACKET_SIZE_FILE_FORMAT = "packet-size-{}.csv"
+PACKET_SIZE_TYPES = ["status", "projectile", "block"]
+
+NFD_HEADER = ("NFD version 0.6.5 starting\n"
+              "%d.390985 INFO: [nfd.CsPolicy] setLimit 10\n"
+              "%d.390934 DEBUG: [nfd.ContentStore] set-policy lru\n")
+# Average bytes one cache lookup and the lines following it add to nfd.log, used to spread the events over the run
+NFD_EVENT_BYTES = 275
+# And what the Forwarder adds to that when it logs at DEBUG too
+FORWARDER_EVENT_BYTES = 820
+# Share of interests joined by a second one from another face while the first is pending, and of those never answered
+DEFAULT_AGGREGATION_RATE = 0.3
+UNSATISFIED_RATE = 0.01
+FIRST_FACE = 300
+UPSTREAM_FACE = 257
+CHUNK_EVENTS = 100000
+JAVA_LINE = "DEBUG [pool-3-thread-%d] (BasePublisher.java:%d) - Published %s update %d\n"
+JAVA_EXCEPTION = ("ERROR [pool-3-thread-%d] (ChronoSynced.java:118) - java.lang.IllegalStateException: Face closed\n"
+                  "\tat com.stefanolupo.ndngame.backend.chronosynced.ChronoSynced.sendInterest(ChronoSynced.java:118)\n"
+                  "\tat java.base/java.lang.Thread.run(Thread.java:834)\n")
+JAVA_EXCEPTION_RATE = 1e-4
+
+
+def getNodeNames(numNodes: int) -> List[str]:
+    return ["node%0*d" % (len(str(numNodes - 1)), i) for i in range(numNodes)]
+
+
+def getPeers(nodes: List[str], index: int, numPeers: int = DEFAULT_PEERS) -> List[str]:
+    # Each node subscribes to the next numPeers nodes, wrapping around
+    return [nodes[(index + i) % len(nodes)] for i in range(1, min(numPeers, len(nodes) - 1) + 1)]
+
+
+def truncateLines(data: str, maxLength: int) -> str:
+    # Whole lines only, so a file never ends mid line
+    if len(data) <= maxLength:
+        return data
+    return data[:data.rfind("\n", 0, max(maxLength, 0)) + 1]
+
+
+def getForwarderLines(t: float, name: str, dataName: str, face: int, hit: bool, aggregated: bool, unsatisfied: bool) -> List[str]:
+    # The pipeline NFD 0.6 logs for an interest from face, and for a second one from the next face when aggregated
+    line = "%.6f DEBUG: " + FORWARDER_TAG + " %s\n"
+    lines = [line % (t, "%s face=%d interest=%s" % (INCOMING_INTEREST, face, name))]
+    if hit:
+        lines.append(line % (t + 2e-5, "%s interest=%s" % (CONTENT_STORE_HIT, name)))
+        lines.append(line % (t + 3e-5, "%s face=%d data=%s" % (OUTGOING_DATA, face, dataName)))
+        lines.append(line % (t + 4e-5, "%s interest=%s satisfied" % (INTEREST_FINALIZE, name)))
+        return lines
+    lines.append(line % (t + 2e-5, "%s interest=%s" % (CONTENT_STORE_MISS, name)))
+    lines.append(line % (t + 3e-5, "%s face=%d interest=%s" % (OUTGOING_INTEREST, UPSTREAM_FACE, name)))
+    downstream = [face]
+    if aggregated:
+        downstream.append(face + 1)
+        lines.append(line % (t + 2e-4, "%s face=%d interest=%s" % (INCOMING_INTEREST, face + 1, name)))
+        lines.append(line % (t + 2.1e-4, "%s interest=%s" % (CONTENT_STORE_MISS, name)))
+    if unsatisfied:
+        lines.append(line % (t + 1e-3, "%s interest=%s unsatisfied" % (INTEREST_FINALIZE, name)))
+        return lines
+    lines.append(line % (t + 8e-4, "%s face=%d data=%s" % (INCOMING_DATA, UPSTREAM_FACE, dataName)))
+    lines += [line % (t + 8.1e-4, "%s face=%d data=%s" % (OUTGOING_DATA, f, dataName)) for f in downstream]
+    lines.append(line % (t + 9e-4, "%s interest=%s satisfied" % (INTEREST_FINALIZE, name)))
+    return lines
+
+
+def writeNfdLog(fileName: str, players: List[str], targetBytes: int, rng: np.random.Generator, hitRate: float = DEFAULT_HIT_RATE,
+                forwarding: bool = False, aggregationRate: float = DEFAULT_AGGREGATION_RATE) -> int:
+    # ContentStore find lines for the players' sync names, each followed by a hit or by a miss and the data's insert,
+    # with the odd line from other NFD modules in between. With forwarding, each also gets its Forwarder pipeline.
+    numEvents = max(targetBytes // (NFD_EVENT_BYTES + (FORWARDER_EVENT_BYTES if forwarding else 0)), 1)
+    step = DURATION / numEvents
+    # A little over the estimate so small logs are written in one chunk
+    chunkEvents = min(CHUNK_EVENTS, numEvents + numEvents // 4 + 64)
+    written = 0
+    sequence = 0
+    with open(fileName, "w") as f:
+        written += f.write(NFD_HEADER % (START_TIME, START_TIME))
+        while written < targetBytes:
+            times = START_TIME + (sequence + np.arange(chunkEvents)) * step + rng.uniform(0, step, chunkEvents)
+            playerIds = rng.integers(0, len(players), chunkEvents)
+            typeIds = rng.choice(len(OBJECT_TYPES), chunkEvents, p=OBJECT_TYPE_WEIGHTS)
+            hits = rng.random(chunkEvents) < hitRate
+            if forwarding:
+                aggregated = (rng.random(chunkEvents) < aggregationRate).tolist()
+                unsatisfied = (rng.random(chunkEvents) < UNSATISFIED_RATE).tolist()
+            lines = []
+            for i, (t, player, objectType, hit) in enumerate(zip(times.tolist(), playerIds.tolist(), typeIds.tolist(), hits.tolist())):
+                name = "%s/%d" % (SYNC_PREFIX.format(players[player], OBJECT_TYPES[objectType]), sequence + i)
+                dataName = "%s/%d/%d" % (name, i % 97, int(t * 1000))
+                if forwarding:
+                    lines += getForwarderLines(t, name, dataName, FIRST_FACE + player, hit, aggregated[i], unsatisfied[i])
+                lines.append("%.6f DEBUG: %s %s %s L\n" % (t, CONTENT_STORE_TAG, CACHE_LOOKUP, name))
+                if hit:
+                    lines.append("%.6f DEBUG: %s   %s %s\n" % (t + 2e-5, CONTENT_STORE_TAG, CACHE_HIT, dataName))
+                else:
+                    lines.append("%.6f DEBUG: %s   no-match\n" % (t + 2e-5, CONTENT_STORE_TAG))
+                    lines.append("%.6f DEBUG: %s insert %s\n" % (t + 8e-4, CONTENT_STORE_TAG, dataName))
+                if i % 64 == 0:
+                    lines.append("%.6f INFO: [nfd.FaceTable] Added face id=%d remote=udp4://10.0.%d.%d:6363 local=udp4://10.0.0.1:6363\n"
+                                 % (t + 1e-3, 300 + i % 200, player // 250, player % 250))
+            data = truncateLines("".join(lines), targetBytes - written)
+            if len(data) == 0:
+                break
+            written += f.write(data)
+            sequence += chunkEvents
+    return written
+
+
+def writeJavaLog(fileName: str, targetBytes: int, rng: np.random.Generator) -> int:
+    written = 0
+    update = 0
+    with open(fileName, "w") as f:
+        while written < targetBytes:
+            exceptions = rng.random(min(CHUNK_EVENTS, targetBytes // 40 + 64)) < JAVA_EXCEPTION_RATE
+            lines = []
+            for i, exception in enumerate(exceptions.tolist()):
+                lines.append(JAVA_EXCEPTION % (i % 10) if exception else JAVA_LINE % (i % 10, 60 + i % 40, OBJECT_TYPES[i % 3], update + i))
+            data = truncateLines("".join(lines), targetBytes - written)
+            if len(data) == 0:
+                break
+            written += f.write(data)
+            update += len(exceptions)
+    return written
+
+
+def getTimes() -> np.ndarray:
+    return np.arange(START_TIME + CSV_INTERVAL, START_TIME + DURATION + 1, CSV_INTERVAL)
+
+
+def writeCsv(fileName: str, header: str, rows: List[str]):
+    with open(fileName, "w") as f:
+        f.write(header + "\n" + "".join(rows))
+
+
+def writeTimerCsv(fileName: str, samples: np.ndarray, rng: np.random.Generator):
+    times = getTimes()
+    counts = np.sort(rng.integers(0, max(len(samples), 1) * 4, len(times)))
+    percentiles = np.percentile(samples, [50, 75, 95, 98, 99, 99.9]) if len(samples) > 0 else np.zeros(6)
+    rows = ["%d,%d,%d,%f,%d,%f,%s\n" % (t, count, samples.max(initial=0), samples.mean() if len(samples) else 0, samples.min(initial=0),
+                                        samples.std() if len(samples) else 0, ",".join("%f" % p for p in percentiles))
+            for t, count in zip(times, counts)]
+    writeCsv(fileName, TIMER.header, rows)
+
+
+def writeMeterCsv(fileName: str, rate: float, rng: np.random.Generator):
+    times = getTimes()
+    rates = np.maximum(rate + rng.normal(0, rate / 10, len(times)), 0)
+    counts = np.cumsum(rates * CSV_INTERVAL).astype(np.int64)
+    rows = ["%d,%d,%f,%f,%f,%f,events/second\n" % (t, count, np.mean(rates[:i + 1]), r, r, r)
+            for i, (t, count, r) in enumerate(zip(times, counts, rates))]
+    writeCsv(fileName, METER.header, rows)
+
+
+def writeCounterCsv(fileName: str, finalCount: int):
+    times = getTimes()
+    counts = np.linspace(0, finalCount, len(times)).astype(np.int64)
+    writeCsv(fileName, COUNTER.header, ["%d,%d\n" % (t, count) for t, count in zip(times, counts)])
+
+
+def writeGaugeCsv(fileName: str, value: float, rng: np.random.Generator):
+    rows = ["%d,%s\n" % (t, repr(float(v))) for t, v in zip(getTimes(), rng.uniform(0, 2 * value, len(getTimes())))]
+    writeCsv(fileName, GAUGE.header, rows)
+
+
+def writeHistogramValues(fileName: str, histograms: Dict[str, np.ndarray]):
+    # Laid out like the game's Jackson pretty printer
+    pairs = ['  "%s" : [ %s ]' % (name, ", ".join(map(str, values.tolist()))) for name, values in histograms.items()]
+    with open(fileName, "w") as f:
+        f.write("{\n" + ",\n".join(pairs) + "\n}")
+
+
+def generateNode(nodeDir: str, node: str, peers: List[str], nfdLogBytes: int, javaLogBytes: int, rng: np.random.Generator,
+                 histogramSamples: int = DEFAULT_HISTOGRAM_SAMPLES, hitRate: float = DEFAULT_HIT_RATE, forwarding: bool = False):
+    os.makedirs(nodeDir, exist_ok=True)
+    writeNfdLog(os.path.join(nodeDir, NFD_LOG_FILE), peers + [node], nfdLogBytes, rng, hitRate, forwarding)
+    writeJavaLog(os.path.join(nodeDir, LOG_FILE), javaLogBytes, rng)
+
+    histograms = {}
+    for peer in peers:
+        for objectType in OBJECT_TYPES:
+            rtts = rng.lognormal(3.5, 0.6, histogramSamples).astype(np.int64)
+            histograms[RTT_FILE_FORMAT.format(objectType=objectType, nodeName=peer)[:-len(".csv")]] = rtts
+            writeTimerCsv(os.path.join(nodeDir, RTT_FILE_FORMAT.format(objectType=objectType, nodeName=peer)), rtts, rng)
+            writeCounterCsv(os.path.join(nodeDir, INTERESTS_COUNTER_FILE_FORMAT.format(objectType=objectType, nodeName=peer)),
+                            int(rng.integers(100, 2000)))
+        # Position deltas are written in hundredths of a game world unit
+        deltas = rng.gamma(2.0, 40.0, histogramSamples).astype(np.int64)
+        histograms[STATUS_DELTA_FILE_FORMAT.format(nodeName=peer)[:-len(".csv")]] = deltas
+        writeTimerCsv(os.path.join(nodeDir, STATUS_DELTA_FILE_FORMAT.format(nodeName=peer)), deltas, rng)
+    for packetType in PACKET_SIZE_TYPES:
+        sizes = rng.integers(40, 60, histogramSamples * 10)
+        histograms[PACKET_SIZE_FILE_FORMAT.format(packetType)[:-len(".csv")]] = sizes
+        writeTimerCsv(os.path.join(nodeDir, PACKET_SIZE_FILE_FORMAT.format(packetType)), sizes, rng)
+    writeHistogramValues(os.path.join(nodeDir, HISTOGRAM_VALUES_FILE), histograms)
+
+    for objectType in OBJECT_TYPES:
+        writeMeterCsv(os.path.join(nodeDir, INTEREST_RATE_FILE_FORMAT.format(nodeName=node, objectType=objectType)),
+                      float(rng.uniform(2, 15)), rng)
+    for objectType in ["status", "blocks"]:
+        writeGaugeCsv(os.path.join(nodeDir, UPDATE_PERCENTAGE_FILE_FORMAT.format(nodeName=node, objectType=objectType)), 0.05, rng)
+    for counterName in DR_COUNTER_NAMES:
+        writeCounterCsv(os.path.join(nodeDir, DR_FILE_FORMAT.format(counterName)), int(rng.integers(10, 600)))
+
+
+def generateExperiment(experimentDir: str, numNodes: int, nfdLogBytes: int, javaLogBytes: int = None, numPeers: int = DEFAULT_PEERS,
+                       seed: int = 0, histogramSamples: int = DEFAULT_HISTOGRAM_SAMPLES, hitRate: float = DEFAULT_HIT_RATE,
+                       forwarding: bool = False) -> List[str]:
+    # Returns the node names. Each node gets its own generator so trees are the same whatever order nodes are written in.
+    javaLogBytes = nfdLogBytes // 10 if javaLogBytes is None else javaLogBytes
+    nodes = getNodeNames(numNodes)
+    for i, node in enumerate(nodes):
+        generateNode(os.path.join(experimentDir, node), node, getPeers(nodes, i, numPeers), nfdLogBytes, javaLogBytes,
+                     np.random.default_rng([seed, i]), histogramSamples, hitRate, forwarding)
+    return nodes
+
+
+def getTreeBytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(directory) for f in files)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic experiment: <experimentDir>/<node>/{nfd.log, java.log, *.csv, ...}")
+    parser.add_argument("experimentDir")
+    parser.add_argument("--nodes", type=int, default=16)
+    parser.add_argument("--nfd-mb", type=float, default=4.0, help="Size of each node's nfd.log")
+    parser.add_argument("--java-mb", type=float, help="Size of each node's java.log (default: a tenth of --nfd-mb)")
+    parser.add_argument("--peers", type=int, default=DEFAULT_PEERS, help="Players each node subscribes to")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--forwarding", action="store_true", help="Log every interest's Forwarder pipeline too, as NFD does at DEBUG")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generateExperiment(args.experimentDir, args.nodes, int(args.nfd_mb * 1e6), None if args.java_mb is None else int(args.java_mb * 1e6),
+                       args.peers, args.seed, forwarding=args.forwarding)
+    print("Wrote %d nodes, %.1f MB in %.1fs" % (args.nodes, getTreeBytes(args.experimentDir) / 1e6, time.perf_counter() - start))
@@ -0,0 +1,217 @@
+import argparse
+import importlib.util
+import os
+import re
+import time
+from typing import Dict, List, Tuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from catalogue import loadCatalogue, ExperimentEntry
+from dead_reckoning_analyzer import FILE_FORMAT as DR_FILE_FORMAT
+from nfd_log_parser import CacheEvents, LOOKUP_EVENT, HIT_EVENT
+from metric_csv import parseSeriesName
+from node_loader import defaultJobs
+from snapshot import ExperimentSnapshot, exportNodes, openFreshSnapshot, SNAPSHOT_EXTENSION
+
+# Every experiment of a data tree as four long format tables, one row per observation:
+#   metrics       every row of every Dropwizard CSV, one row per (file, t, field)
+#   histograms    every sample of histogram_values.json
+#   cacheEvents   every ContentStore lookup and hit of nfd.log
+#   deadReckoning the final count of each dr-counter-*.csv
+# Scenario, node, player, object type and the like are categoricals, so group-bys on them are vectorized.
+METRICS = "metrics"
+HISTOGRAMS = "histograms"
+CACHE_EVENTS = "cacheEvents"
+DEAD_RECKONING = "deadReckoning"
+TABLES = [METRICS, HISTOGRAMS, CACHE_EVENTS, DEAD_RECKONING]
+
+# Feather and Parquet need pyarrow; pickle keeps the categoricals too and needs nothing beyond pandas
+FORMATS = {"parquet": ".parquet", "feather": ".feather", "pickle": ".pkl"}
+ARROW_FORMATS = ["parquet", "feather"]
+HAVE_ARROW = importlib.util.find_spec("pyarrow") is not None
+DEFAULT_FORMAT = "parquet" if HAVE_ARROW else "pickle"
+
+KIND_NAMES = {LOOKUP_EVENT: "lookup", HIT_EVENT: "hit"}
+
+DR_COUNTER_PATTERN = re.compile("^" + re.escape(DR_FILE_FORMAT).replace(r"\{\}", r"(?P<counter>\w+)") + "$")
+
+
+class TableBuilder:
+    # Columns are gathered as array chunks and categoricals as codes into categories shared by the whole tree,
+    # so one DataFrame is built at the end without ever holding a Python object per row
+
+    def __init__(self, categoricals: List[str], columns: Dict[str, type]):
+        self.chunks: Dict[str, List[np.ndarray]] = {name: [] for name in categoricals + list(columns)}
+        self.categories: Dict[str, Dict[str, int]] = {name: {} for name in categoricals}
+        self.dtypes = dict(columns, **{name: np.int32 for name in categoricals})
+
+    def getCode(self, column: str, label: Optional[str]) -> int:
+        if label is None:
+            return -1
+        return self.categories[column].setdefault(label, len(self.categories[column]))
+
+    def getCodes(self, column: str, labels: List[str]) -> np.ndarray:
+        return np.array([self.getCode(column, label) for label in labels], dtype=np.int32)
+
+    def append(self, length: int, **columns):
+        # Categorical columns take a label for every row or an array of codes from getCodes; others a value or an array
+        for name, value in columns.items():
+            if not isinstance(value, np.ndarray):
+                value = np.full(length, self.getCode(name, value), dtype=np.int32) if name in self.categories else np.full(length, value)
+            self.chunks.setdefault(name, []).append(value)
+
+    def toDataFrame(self) -> pd.DataFrame:
+        data = {}
+        for name, chunks in self.chunks.items():
+            values = np.concatenate(chunks).astype(self.dtypes[name], copy=False) if chunks else np.zeros(0, dtype=self.dtypes[name])
+            if name in self.categories:
+                values = pd.Categorical.from_codes(values, categories=list(self.categories[name]))
+            data[name] = values
+        return pd.DataFrame(data)
+
+
+class TidyExport:
+
+    def __init__(self):
+        self.metrics = TableBuilder(["scenario", "node", "metric", "family", "objectType", "peer", "field"], {"t": np.int64, "value": np.float64})
+        self.histograms = TableBuilder(["scenario", "node", "series", "family", "objectType", "peer"], {"value": np.int64})
+        self.cacheEvents = TableBuilder(["scenario", "node", "kind", "player", "objectType"], {"t": np.float64})
+        self.deadReckoning = TableBuilder(["scenario", "node", "counter"], {"count": np.int64})
+
+    def addMetrics(self, scenario: str, node: str, metrics: Dict[str, Tuple[str, np.ndarray]]):
+        for fileName, (schemaName, table) in sorted(metrics.items()):
+            name = fileName[:-len(".csv")]
+            family, objectType, peer = parseSeriesName(name)
+            if len(table) == 0:
+                continue
+            fields = [f for f in table.dtype.names if f != "t"]
+            length = len(table) * len(fields)
+            # Row major: every field of a CSV row, then the next row
+            values = np.column_stack([table[f].astype(np.float64) for f in fields]).ravel()
+            self.metrics.append(length, scenario=scenario, node=node, metric=name, family=family, objectType=objectType, peer=peer,
+                                t=np.repeat(table["t"].astype(np.int64), len(fields)),
+                                field=np.tile(self.metrics.getCodes("field", fields), len(table)), value=values)
+
+            counter = DR_COUNTER_PATTERN.match(fileName)
+            if counter is not None:
+                self.deadReckoning.append(1, scenario=scenario, node=node, counter=counter.group("counter"),
+                                          count=np.array([table["count"][-1]], dtype=np.int64))
+
+    def addHistograms(self, scenario: str, node: str, histograms: Dict[str, np.ndarray]):
+        for series, samples in sorted(histograms.items()):
+            family, objectType, peer = parseSeriesName(series)
+            self.histograms.append(len(samples), scenario=scenario, node=node, series=series, family=family, objectType=objectType,
+                                   peer=peer, value=np.asarray(samples, dtype=np.int64))
+
+    def addCacheEvents(self, scenario: str, node: str, events: CacheEvents):
+        if len(events) == 0:
+            return
+        self.cacheEvents.append(len(events), scenario=scenario, node=node, t=np.asarray(events.timestamps, dtype=np.float64),
+                                kind=self.cacheEvents.getCodes("kind", [KIND_NAMES[k] for k in range(len(KIND_NAMES))])[events.kinds],
+                                player=self.cacheEvents.getCodes("player", events.players)[events.playerIds],
+                                objectType=self.cacheEvents.getCodes("objectType", events.objectTypes)[events.objectTypeIds])
+
+    def addNode(self, scenario: str, node: str, events: Optional[CacheEvents], histograms: Optional[Dict[str, np.ndarray]],
+                metrics: Dict[str, Tuple[str, np.ndarray]]):
+        if events is not None:
+            self.addCacheEvents(scenario, node, events)
+        if histograms is not None:
+            self.addHistograms(scenario, node, histograms)
+        self.addMetrics(scenario, node, metrics)
+
+    def addExperimentDir(self, entry: ExperimentEntry, jobs: int = 1):
+        tasks = [(node, os.path.join(entry.path, node)) for node in entry.getNodes()]
+        for export in exportNodes(tasks, jobs):
+            self.addNode(entry.scenario, export.node, export.events, export.histograms, export.metrics)
+
+    def addSnapshot(self, scenario: str, snapshot: ExperimentSnapshot):
+        for node in snapshot.nodes:
+            self.addNode(scenario, node, snapshot.getCacheEvents(node), snapshot.getHistograms(node), snapshot.getMetrics(node))
+
+    def getTables(self) -> Dict[str, pd.DataFrame]:
+        tables = {METRICS: self.metrics.toDataFrame(), HISTOGRAMS: self.histograms.toDataFrame(),
+                  CACHE_EVENTS: self.cacheEvents.toDataFrame(), DEAD_RECKONING: self.deadReckoning.toDataFrame()}
+        deadReckoning = tables[DEAD_RECKONING]
+        totals = deadReckoning.groupby(["scenario", "node"], observed=True)["count"].transform("sum")
+        deadReckoning["percentage"] = 100 * deadReckoning["count"] / totals.where(totals > 0)
+        return tables
+
+
+def exportTree(dataDir: str, useSnapshots: bool = False, jobs: int = 1, rescan: bool = False) -> Dict[str, pd.DataFrame]:
+    # The experiments are those of the data root's catalogue; one is read from its snapshot when asked to, or when the
+    # snapshot is all there is of it
+    export = TidyExport()
+    for entry in loadCatalogue(dataDir, rescan).find():
+        print("Exporting %s" % entry.scenario)
+        onlySnapshot = all(len(n.files) == 0 for n in entry.nodes.values())
+        snapshot = openFreshSnapshot(entry.snapshot, entry.path) if entry.snapshot is not None and (useSnapshots or onlySnapshot) else None
+        if snapshot is not None:
+            export.addSnapshot(entry.scenario, snapshot)
+        else:
+            export.addExperimentDir(entry, jobs)
+    return export.getTables()
+
+
+def writeTables(tables: Dict[str, pd.DataFrame], outputDir: str, fileFormat: str = DEFAULT_FORMAT) -> List[str]:
+    if fileFormat in ARROW_FORMATS and not HAVE_ARROW:
+        raise ImportError("Writing %s needs pyarrow (pip install pyarrow), or use --format pickle" % fileFormat)
+    os.makedirs(outputDir, exist_ok=True)
+    fileNames = []
+    for name, table in tables.items():
+        fileName = os.path.join(outputDir, name + FORMATS[fileFormat])
+        if fileFormat == "parquet":
+            table.to_parquet(fileName, index=False)
+        elif fileFormat == "feather":
+            table.to_feather(fileName)
+        else:
+            table.to_pickle(fileName)
+        fileNames.append(fileName)
+    return fileNames
+
+
+def readTables(outputDir: str, names: List[str] = TABLES) -> Dict[str, pd.DataFrame]:
+    # Whichever format each table was written in
+    tables = {}
+    for name in names:
+        for fileFormat, extension in FORMATS.items():
+            fileName = os.path.join(outputDir, name + extension)
+            if not os.path.exists(fileName):
+                continue
+            if fileFormat == "parquet":
+                tables[name] = pd.read_parquet(fileName)
+            elif fileFormat == "feather":
+                tables[name] = pd.read_feather(fileName)
+            else:
+                tables[name] = pd.read_pickle(fileName)
+            break
+        else:
+            print("Could not find table %s in %s" % (name, outputDir))
+    return tables
+
+
+def getTablesDir(dataDir: str) -> str:
+    return os.path.normpath(dataDir) + "-tables"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export every experiment under dataDir as long format tables")
+    parser.add_argument("dataDir")
+    parser.add_argument("--output", "-o", help="Defaults to <dataDir>-tables")
+    parser.add_argument("--format", choices=list(FORMATS), default=DEFAULT_FORMAT,
+                        help="parquet and feather need pyarrow (default: %s)" % DEFAULT_FORMAT)
+    parser.add_argument("--jobs", "-j", type=int, default=defaultJobs())
+    parser.add_argument("--snapshots", action="store_true", help="Read experiments from their %s files where present" % SNAPSHOT_EXTENSION)
+    parser.add_argument("--rescan", action="store_true", help="Rebuild the catalogue of dataDir first")
+    args = parser.parse_args()
+    if args.format in ARROW_FORMATS and not HAVE_ARROW:
+        parser.error("--format %s needs pyarrow (pip install pyarrow)" % args.format)
+
+    start = time.perf_counter()
+    exported = exportTree(args.dataDir, args.snapshots, args.jobs, args.rescan)
+    for fileName in writeTables(exported, getTablesDir(args.dataDir) if args.output is None else args.output, args.format):
+        print("Wrote %s: %.1f MB" % (fileName, os.path.getsize(fileName) / 1e6))
+    for name, table in exported.items():
+        print("  %-14s %10d rows %8.1f MB in memory" % (name, len(table), table.memory_usage(deep=True).sum() / 1e6))
+    print("Exported in %.1fs" % (time.perf_counter() - start))